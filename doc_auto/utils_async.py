@@ -0,0 +1,194 @@
+import asyncio
+import contextlib
+import os
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterable, Optional
+
+from doc_auto.utils_batch import BatchResult
+from doc_auto.utils_batch import resolve_max_workers
+from doc_auto.utils_log import setup_logger
+from doc_auto.utils_pipeline import DEFAULT_STAGES
+from doc_auto.utils_pipeline import process_document
+
+logger = setup_logger(__name__)
+
+DEFAULT_IO_WORKERS = 4  # Concurrent reads and writes, enough to hide the open latency of a network share
+
+_DONE = object()  # End of a queue
+
+
+def read_file_bytes(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def write_file_bytes(path: str, data: bytes):
+    """
+    Write the file atomically: a reader never sees a partially written PDF.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # Unique per writer thread
+    try:
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        # The temporary file may not exist, the write error is the one to report
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+def _process_document_bytes(stages: tuple, pdf_bytes: bytes, job: dict):
+    """
+    Worker side of the CPU stage: run the pipeline on the prefetched bytes without writing anything.
+
+    Returns:
+        tuple: (DocumentResult or None, formatted traceback or None)
+    """
+    try:
+        return process_document(stages=stages, pdf_bytes=pdf_bytes, write_outputs=False, **job), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+class AsyncPipeline:
+    """
+    Process documents with disk I/O overlapping the CPU stages.
+
+    Reader tasks prefetch the input PDFs into memory, CPU tasks run the pipeline on the bytes in
+    the worker processes, writer tasks write the outputs behind them. The stages are connected
+    by bounded queues, so at most `prefetch` inputs and `max_pending_writes` outputs are held in
+    memory besides the documents in the workers.
+
+    Args:
+        stages (iterable of callables): pipeline stages taking the context, run in order.
+        max_workers (int, optional): Number of worker processes. None uses all CPUs.
+        io_workers (int): Number of concurrent reads and of concurrent writes.
+        prefetch (int, optional): Maximum number of inputs read ahead. Defaults to twice the workers.
+        max_pending_writes (int, optional): Maximum number of results waiting for their outputs to be
+                                            written. Defaults to twice the workers.
+    """
+
+    def __init__(self, stages: Iterable = DEFAULT_STAGES, max_workers: Optional[int] = None,
+                 io_workers: int = DEFAULT_IO_WORKERS, prefetch: Optional[int] = None,
+                 max_pending_writes: Optional[int] = None):
+        self.stages = tuple(stages)
+        self.max_workers = resolve_max_workers(max_workers)
+        self.io_workers = max(1, io_workers)
+        self.prefetch = prefetch or 2 * self.max_workers
+        self.max_pending_writes = max_pending_writes or 2 * self.max_workers
+
+    async def run(self, jobs: Iterable, on_result: Callable[[BatchResult], None]):
+        """
+        Args:
+            jobs (iterable of dict): keyword arguments of DocumentContext, one per document.
+            on_result (callable): called with each BatchResult, in input order, once its outputs
+                                  are written. A failed read, pipeline or write gives a failed result.
+
+        Returns:
+            int: Number of processed documents.
+        """
+        logger.info(f"Async pipeline: {self.max_workers} workers, {self.io_workers} readers and writers, "
+                    f"prefetch {self.prefetch}, pending writes {self.max_pending_writes}")
+        loop = asyncio.get_running_loop()
+        read_queue = asyncio.Queue(maxsize=self.prefetch)
+        write_queue = asyncio.Queue(maxsize=self.max_pending_writes)
+        job_iter = iter(enumerate(jobs))
+        pending_results = {}
+        next_index = 0
+
+        def deliver(batch_result: BatchResult):
+            # Results complete out of order, hand them over in input order
+            nonlocal next_index
+            pending_results[batch_result.index] = batch_result
+            while next_index in pending_results:
+                on_result(pending_results.pop(next_index))
+                next_index += 1
+
+        async def reader(io_executor):
+            for index, job in job_iter:  # Shared iterator, every job is read by one reader
+                try:
+                    pdf_bytes = await loop.run_in_executor(io_executor, read_file_bytes, job["pdf_path"])
+                except Exception:
+                    await write_queue.put(BatchResult(index=index, job=job, result=None,
+                                                      error=traceback.format_exc()))
+                    continue
+                await read_queue.put((index, job, pdf_bytes))
+
+        async def processor(cpu_executor):
+            while True:
+                item = await read_queue.get()
+                if item is _DONE:
+                    return
+                index, job, pdf_bytes = item
+                try:
+                    result, error = await loop.run_in_executor(
+                        cpu_executor, _process_document_bytes, self.stages, pdf_bytes, job
+                    )
+                except BrokenProcessPool:
+                    # A worker died (e.g. killed for memory), the remaining documents fail the same way
+                    result, error = None, traceback.format_exc()
+                del pdf_bytes
+                await write_queue.put(BatchResult(index=index, job=job, result=result, error=error))
+
+        async def writer(io_executor):
+            while True:
+                batch_result = await write_queue.get()
+                if batch_result is _DONE:
+                    return
+                if batch_result.ok and batch_result.result.outputs:
+                    try:
+                        for output_path, data in batch_result.result.outputs.items():
+                            await loop.run_in_executor(io_executor, write_file_bytes, output_path, data)
+                        batch_result = batch_result._replace(result=batch_result.result._replace(outputs={}))
+                    except Exception:
+                        batch_result = batch_result._replace(result=None, error=traceback.format_exc())
+                deliver(batch_result)
+
+        with ThreadPoolExecutor(max_workers=self.io_workers) as read_executor, \
+                ThreadPoolExecutor(max_workers=self.io_workers) as write_executor, \
+                ProcessPoolExecutor(max_workers=self.max_workers) as cpu_executor:
+            readers = [asyncio.create_task(reader(read_executor)) for _ in range(self.io_workers)]
+            processors = [asyncio.create_task(processor(cpu_executor)) for _ in range(self.max_workers)]
+            writers = [asyncio.create_task(writer(write_executor)) for _ in range(self.io_workers)]
+            try:
+                await asyncio.gather(*readers)
+                for _ in processors:
+                    await read_queue.put(_DONE)
+                await asyncio.gather(*processors)
+                for _ in writers:
+                    await write_queue.put(_DONE)
+                await asyncio.gather(*writers)
+            except BaseException:
+                for task in readers + processors + writers:
+                    task.cancel()
+                raise
+
+        return next_index
+
+
+def run_pipeline_async(jobs: Iterable, on_result: Callable[[BatchResult], None], stages: Iterable = DEFAULT_STAGES,
+                       max_workers: Optional[int] = None, io_workers: int = DEFAULT_IO_WORKERS,
+                       prefetch: Optional[int] = None, max_pending_writes: Optional[int] = None) -> int:
+    """
+    Process documents with `AsyncPipeline` from synchronous code.
+
+    Args:
+        jobs (iterable of dict): keyword arguments of DocumentContext, one per document.
+        on_result (callable): called with each BatchResult, in input order, once its outputs are written.
+        stages (iterable of callables): pipeline stages taking the context, run in order.
+        max_workers (int, optional): Number of worker processes. None uses all CPUs.
+        io_workers (int): Number of concurrent reads and of concurrent writes.
+        prefetch (int, optional): Maximum number of inputs read ahead.
+        max_pending_writes (int, optional): Maximum number of results waiting for their outputs to be written.
+
+    Returns:
+        int: Number of processed documents.
+    """
+    pipeline = AsyncPipeline(stages=stages, max_workers=max_workers, io_workers=io_workers, prefetch=prefetch,
+                             max_pending_writes=max_pending_writes)
+    return asyncio.run(pipeline.run(jobs=jobs, on_result=on_result))
@@ -0,0 +1,136 @@
+import os
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterable, NamedTuple, Optional
+
+from doc_auto.utils_log import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class BatchResult(NamedTuple):
+    """
+    Outcome of one batch job.
+
+    Attributes:
+        index (int): Position of the job in the input list.
+        job (dict): Keyword arguments the job was called with.
+        result: Return value of the job, None if it failed.
+        error (str, optional): Formatted traceback if the job failed, otherwise None.
+    """
+    index: int
+    job: dict
+    result: object
+    error: Optional[str]
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _run_job(func: Callable, index: int, job: dict) -> BatchResult:
+    """
+    Run a single job and turn any exception into a failed BatchResult,
+    so one bad document never takes the whole batch down.
+    """
+    try:
+        return BatchResult(index=index, job=job, result=func(**job), error=None)
+    except Exception:
+        return BatchResult(index=index, job=job, result=None, error=traceback.format_exc())
+
+
+def resolve_max_workers(max_workers: Optional[int] = None) -> int:
+    """
+    Args:
+        max_workers (int, optional): Requested number of worker processes. None or 0 uses all CPUs.
+
+    Returns:
+        int: Number of worker processes to use.
+    """
+    if not max_workers:
+        return os.cpu_count() or 1
+    return max(1, max_workers)
+
+
+def iter_batch(func: Callable, jobs: Iterable, max_workers: Optional[int] = None,
+               max_in_flight: Optional[int] = None):
+    """
+    Run `func(**job)` for every job across a process pool and yield the results in input order.
+
+    At most `max_in_flight` jobs are submitted and not yet yielded at any time, so memory stays
+    bounded however many jobs there are, and `jobs` may be a lazy iterable.
+
+    Args:
+        func (Callable): Module level function to run, it must be picklable.
+        jobs (iterable of dict): Keyword arguments of each job.
+        max_workers (int, optional): Number of worker processes. None uses all CPUs,
+                                     1 runs every job in the current process.
+        max_in_flight (int, optional): Maximum number of pending jobs. None submits all jobs at once.
+
+    Yields:
+        BatchResult: one per job, in the same order as `jobs`.
+    """
+    max_workers = resolve_max_workers(max_workers)
+    num_jobs = len(jobs) if hasattr(jobs, "__len__") else None
+
+    if max_workers == 1:
+        for index, job in enumerate(jobs):
+            batch_result = _run_job(func, index, job)
+            _log_progress(batch_result, num_jobs)
+            yield batch_result
+        return
+
+    job_iter = enumerate(jobs)
+    pending = deque()  # (index, job, future) in submission order
+
+    def submit_next() -> bool:
+        for index, job in job_iter:
+            pending.append((index, job, executor.submit(_run_job, func, index, job)))
+            return True
+        return False
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            while (max_in_flight is None or len(pending) < max(1, max_in_flight)) and submit_next():
+                pass
+
+            while pending:
+                index, job, future = pending.popleft()
+                try:
+                    batch_result = future.result()
+                except BrokenProcessPool:
+                    # A worker died hard (e.g. a crash inside a native library), the job never returned
+                    batch_result = BatchResult(index=index, job=job, result=None, error=traceback.format_exc())
+                submit_next()
+                _log_progress(batch_result, num_jobs)
+                yield batch_result
+        finally:
+            # The consumer stopped early, do not start jobs nobody will read
+            for _, _, future in pending:
+                future.cancel()
+
+
+def run_batch(func: Callable, jobs: list, max_workers: Optional[int] = None) -> list:
+    """
+    Run `func(**job)` for every job across a process pool.
+
+    Args:
+        func (Callable): Module level function to run, it must be picklable.
+        jobs (list of dict): Keyword arguments of each job.
+        max_workers (int, optional): Number of worker processes. None uses all CPUs,
+                                     1 runs every job in the current process.
+
+    Returns:
+        list: BatchResult of each job, in the same order as `jobs`.
+    """
+    return list(iter_batch(func=func, jobs=jobs, max_workers=max_workers))
+
+
+def _log_progress(batch_result: BatchResult, num_jobs: Optional[int]):
+    progress = f"{batch_result.index + 1}/{num_jobs}" if num_jobs is not None else f"{batch_result.index + 1}"
+    if batch_result.ok:
+        logger.info(f"Job {progress} done")
+    else:
+        logger.error(f"Job {progress} failed: {batch_result.job}\n{batch_result.error}")
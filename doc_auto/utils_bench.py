@@ -0,0 +1,346 @@
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import time
+import tracemalloc
+from typing import Callable, Optional
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw
+
+from doc_auto.utils_log import setup_logger
+from doc_auto.utils_op import compress_pdf
+from doc_auto.utils_op import insert_signatures
+from doc_auto.utils_page import extract_info_with_crop_search
+from doc_auto.utils_page import identify_blank_pages
+
+logger = setup_logger(__name__)
+
+PAGE_WIDTH, PAGE_HEIGHT = fitz.paper_size("a4")
+POLICY_CSS = "* {font-family: sans-serif; font-size: 11px;} p {margin: 0;} .gap {margin-top: 12px;}"
+
+COMPANY_NAMES = ["AMUATU", "TOYAR", "FRANO", "LSY", "COMMERCIA", "PEONY", "NIO"]
+STREET_NAMES = ["ALEJA JEROZOLIMSKIE", "UL. MARSZAŁKOWSKA", "UL. PIOTRKOWSKA", "ALEJA KRAKOWSKA"]
+INSURER_NAMES = ["TOWARZYSTWO UBEZPIECZEŃ WZAJEMNYCH SA", "POWSZECHNY ZAKŁAD UBEZPIECZEŃ SA"]
+
+
+def make_policy_fields(seed: int) -> dict:
+    """
+    Random but reproducible content of one synthetic policy.
+
+    Args:
+        seed (int): random seed, e.g. the document index.
+
+    Returns:
+        dict: field name -> value, as printed on the 1st page.
+    """
+    rng = random.Random(seed)
+    bank_account = "".join(str(rng.randint(0, 9)) for _ in range(26))
+    return {
+        "company": rng.choice(COMPANY_NAMES),
+        "policy_number": str(rng.randint(10 ** 11, 10 ** 12 - 1)),
+        "company_address": f"{rng.choice(STREET_NAMES)} {rng.randint(1, 200)}, 00-{rng.randint(100, 999)} WARSZAWA",
+        "plate": f"W{rng.choice('ABCDEFX')}{rng.randint(10000, 99999)}",
+        "recipient": rng.choice(INSURER_NAMES),
+        "recipient_address": f"ul. Postępu {rng.randint(1, 30)}, 02-{rng.randint(100, 999)} Warszawa",
+        "bank_account": " ".join([bank_account[:2]] + [bank_account[i:i + 4] for i in range(2, 26, 4)]),
+        "amount": f"{rng.randint(1, 9)} {rng.randint(100, 999)}",
+    }
+
+
+def _first_page_html(fields: dict) -> str:
+    # Same order and labels as the regexes of utils_ocr expect, inside the OCR crop of utils_page
+    return (
+        "<p>Ubezpieczający</p>"
+        f"<p>{fields['company']} SPÓŁKA Z OGRANICZONĄ ODPOWIEDZIALNOŚCIĄ</p>"
+        f"<p>numer polisy: {fields['policy_number']}</p>"
+        f"<p class='gap'>adres: {fields['company_address']}</p>"
+        f"<p class='gap'>nr rejestracyjny: {fields['plate']}</p>"
+        "<p class='gap'>Płatności</p>"
+        f"<p class='gap'>odbiorca: {fields['recipient']}</p>"
+        f"<p>{fields['recipient_address']}</p>"
+        f"<p>nr rachunku: {fields['bank_account']}</p>"
+        f"<p>tytuł: składka za polisę {fields['policy_number']}</p>"
+        f"<p>kwota: {fields['amount']} zł</p>"
+        "<p>termin płatności: 2024-12-31</p>"
+    )
+
+
+def make_synthetic_policy_pdf(output_path: str, seed: int, num_pages: int = 5, blank_page: Optional[int] = 3,
+                              scanned: bool = True, scan_dpi: int = 150) -> dict:
+    """
+    Write a synthetic policy PDF laid out like the insurer documents.
+
+    The 1st page carries the fields in the OCR crop of `RenderedPage.crop_for_ocr`, read by
+    `extract_info_with_crop_search`, `blank_page` is left empty, the other pages hold filler text.
+    With `scanned` every page is rasterized to a JPEG image like a scanner output, otherwise the
+    PDF keeps its text layer.
+
+    Args:
+        output_path (str): Path to the output PDF.
+        seed (int): random seed of the policy fields.
+        num_pages (int): Number of pages. Defaults to 5.
+        blank_page (int, optional): 1-based blank page number. Defaults to 3.
+        scanned (bool): Rasterize the pages. Defaults to True.
+        scan_dpi (int): Resolution of the rasterized pages. Defaults to 150.
+
+    Returns:
+        dict: the policy fields written on the 1st page.
+    """
+    fields = make_policy_fields(seed)
+    doc = fitz.open()
+    for page_number in range(1, num_pages + 1):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        if page_number == blank_page:
+            continue
+        if page_number == 1:
+            page.insert_htmlbox(fitz.Rect(40, 60, 555, 280),
+                                f"<h2>POLISA UBEZPIECZENIOWA</h2><p>Polisa nr {fields['policy_number']}</p>",
+                                css=POLICY_CSS)
+            page.insert_htmlbox(fitz.Rect(40, 300, 555, 590), _first_page_html(fields), css=POLICY_CSS)
+        else:
+            filler = "Ogólne warunki ubezpieczenia stanowią integralną część umowy. " * 40
+            page.insert_htmlbox(fitz.Rect(40, 60, 555, 600), f"<p>{filler}</p>", css=POLICY_CSS)
+
+    if scanned:
+        scanned_doc = fitz.open()
+        for page in doc:
+            pix = page.get_pixmap(dpi=scan_dpi, colorspace=fitz.csGRAY)
+            scanned_page = scanned_doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+            scanned_page.insert_image(scanned_page.rect, stream=pix.tobytes("jpeg", jpg_quality=85))
+        doc.close()
+        doc = scanned_doc
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    doc.save(output_path, garbage=3, deflate=True)
+    doc.close()
+    return fields
+
+
+def make_synthetic_stamp(output_path: str, label: str, size: int = 400):
+    """
+    Write a round transparent stamp PNG, like the assets_stamps/*_NoBG.png files.
+
+    Args:
+        output_path (str): Path to the output PNG.
+        label (str): Text written in the stamp.
+        size (int): Width and height in pixels. Defaults to 400.
+
+    Returns:
+        None
+    """
+    image = Image.new("RGBA", (size, size), (255, 255, 255, 0))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((10, 10, size - 10, size - 10), outline=(30, 40, 160, 255), width=12)
+    draw.text((size // 4, size // 2 - 10), label, fill=(30, 40, 160, 255))
+    image.save(output_path, format="PNG")
+
+
+def generate_synthetic_corpus(work_dir: str, num_docs: int, scanned: bool = True) -> tuple:
+    """
+    Generate a company folder of synthetic policies and its stamp under `work_dir`.
+
+    Args:
+        work_dir (str): Directory to write into.
+        num_docs (int): Number of policy PDFs.
+        scanned (bool): Rasterize the pages like a scanner output.
+
+    Returns:
+        tuple: (list of pdf paths, stamp path, list of policy fields)
+    """
+    company_dir = os.path.join(work_dir, "c1_bench")
+    assets_dir = os.path.join(work_dir, "assets_stamps")
+    os.makedirs(company_dir, exist_ok=True)
+    os.makedirs(assets_dir, exist_ok=True)
+
+    stamp_path = os.path.join(assets_dir, "1_bench_NoBG.png")
+    make_synthetic_stamp(stamp_path, label="BENCH SP. Z O.O.")
+
+    pdf_paths, list_fields = [], []
+    for idx in range(num_docs):
+        pdf_path = os.path.join(company_dir, f"policy_{idx:04d}.pdf")
+        # The blank page alternates between 3 and 4, the two cases of the signature page rule
+        list_fields.append(make_synthetic_policy_pdf(pdf_path, seed=idx, blank_page=3 + idx % 2, scanned=scanned))
+        pdf_paths.append(pdf_path)
+    return pdf_paths, stamp_path, list_fields
+
+
+def _max_rss_mb() -> float:
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / 1024 / 1024 if platform.system() == "Darwin" else max_rss / 1024
+
+
+def measure_stage(name: str, func: Callable, items: list) -> dict:
+    """
+    Call `func(item)` for each item and collect latency, throughput and memory.
+
+    Args:
+        name (str): Stage name.
+        func (Callable): Function processing one item.
+        items (list): Items to process, one per document.
+
+    Returns:
+        dict: stage statistics.
+    """
+    latencies = []
+    tracemalloc.start()
+    start = time.perf_counter()
+    for item in items:
+        item_start = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - item_start)
+    total_seconds = time.perf_counter() - start
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies_sorted = sorted(latencies)
+    stats = {
+        "stage": name,
+        "num_docs": len(items),
+        "total_s": total_seconds,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "median_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies_sorted[int(0.95 * (len(latencies_sorted) - 1))] * 1000,
+        "docs_per_s": len(items) / total_seconds if total_seconds else None,
+        "peak_python_mb": peak_traced / 1024 / 1024,
+        "max_rss_mb": _max_rss_mb(),
+    }
+    logger.info(f"{name}: {stats['median_ms']:.1f} ms/doc median, {stats['docs_per_s']:.2f} docs/s")
+    return stats
+
+
+@contextlib.contextmanager
+def _working_directory(path: str):
+    previous_dir = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous_dir)
+
+
+def run_benchmarks(work_dir: str, num_docs: int = 20, scanned: bool = True) -> dict:
+    """
+    Generate a synthetic corpus and time every pipeline stage on it.
+
+    OCR stages are skipped when the tesseract binary is not installed.
+
+    Args:
+        work_dir (str): Scratch directory for the corpus and the outputs, relative outputs land here.
+        num_docs (int): Number of synthetic policies. Defaults to 20.
+        scanned (bool): Rasterize the synthetic pages like a scanner output. Defaults to True.
+
+    Returns:
+        dict: environment description and the statistics of each stage.
+    """
+    work_dir = os.path.abspath(work_dir)
+    pdf_paths, stamp_path, _ = generate_synthetic_corpus(work_dir, num_docs=num_docs, scanned=scanned)
+    has_tesseract = shutil.which("tesseract") is not None
+    stages = []
+
+    with _working_directory(work_dir):
+        def blank_pages(pdf_path):
+            with fitz.open(pdf_path) as doc:
+                identify_blank_pages(document=doc)
+
+        stages.append(measure_stage("identify_blank_pages", blank_pages, pdf_paths))
+
+        if has_tesseract:
+            def ocr(pdf_path):
+                with fitz.open(pdf_path) as doc:
+                    extract_info_with_crop_search(doc=doc)
+
+            stages.append(measure_stage("extract_info_with_crop_search", ocr, pdf_paths))
+        else:
+            logger.warning("tesseract not found, OCR stages are skipped")
+
+        signed_paths = [os.path.join(work_dir, "res_outputs", f"signed_{idx:04d}.pdf") for idx in range(num_docs)]
+
+        def sign(idx):
+            insert_signatures(
+                pdf_path=pdf_paths[idx],
+                image_path=stamp_path,
+                positions=[[(400, 190), (230, 250)], [(400, 5), (230, 70)]],
+                idx_pdf_to_process=idx,
+                output_path=signed_paths[idx],
+                page_numbers=None,
+                width=120,
+                height=120,
+                use_ocr=has_tesseract,
+                create_blurred_pdf=has_tesseract,
+            )
+
+        stages.append(measure_stage("insert_signatures", sign, list(range(num_docs))))
+
+        def compress(pdf_path):
+            compress_pdf(pdf_path, os.path.splitext(pdf_path)[0] + "_cps.pdf")
+
+        stages.append(measure_stage("compress_pdf", compress, signed_paths))
+
+    return {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "pymupdf": fitz.VersionBind,
+        "cpu_count": os.cpu_count(),
+        "num_docs": num_docs,
+        "scanned": scanned,
+        "has_tesseract": has_tesseract,
+        "stages": stages,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_benchmark_results(results: dict, out_dir: str = "res_benchmarks") -> str:
+    """
+    Args:
+        results (dict): output of `run_benchmarks`.
+        out_dir (str): Directory of the result files. Defaults to "res_benchmarks".
+
+    Returns:
+        str: path of the written JSON file, named after the time and the commit.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    timestamp = results["created"].replace(":", "").replace("-", "")
+    output_path = os.path.join(out_dir, f"bench_{timestamp}_{results['commit']}.json")
+    with open(output_path, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    return output_path
+
+
+def compare_benchmark_results(baseline: dict, current: dict) -> list:
+    """
+    Compare the median latency of the stages present in both results.
+
+    Args:
+        baseline (dict): older output of `run_benchmarks`.
+        current (dict): newer output of `run_benchmarks`.
+
+    Returns:
+        list of str: one line per stage.
+    """
+    baseline_stages = {stage["stage"]: stage for stage in baseline["stages"]}
+    lines = []
+    for stage in current["stages"]:
+        old_stage = baseline_stages.get(stage["stage"])
+        if old_stage is None:
+            continue
+        speedup = old_stage["median_ms"] / stage["median_ms"] if stage["median_ms"] else float("inf")
+        lines.append(f"{stage['stage']}: {old_stage['median_ms']:.1f} ms -> {stage['median_ms']:.1f} ms "
+                     f"(x{speedup:.2f}, {baseline['commit']} -> {current['commit']})")
+    return lines
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import tempfile
+from typing import Optional
+
+import fitz  # PyMuPDF
+
+from doc_auto.utils_log import setup_logger
+
+logger = setup_logger(__name__)
+
+# Bump when the extraction output format changes, so older entries are not reused
+OCR_CACHE_VERSION = 1
+
+
+def hash_page_content(doc: fitz.Document, page_number: int = 0, params: Optional[dict] = None) -> str:
+    """
+    Hash everything that decides how a page renders, plus the OCR parameters.
+
+    The page content stream, the raw streams of its images and form XObjects, its size and
+    rotation are hashed without rendering the page, so a lookup costs far less than OCR.
+
+    Args:
+        doc (fitz.Document): the input PDF document.
+        page_number (int): Page number to hash (0-based index). Defaults to 0.
+        params (dict, optional): Crop/preprocess parameters the result depends on.
+
+    Returns:
+        str: hex sha256 digest.
+    """
+    page = doc[page_number]
+    sha = hashlib.sha256()
+    sha.update(f"v{OCR_CACHE_VERSION}|{tuple(page.rect)}|{page.rotation}|".encode())
+    sha.update(json.dumps(params or {}, sort_keys=True).encode())
+    sha.update(page.read_contents())
+
+    xrefs = sorted({img[0] for img in page.get_images(full=True)} | {xobj[0] for xobj in page.get_xobjects()})
+    for xref in xrefs:
+        sha.update(f"|{xref}|".encode())
+        sha.update(doc.xref_stream_raw(xref) or b"")
+    return sha.hexdigest()
+
+
+class OcrResultCache:
+    """
+    On-disk cache of OCR extraction results with size based LRU eviction.
+
+    Each entry is a small JSON file named after its key. Reading an entry refreshes its
+    modification time, and eviction removes the least recently used entries first until the
+    cache fits in `max_size_bytes`. Writes are atomic, so several worker processes can share
+    one cache directory.
+
+    Args:
+        cache_dir (str): Directory holding the cache entries. Defaults to "res_cache_ocr".
+        max_size_bytes (int): Size limit of the cache directory. Defaults to 64 MB.
+        evict_every (int): Run eviction after this many writes in the current process.
+    """
+
+    def __init__(self, cache_dir: str = "res_cache_ocr", max_size_bytes: int = 64 * 1024 * 1024,
+                 evict_every: int = 50):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.evict_every = evict_every
+        self._num_puts = 0
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Args:
+            key (str): cache key from `hash_page_content`.
+
+        Returns:
+            dict or None: the cached entry, None on a miss.
+        """
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "r", encoding="utf-8") as file:
+                entry = json.load(file)
+            os.utime(entry_path)  # Mark as recently used
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return entry
+
+    def put(self, key: str, entry: dict):
+        """
+        Args:
+            key (str): cache key from `hash_page_content`.
+            entry (dict): JSON serializable entry to store.
+
+        Returns:
+            None
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            json.dump(entry, file, ensure_ascii=False)
+        os.replace(tmp_path, self._entry_path(key))
+
+        self._num_puts += 1
+        if self._num_puts % self.evict_every == 0:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits in `max_size_bytes`.
+
+        Returns:
+            int: Number of removed entries.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return 0
+
+        entries = []
+        total_size = 0
+        for dir_entry in os.scandir(self.cache_dir):
+            if not dir_entry.name.endswith(".json"):
+                continue
+            try:
+                stat = dir_entry.stat()
+            except FileNotFoundError:
+                continue  # Removed by another worker
+            entries.append((stat.st_mtime, stat.st_size, dir_entry.path))
+            total_size += stat.st_size
+
+        num_removed = 0
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            try:
+                os.remove(path)
+                num_removed += 1
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+        if num_removed:
+            logger.info(f"Evicted {num_removed} OCR cache entries from {self.cache_dir}")
+        return num_removed
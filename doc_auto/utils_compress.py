@@ -0,0 +1,205 @@
+import io
+import os
+from typing import NamedTuple, Optional
+
+import pikepdf
+from PIL import Image
+
+from doc_auto.utils_batch import run_batch
+from doc_auto.utils_log import setup_logger
+from doc_auto.utils_metrics import timed
+
+logger = setup_logger(__name__)
+
+# Optimization levels of compress_pdf
+COMPRESS_LEVEL_PLAIN = 0  # Rewrite the file with default settings
+COMPRESS_LEVEL_LOSSLESS = 1  # Object streams and recompressed flate streams
+COMPRESS_LEVEL_IMAGES = 2  # Lossless, plus scanned images downsampled and recompressed to JPEG
+
+COMPRESSED_SUFFIX = "_cps"
+
+
+class CompressResult(NamedTuple):
+    """
+    Attributes:
+        input_path (str): Path to the input PDF.
+        output_path (str): Path to the compressed PDF.
+        input_bytes (int): Size of the input PDF.
+        output_bytes (int): Size of the compressed PDF.
+        skipped (bool): True if the output was already up to date and nothing was written.
+    """
+    input_path: str
+    output_path: str
+    input_bytes: int
+    output_bytes: int
+    skipped: bool = False
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.input_bytes - self.output_bytes
+
+
+def has_default_decode(raw_image: pikepdf.Object, num_channels: int) -> bool:
+    """
+    The image has no /Decode array, or one that maps every channel as is ([0 1] per channel).
+    """
+    if "/Decode" not in raw_image:
+        return True
+    return [float(value) for value in raw_image.Decode] == [0.0, 1.0] * num_channels
+
+
+def downsample_images(pdf: pikepdf.Pdf, target_dpi: int = 150, jpeg_quality: int = 75) -> int:
+    """
+    Downsample the 8-bit gray/RGB page images above `target_dpi` and store them as JPEG.
+
+    ICC based color spaces are kept, the number of channels does not change.
+
+    The resolution of an image is estimated against the page width, which is exact for scanned
+    pages where one image covers the whole page and underestimates smaller images, so those are
+    left alone. Images with transparency (e.g. stamps), exotic color spaces or a /Decode array
+    remapping the samples (e.g. inverted scans) are never touched, and an image is only replaced
+    when the JPEG is smaller.
+
+    Args:
+        pdf (pikepdf.Pdf): the open PDF, modified in place.
+        target_dpi (int): Resolution to downsample to. Defaults to 150.
+        jpeg_quality (int): JPEG quality of the recompressed images. Defaults to 75.
+
+    Returns:
+        int: Number of replaced images.
+    """
+    num_replaced = 0
+    seen = set()
+    for page in pdf.pages:
+        page_width_inch = float(page.mediabox[2] - page.mediabox[0]) / 72
+        for raw_image in page.get_images().values():
+            if raw_image.objgen in seen:
+                continue  # Shared between pages
+            seen.add(raw_image.objgen)
+
+            if "/SMask" in raw_image or raw_image.get("/ImageMask", False):
+                continue
+            pdf_image = pikepdf.PdfImage(raw_image)
+            if pdf_image.bits_per_component != 8 or pdf_image.mode not in ("L", "RGB") or pdf_image.indexed:
+                continue
+            if not has_default_decode(raw_image, num_channels=len(pdf_image.mode)):
+                continue  # The decoded samples are not the stored ones, the JPEG could not keep the mapping
+
+            image_dpi = pdf_image.width / page_width_inch
+            if image_dpi <= target_dpi:
+                continue
+
+            scale = target_dpi / image_dpi
+            pil_image = pdf_image.as_pil_image()
+            pil_image = pil_image.resize(
+                (max(1, round(pil_image.width * scale)), max(1, round(pil_image.height * scale))), Image.LANCZOS
+            )
+            buffer = io.BytesIO()
+            pil_image.save(buffer, format="JPEG", quality=jpeg_quality, optimize=True)
+            if buffer.tell() >= len(raw_image.read_raw_bytes()):
+                continue
+
+            raw_image.write(buffer.getvalue(), filter=pikepdf.Name.DCTDecode)
+            raw_image.Width, raw_image.Height = pil_image.width, pil_image.height
+            for key in ("/DecodeParms", "/Decode"):
+                if key in raw_image:
+                    del raw_image[key]
+            num_replaced += 1
+    return num_replaced
+
+
+@timed("compress")
+def compress_pdf(input_path, output_path, level: int = COMPRESS_LEVEL_LOSSLESS, target_dpi: int = 150,
+                 jpeg_quality: int = 75) -> Optional[CompressResult]:
+    """
+    Compress a PDF file using pikepdf.
+
+    Args:
+        input_path (str): Path to the input PDF.
+        output_path (str): Path to save the compressed PDF.
+        level (int): COMPRESS_LEVEL_PLAIN, COMPRESS_LEVEL_LOSSLESS (default) or COMPRESS_LEVEL_IMAGES.
+        target_dpi (int): Resolution of the scanned images at COMPRESS_LEVEL_IMAGES. Defaults to 150.
+        jpeg_quality (int): JPEG quality of the recompressed images. Defaults to 75.
+
+    Returns:
+        CompressResult or None: sizes of both files, None if compression failed.
+    """
+    try:
+        # Open the original PDF
+        with pikepdf.Pdf.open(input_path) as pdf:
+            save_options = {}
+            if level >= COMPRESS_LEVEL_LOSSLESS:
+                save_options = dict(
+                    compress_streams=True,
+                    object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                    recompress_flate=True,
+                )
+            if level >= COMPRESS_LEVEL_IMAGES:
+                num_images = downsample_images(pdf, target_dpi=target_dpi, jpeg_quality=jpeg_quality)
+                logger.debug(f"{num_images} images downsampled in {input_path}")
+
+            # Save the optimized version
+            pdf.save(output_path, **save_options)
+    except Exception as e:
+        print(f"Error compressing PDF: {e}")
+        return None
+
+    result = CompressResult(input_path=input_path, output_path=output_path,
+                            input_bytes=os.path.getsize(input_path), output_bytes=os.path.getsize(output_path))
+    print(f"Compressed PDF saved as: {output_path} ({result.bytes_saved} bytes saved)")
+    return result
+
+
+def compressed_output_path(input_path: str, suffix: str = COMPRESSED_SUFFIX) -> str:
+    return os.path.splitext(input_path)[0] + suffix + os.path.splitext(input_path)[1]
+
+
+def is_up_to_date(input_path: str, output_path: str) -> bool:
+    """
+    The output exists and was written after the input was last modified.
+    """
+    return os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(input_path)
+
+
+def compress_pdfs_in_dir(root_dir: str, level: int = COMPRESS_LEVEL_LOSSLESS, target_dpi: int = 150,
+                         jpeg_quality: int = 75, max_workers: Optional[int] = None, force: bool = False,
+                         suffix: str = COMPRESSED_SUFFIX) -> list:
+    """
+    Compress every PDF of a directory across a process pool, next to its input with `suffix`.
+
+    Files that already are compressed outputs are never used as inputs, and inputs whose output is
+    up to date are skipped unless `force` is set.
+
+    Args:
+        root_dir (str): Directory of the PDF files.
+        level (int): Optimization level, see `compress_pdf`.
+        target_dpi (int): Resolution of the scanned images at COMPRESS_LEVEL_IMAGES.
+        jpeg_quality (int): JPEG quality of the recompressed images.
+        max_workers (int, optional): Number of worker processes. None uses all CPUs.
+        force (bool): Recompress up to date outputs too. Defaults to False.
+        suffix (str): Suffix of the compressed files. Defaults to "_cps".
+
+    Returns:
+        list: CompressResult of each input, skipped ones included, None for failures.
+    """
+    input_paths = sorted(
+        os.path.join(root_dir, file) for file in os.listdir(root_dir)
+        if file.lower().endswith(".pdf") and not os.path.splitext(file)[0].endswith(suffix)
+    )
+
+    results = []
+    jobs = []
+    for input_path in input_paths:
+        output_path = compressed_output_path(input_path, suffix=suffix)
+        if not force and is_up_to_date(input_path, output_path):
+            results.append(CompressResult(input_path=input_path, output_path=output_path,
+                                          input_bytes=os.path.getsize(input_path),
+                                          output_bytes=os.path.getsize(output_path), skipped=True))
+            continue
+        jobs.append(dict(input_path=input_path, output_path=output_path, level=level,
+                         target_dpi=target_dpi, jpeg_quality=jpeg_quality))
+
+    logger.info(f"Compressing {len(jobs)} pdf files, {len(results)} already up to date")
+    for batch_result in run_batch(func=compress_pdf, jobs=jobs, max_workers=max_workers):
+        results.append(batch_result.result)
+    return results
@@ -0,0 +1,173 @@
+import atexit
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+from typing import Optional
+
+from doc_auto.utils_log import setup_logger
+from doc_auto.utils_metrics import incr
+
+logger = setup_logger(__name__)
+
+# Read by `get_debug_writer`, so the worker processes use the settings chosen by the parent
+DEBUG_DIR_ENV = "DOC_AUTO_DEBUG_DIR"  # Unset disables the debug artifacts
+DEBUG_SAMPLE_ENV = "DOC_AUTO_DEBUG_SAMPLE"
+DEBUG_EVERY_N_ENV = "DOC_AUTO_DEBUG_EVERY_N"
+DEBUG_RUN_ID_ENV = "DOC_AUTO_DEBUG_RUN_ID"  # Start time of the run, shared by its worker processes
+
+DEBUG_SAMPLE_FAILURES = "failures"  # Only attempts whose extraction failed
+DEBUG_SAMPLE_ALL = "all"  # Every attempt
+DEBUG_QUEUE_SIZE = 64  # Images waiting to be written, more are dropped instead of blocking OCR
+
+_writer = None  # DebugArtifactWriter of the current process
+_writer_pid = None
+
+
+class DebugArtifactWriter:
+    """
+    Save preprocessed OCR images from a background thread, so encoding and writing them never
+    runs in the OCR loop.
+
+    Args:
+        output_dir (str): Directory of the images.
+        sample (str): DEBUG_SAMPLE_FAILURES or DEBUG_SAMPLE_ALL. Defaults to DEBUG_SAMPLE_FAILURES.
+        every_n (int): Only save the images of 1 in `every_n` documents, chosen by name so every
+                       process picks the same documents. Defaults to 1 (every document).
+        run_id (str, optional): Prefix of the file names, so the images of several runs don't
+                                overwrite each other. Defaults to the current time.
+    """
+
+    def __init__(self, output_dir: str, sample: str = DEBUG_SAMPLE_FAILURES, every_n: int = 1,
+                 run_id: Optional[str] = None):
+        if sample not in (DEBUG_SAMPLE_FAILURES, DEBUG_SAMPLE_ALL):
+            raise ValueError(f"Unknown debug sample mode: {sample}")
+        self.output_dir = output_dir
+        self.sample = sample
+        self.every_n = max(1, every_n)
+        self.run_id = run_id or new_run_id()
+        self._queue = queue.Queue(maxsize=DEBUG_QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._run, name="debug-artifacts", daemon=True)
+        self._thread.start()
+
+    def wants(self, document_name: str, ok: bool) -> bool:
+        if ok and self.sample == DEBUG_SAMPLE_FAILURES:
+            return False
+        return zlib.crc32(document_name.encode("utf-8")) % self.every_n == 0
+
+    def submit(self, document_name: str, attempt: int, image, ok: bool, tag: str = "ocr"):
+        """
+        Queue the image of one attempt if the sampling selects it.
+
+        Args:
+            document_name (str): Document path or name, used in the file name.
+            attempt (int): 0-based attempt number.
+            image (PIL.Image.Image): the image, copied since it may live in a reused buffer.
+            ok (bool): Whether the extraction of this attempt succeeded.
+            tag (str): What the image is, e.g. "ocr". Defaults to "ocr".
+
+        Returns:
+            None
+        """
+        if not self.wants(document_name, ok):
+            return
+        file_name = (f"{self.run_id}_{artifact_document_key(document_name)}_{os.getpid()}_{tag}_{attempt:02d}_"
+                     f"{'ok' if ok else 'fail'}.jpg")
+        try:
+            self._queue.put_nowait((os.path.join(self.output_dir, file_name), image.copy()))
+        except queue.Full:
+            incr("debug_artifacts_dropped")
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            path, image = item
+            try:
+                os.makedirs(self.output_dir, exist_ok=True)
+                image.save(path)
+            except Exception as e:
+                logger.warning(f"Failed to save debug image {path}: {e}")
+
+    def close(self, timeout: float = 10.0):
+        """
+        Write the queued images and stop the thread.
+        """
+        self._queue.put(None)
+        self._thread.join(timeout=timeout)
+
+
+def new_run_id() -> str:
+    return time.strftime("%Y%m%d-%H%M%S")
+
+
+def artifact_document_key(document_name: str) -> str:
+    """
+    File name safe key of a document: its folder, its name and a short hash of its full path, so
+    documents of the same name in several company folders get their own images.
+    """
+    folder = os.path.basename(os.path.dirname(os.path.abspath(document_name)))
+    stem = os.path.splitext(os.path.basename(document_name))[0]
+    path_hash = zlib.crc32(os.path.abspath(document_name).encode("utf-8"))
+    key = re.sub(r"[^\w.-]", "_", f"{folder}_{stem}" if folder else stem) or "document"
+    return f"{key}_{path_hash:08x}"
+
+
+def set_debug_artifacts(output_dir: Optional[str], sample: str = DEBUG_SAMPLE_FAILURES, every_n: int = 1):
+    """
+    Enable the debug images of this process and of the worker processes it starts, or disable
+    them with `output_dir=None` (the default state).
+
+    Args:
+        output_dir (str, optional): Directory of the images, None disables them.
+        sample (str): DEBUG_SAMPLE_FAILURES or DEBUG_SAMPLE_ALL.
+        every_n (int): Only save the images of 1 in `every_n` documents.
+
+    Returns:
+        None
+    """
+    close_debug_writer()
+    if not output_dir:
+        for env in (DEBUG_DIR_ENV, DEBUG_SAMPLE_ENV, DEBUG_EVERY_N_ENV, DEBUG_RUN_ID_ENV):
+            os.environ.pop(env, None)
+        return
+    if sample not in (DEBUG_SAMPLE_FAILURES, DEBUG_SAMPLE_ALL):
+        raise ValueError(f"Unknown debug sample mode: {sample}")
+    os.environ[DEBUG_DIR_ENV] = output_dir
+    os.environ[DEBUG_SAMPLE_ENV] = sample
+    os.environ[DEBUG_EVERY_N_ENV] = str(every_n)
+    os.environ[DEBUG_RUN_ID_ENV] = new_run_id()
+
+
+def get_debug_writer() -> Optional[DebugArtifactWriter]:
+    """
+    Returns:
+        DebugArtifactWriter or None: the writer of the current process, None when disabled.
+    """
+    global _writer, _writer_pid
+    output_dir = os.environ.get(DEBUG_DIR_ENV)
+    if not output_dir:
+        return None
+    if _writer is None or _writer_pid != os.getpid():  # Forked workers start their own thread
+        _writer = DebugArtifactWriter(
+            output_dir=output_dir,
+            sample=os.environ.get(DEBUG_SAMPLE_ENV, DEBUG_SAMPLE_FAILURES),
+            every_n=int(os.environ.get(DEBUG_EVERY_N_ENV, "1")),
+            run_id=os.environ.get(DEBUG_RUN_ID_ENV),
+        )
+        _writer_pid = os.getpid()
+    return _writer
+
+
+@atexit.register
+def close_debug_writer():
+    """
+    Write the queued images of this process, the next `get_debug_writer` starts a new writer.
+    """
+    global _writer, _writer_pid
+    if _writer is not None and _writer_pid == os.getpid():
+        _writer.close()
+    _writer, _writer_pid = None, None
@@ -0,0 +1,266 @@
+import hashlib
+import re
+from typing import Callable, NamedTuple, Optional
+
+# Confidence of a field value
+CONFIDENCE_VALID = 1.0  # Matched and passed its validator
+CONFIDENCE_INVALID = 0.5  # Matched but failed its validator, kept for inspection only
+CONFIDENCE_MISSING = 0.0  # No match
+
+# Sections of the text some fields are searched in, instead of the whole text
+SECTION_PATTERNS = {
+    "payment": re.compile(r"(?:\n\nPłatności\n\n|:\s*)(.*?)(\nóżnica:|termin płatności:|płatność:)", re.DOTALL),
+}
+
+
+class FieldSpec(NamedTuple):
+    """
+    How to find, normalize and check one field of the 1st page.
+
+    Attributes:
+        name (str): Field name.
+        pattern (re.Pattern): Precompiled pattern, group 1 is the raw value.
+        post_process (Callable): Turns the stripped raw value into the value to validate.
+        validate (Callable): Returns True if the value is acceptable.
+        section (str, optional): Key of SECTION_PATTERNS to search in, None searches the whole text.
+        required (bool): A missing required field makes the extraction incomplete.
+        clean_up (bool): Remove the line breaks and shorten "ALEJA" once the value is validated.
+    """
+    name: str
+    pattern: re.Pattern
+    post_process: Callable[[str], str]
+    validate: Callable[[str], bool]
+    section: Optional[str] = None
+    required: bool = True
+    clean_up: bool = True
+
+
+class ExtractedField(NamedTuple):
+    name: str
+    value: Optional[str]
+    confidence: float
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.value is not None and self.error is None
+
+
+def _clean_up(value: str) -> str:
+    return value.replace("\n", "").replace("ALEJA", "al")
+
+
+def _as_is(value: str) -> str:
+    return value
+
+
+def _remove_spaces(value: str) -> str:
+    return value.replace(" ", "")
+
+
+def _not_empty(value: str) -> bool:
+    return len(value) > 0
+
+
+FIELD_SPECS = (
+    FieldSpec(
+        name="recipient_name",
+        pattern=re.compile(r"\n*\s*odbiorca:\s*(.*?)\n", re.DOTALL),
+        post_process=_as_is,
+        validate=_not_empty,
+        section="payment",
+    ),
+    FieldSpec(
+        name="recipient_address",
+        pattern=re.compile(r"SA\n(.*?)\nnr rachunku:", re.DOTALL),
+        post_process=_as_is,
+        validate=_not_empty,
+        section="payment",
+    ),
+    FieldSpec(
+        name="bank_account",
+        pattern=re.compile(r"\nnr rachunku:\s*(.*?)\ntytuł", re.DOTALL),
+        post_process=_remove_spaces,
+        # Checked before the line breaks are removed, an account split over lines is invalid
+        validate=lambda value: len(value) == 26,
+        section="payment",
+    ),
+    FieldSpec(
+        name="amount",
+        # Allow for spaces between digits
+        pattern=re.compile(r"(?:kwota:\s*|składka przed zmianą:|składka po zmianie:)\s*([\d\s]+)\s?(?:zł|zl)",
+                           re.DOTALL),
+        post_process=_as_is,
+        validate=_not_empty,
+        section="payment",
+    ),
+    FieldSpec(
+        name="company",
+        pattern=re.compile(r"(\S+)(?=\s*SPÓŁKA Z )", re.DOTALL),
+        post_process=lambda value: value + " sp. z o.o.",
+        validate=lambda value: value != " sp. z o.o.",
+    ),
+    FieldSpec(
+        name="policy_number",
+        pattern=re.compile(r"(?:numer polisy:|Polisa nr)\s*(\d+)\n", re.DOTALL),
+        post_process=lambda value: "Polisa nr " + value,
+        validate=lambda value: value != "Polisa nr ",
+    ),
+    FieldSpec(
+        name="company_address",
+        pattern=re.compile(r"\n\nadres:\s*(.*?)\n(?:e-mail|\n)", re.DOTALL),
+        post_process=_as_is,
+        validate=_not_empty,
+    ),
+    FieldSpec(
+        name="nr_plate",
+        pattern=re.compile(r"\nnr rejestracyjny:\s*(.*?)(\n|\s)", re.DOTALL),
+        post_process=_as_is,
+        validate=_not_empty,
+        required=False,
+        clean_up=False,
+    ),
+)
+
+# Order of the 7 fields in `info_1st_page`
+IMPORTANT_FIELDS = ("recipient_name", "recipient_address", "bank_account", "amount", "company", "policy_number",
+                    "company_address")
+
+
+def _code_fingerprint(func: Callable) -> str:
+    code = func.__code__
+    return code.co_code.hex() + repr(code.co_consts)
+
+
+def field_specs_fingerprint(specs: tuple = FIELD_SPECS) -> str:
+    """
+    Hash of everything the extracted values depend on: the section patterns and, for every field,
+    its pattern, the code of its post-process and validator and its flags. A change to any of them
+    changes the hash, so results stored with the old specs are not reused.
+
+    Args:
+        specs (tuple): FieldSpec items. Defaults to FIELD_SPECS.
+
+    Returns:
+        str: hex sha256 digest, shortened to 16 characters.
+    """
+    sha = hashlib.sha256()
+    for name, pattern in sorted(SECTION_PATTERNS.items()):
+        sha.update(f"{name}|{pattern.pattern}|{pattern.flags}|".encode())
+    sha.update(_code_fingerprint(_clean_up).encode())
+    for spec in specs:
+        sha.update(f"{spec.name}|{spec.pattern.pattern}|{spec.pattern.flags}|{spec.section}|{spec.required}|"
+                   f"{spec.clean_up}|{_code_fingerprint(spec.post_process)}|{_code_fingerprint(spec.validate)}|"
+                   .encode())
+    return sha.hexdigest()[:16]
+
+
+class ExtractionRecord:
+    """
+    Fields extracted from one text, with the confidence of each and the required fields missing.
+
+    Records of several attempts over the same page (e.g. other crops) can be merged, keeping the
+    most confident value of each field, so a retry only has to find the fields still missing.
+    """
+
+    def __init__(self, fields: dict, specs: tuple = FIELD_SPECS):
+        self.fields = fields
+        self.specs = specs
+
+    @property
+    def missing(self) -> list:
+        return [spec.name for spec in self.specs if spec.required and not self.fields[spec.name].ok]
+
+    @property
+    def ok(self) -> bool:
+        return not self.missing
+
+    def value(self, name: str) -> Optional[str]:
+        field = self.fields[name]
+        return field.value if field.ok else None
+
+    def merge(self, other: "ExtractionRecord") -> "ExtractionRecord":
+        """
+        Returns:
+            ExtractionRecord: the best field of both records, valid before invalid, then the most
+            confident, this one's on ties.
+        """
+        def rank(field: ExtractedField):
+            return field.ok, field.confidence
+
+        return ExtractionRecord(
+            fields={name: other.fields[name] if rank(other.fields[name]) > rank(field) else field
+                    for name, field in self.fields.items()},
+            specs=self.specs,
+        )
+
+    def important_info(self) -> list:
+        """
+        Returns:
+            list: the 7 important fields in the order of `info_1st_page`.
+        """
+        return [self.value(name) for name in IMPORTANT_FIELDS]
+
+    def nr_plate(self) -> list:
+        """
+        Returns:
+            list: the plate number, or an empty list if it was not found.
+        """
+        plate = self.value("nr_plate")
+        return [plate] if plate else []
+
+    def confidences(self) -> dict:
+        return {name: field.confidence for name, field in self.fields.items()}
+
+    def __repr__(self):
+        return f"ExtractionRecord(missing={self.missing}, confidences={self.confidences()})"
+
+
+def extract_field(spec: FieldSpec, text: Optional[str], confidence: float = 1.0) -> ExtractedField:
+    """
+    Args:
+        spec (FieldSpec): the field to extract.
+        text (str, optional): text to search, None if its section was not found.
+        confidence (float): Confidence of the text itself, e.g. from OCR, scales the field confidence.
+
+    Returns:
+        ExtractedField
+    """
+    if text is None:
+        return ExtractedField(spec.name, None, CONFIDENCE_MISSING, f"section {spec.section} not found")
+
+    match = spec.pattern.search(text)
+    if not match:
+        return ExtractedField(spec.name, None, CONFIDENCE_MISSING, "no match")
+
+    value = spec.post_process(match.group(1).strip())
+    if not spec.validate(value):
+        return ExtractedField(spec.name, value, CONFIDENCE_INVALID * confidence, f"invalid value: {value}")
+    if spec.clean_up:
+        value = _clean_up(value)
+    return ExtractedField(spec.name, value, CONFIDENCE_VALID * confidence)
+
+
+def extract_fields(text: str, specs: tuple = FIELD_SPECS, confidence: float = 1.0) -> ExtractionRecord:
+    """
+    Extract every field of `specs` from the text of the 1st page.
+
+    Args:
+        text (str): OCR or text layer text of the 1st page.
+        specs (tuple): FieldSpec items to extract. Defaults to FIELD_SPECS.
+        confidence (float): Confidence of the text itself, scales the field confidences. Defaults to 1.0.
+
+    Returns:
+        ExtractionRecord: never raises on missing fields, see `ExtractionRecord.missing`.
+    """
+    sections = {}
+    for name, pattern in SECTION_PATTERNS.items():
+        match = pattern.search(text)
+        sections[name] = match.group(1).strip() if match else None
+
+    return ExtractionRecord(
+        fields={spec.name: extract_field(spec, text if spec.section is None else sections[spec.section],
+                                         confidence=confidence)
+                for spec in specs},
+        specs=specs,
+    )
@@ -1,3 +1,4 @@
+import numpy as np
 from PIL import Image, ImageDraw
 
 
@@ -40,7 +41,55 @@ def crop_image(
     return cropped_img
 
 
-def convert_white_to_transparent(image, threshold=200):
+_buffers = {}  # Reusable arrays of the current process by name
+
+
+def reusable_buffer(name: str, shape: tuple, dtype=np.uint8) -> np.ndarray:
+    """
+    An array of `shape` backed by a buffer kept for the next calls with the same name, so
+    processing many pages of similar size does not allocate a new array per page.
+
+    The content is only valid until the next call with the same name.
+
+    Args:
+        name (str): Buffer name, one per use.
+        shape (tuple): Shape of the array.
+        dtype: Data type of the array. Defaults to np.uint8.
+
+    Returns:
+        np.ndarray: C-contiguous array with undefined content.
+    """
+    size = int(np.prod(shape))
+    buffer = _buffers.get(name)
+    if buffer is None or buffer.dtype != dtype or buffer.size < size:
+        buffer = np.empty(size, dtype=dtype)
+        _buffers[name] = buffer
+    return buffer[:size].reshape(shape)
+
+
+def autocontrast_array(gray: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """
+    NumPy port of `PIL.ImageOps.autocontrast` (no cutoff) for uint8 grayscale arrays, with the
+    same truncating lookup table, so the output is identical.
+
+    Args:
+        gray (np.ndarray): uint8 grayscale array, may be a non-contiguous view.
+        out (np.ndarray, optional): uint8 array of the same shape to write into.
+
+    Returns:
+        np.ndarray: the stretched array (`out` when given).
+    """
+    lo, hi = int(gray.min()), int(gray.max())
+    if hi <= lo:
+        lut = np.arange(256, dtype=np.uint8)  # Don't bother
+    else:
+        scale = 255.0 / (hi - lo)
+        offset = -lo * scale
+        lut = np.clip(np.trunc(np.arange(256) * scale + offset), 0, 255).astype(np.uint8)
+    return np.take(lut, gray, out=out, mode="clip")  # uint8 indices are always in range, "clip" avoids buffering
+
+
+def convert_white_to_transparent(image, threshold=200, feather: int = 0):
     """
     Convert white or near-white pixels in an image to transparent.
 
@@ -48,6 +97,9 @@ def convert_white_to_transparent(image, threshold=200):
         image (PIL.Image.Image): The input image in RGBA mode.
         threshold (int): The RGB value above which a pixel is considered white.
                          Defaults to 200.
+        feather (int): Width of a soft edge below `threshold`. A pixel whose darkest channel is
+                       within `feather` levels under the threshold keeps a proportional part of its
+                       alpha, which removes the white halo around strokes. Defaults to 0 (hard edge).
 
     Returns:
         PIL.Image.Image: The image with white pixels made transparent.
@@ -56,20 +108,21 @@ def convert_white_to_transparent(image, threshold=200):
     if image.mode != 'RGBA':
         image = image.convert('RGBA')
 
-    # Process the image data
-    datas = image.getdata()
-    new_data = []
-    for item in datas:
-        # Check if the pixel is white or near-white
-        if item[0] >= threshold and item[1] >= threshold and item[2] >= threshold:
-            # Replace white pixel with a transparent one
-            new_data.append((255, 255, 255, 0))
-        else:
-            new_data.append(item)
-
-    # Update image data
-    image.putdata(new_data)
-    return image
+    data = np.array(image)  # (height, width, 4) uint8
+    min_rgb = data[:, :, :3].min(axis=2)
+
+    # Check if the pixel is white or near-white
+    white_mask = min_rgb >= threshold
+
+    if feather > 0:
+        edge_mask = ~white_mask & (min_rgb > threshold - feather)
+        keep_fraction = (threshold - min_rgb[edge_mask].astype(np.float32)) / feather
+        data[:, :, 3][edge_mask] = np.round(data[:, :, 3][edge_mask] * keep_fraction).astype(np.uint8)
+
+    # Replace white pixel with a transparent one
+    data[white_mask] = (255, 255, 255, 0)
+
+    return Image.fromarray(data)
 
 
 def merge_images_overlay_background_on_transparent(
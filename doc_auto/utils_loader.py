@@ -0,0 +1,83 @@
+import mmap
+
+import fitz  # PyMuPDF
+from PyPDF2 import PdfReader
+
+from doc_auto.utils_metrics import incr
+
+
+class MappedPdf:
+    """
+    Read-only memory mapping of an input PDF, opened by every consumer without copying it.
+
+    PyMuPDF documents and PyPDF2 readers read from the mapping, so the blank page detection,
+    OCR, redaction and stamping of a document share one mapping, and only the pages of the file
+    they touch are read from disk. Worker processes map the file themselves: the pages are shared
+    through the OS page cache instead of pickling the content to each worker.
+
+    Use it as a context manager, or call `close`: the documents opened from the mapping are closed
+    first, then the mapping and the file.
+
+    Args:
+        pdf_path (str): Path to the input PDF.
+
+    Raises:
+        fitz.EmptyFileError: If the file is empty.
+    """
+
+    def __init__(self, pdf_path: str):
+        self.pdf_path = pdf_path
+        self._file = open(pdf_path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise fitz.EmptyFileError(f"Cannot open empty file: {pdf_path}")
+        self._views = []
+        self._documents = []
+        incr("input_files_mapped")
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._mmap)
+
+    def open_document(self) -> fitz.Document:
+        """
+        Returns:
+            fitz.Document: opened from the mapping, closed with it.
+        """
+        view = memoryview(self._mmap)  # PyMuPDF keeps a memoryview as is, other buffers are copied
+        self._views.append(view)
+        document = fitz.open(stream=view, filetype="pdf")
+        self._documents.append(document)
+        return document
+
+    def pdf_reader(self) -> PdfReader:
+        """
+        Returns:
+            PdfReader: reading from the mapping, valid until `close`.
+        """
+        return PdfReader(self._mmap)
+
+    @property
+    def closed(self) -> bool:
+        return self._mmap.closed
+
+    def close(self):
+        if self._mmap.closed:
+            return
+        for document in self._documents:
+            if not document.is_closed:
+                document.close()
+        # The mapping can only be closed once no view of it is left
+        for view in self._views:
+            view.release()
+        self._documents, self._views = [], []
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,236 @@
+import json
+import os
+import re
+import sqlite3
+import time
+from typing import Iterable, NamedTuple, Optional
+
+from doc_auto.utils_log import setup_logger
+
+logger = setup_logger(__name__)
+
+COMPANY_DIR_PATTERN = re.compile(r"c\d+_(\w+)")  # Company folders, the group is the company key name
+
+# Document states, in processing order
+STATE_PENDING = "pending"
+STATE_OCR_DONE = "ocr_done"  # 1st page information extracted and stored, a rerun skips the OCR
+STATE_REDACTED = "redacted"
+STATE_SIGNED = "signed"  # Outputs written, a rerun skips the document while its input is unchanged
+STATE_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    pdf_path TEXT PRIMARY KEY,
+    company TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    output_path TEXT,
+    blurred_output_path TEXT,
+    info_1st_page TEXT,
+    info_nr_plate TEXT,
+    error TEXT,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class ScannedDocument(NamedTuple):
+    pdf_path: str
+    company: str
+    size: int
+    mtime_ns: int
+
+
+class ManifestEntry(NamedTuple):
+    """
+    Recorded state of one input document.
+
+    Attributes:
+        pdf_path (str): Path to the input PDF.
+        company (str): Key name of its company folder, e.g. "warta" for "c4_warta".
+        size (int): Input size when it was recorded.
+        mtime_ns (int): Input modification time when it was recorded.
+        state (str): One of the STATE_* constants.
+        output_path (str, optional): Signed PDF, once signed.
+        blurred_output_path (str, optional): Redacted 1st page PDF, once signed.
+        info_1st_page (list, optional): 7 fields extracted from the 1st page, from STATE_OCR_DONE on.
+        info_nr_plate (list, optional): registration plate extracted from the 1st page.
+        error (str, optional): Last line of the error, when failed.
+    """
+    pdf_path: str
+    company: str
+    size: int
+    mtime_ns: int
+    state: str
+    output_path: Optional[str]
+    blurred_output_path: Optional[str]
+    info_1st_page: Optional[list]
+    info_nr_plate: Optional[list]
+    error: Optional[str]
+
+    @property
+    def has_ocr_result(self) -> bool:
+        # Also kept by a document that failed after its OCR
+        return self.info_1st_page is not None
+
+    @property
+    def is_complete(self) -> bool:
+        """
+        Signed and its outputs still exist, so it does not need to be processed again.
+        """
+        if self.state != STATE_SIGNED or not self.output_path or not os.path.exists(self.output_path):
+            return False
+        return not self.blurred_output_path or os.path.exists(self.blurred_output_path)
+
+
+def scan_company_dirs(root_dir: str, dir_paths: Optional[Iterable] = None) -> list:
+    """
+    List the input documents of the company folders once, with the size and modification time
+    that decide whether a recorded result is still valid.
+
+    Args:
+        root_dir (str): Directory holding the company folders.
+        dir_paths (iterable, optional): Company folder names to scan. None scans every folder
+                                        matching COMPANY_DIR_PATTERN (e.g. "c4_warta").
+
+    Returns:
+        list: ScannedDocument items, sorted by folder then file name.
+    """
+    if dir_paths is None:
+        dir_paths = [d for d in os.listdir(root_dir)
+                     if COMPANY_DIR_PATTERN.match(d) and os.path.isdir(os.path.join(root_dir, d))]
+
+    documents = []
+    for sub_d in sorted(dir_paths):
+        match = COMPANY_DIR_PATTERN.match(sub_d)
+        if match is None:
+            raise ValueError(f"Not a company folder (c<number>_<name>): {sub_d}")
+        with os.scandir(os.path.join(root_dir, sub_d)) as entries:
+            for entry in sorted(entries, key=lambda e: e.name):
+                if not entry.is_file() or not entry.name.lower().endswith(".pdf"):
+                    continue
+                stat = entry.stat()
+                documents.append(ScannedDocument(pdf_path=entry.path, company=match.group(1), size=stat.st_size,
+                                                 mtime_ns=stat.st_mtime_ns))
+    return documents
+
+
+class JobManifest:
+    """
+    SQLite record of the state of every input document, so an interrupted batch resumes where it
+    stopped instead of starting over.
+
+    The main process syncs the scanned documents and records the final states; the worker
+    processes record the intermediate checkpoints (e.g. the OCR result) through their own
+    connection. A document whose input changed since it was recorded starts over as pending.
+
+    Args:
+        db_path (str): Path to the SQLite database. Defaults to "res_outputs/manifest.sqlite".
+    """
+
+    def __init__(self, db_path: str = "res_outputs/manifest.sqlite"):
+        self.db_path = db_path
+        self._conn = None
+        self._conn_pid = None
+
+    def __getstate__(self):
+        # Sent to the worker processes without the connection, each opens its own
+        return {"db_path": self.db_path, "_conn": None, "_conn_pid": None}
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            # Autocommit, each checkpoint is durable once recorded
+            self._conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")  # Workers write while the main process reads
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(_SCHEMA)
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def close(self):
+        if self._conn is not None and self._conn_pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+    @staticmethod
+    def _entry(row) -> ManifestEntry:
+        return ManifestEntry(
+            pdf_path=row[0], company=row[1], size=row[2], mtime_ns=row[3], state=row[4], output_path=row[5],
+            blurred_output_path=row[6],
+            info_1st_page=json.loads(row[7]) if row[7] is not None else None,
+            info_nr_plate=json.loads(row[8]) if row[8] is not None else None,
+            error=row[9],
+        )
+
+    def get(self, pdf_path: str) -> Optional[ManifestEntry]:
+        row = self._connection().execute(
+            "SELECT pdf_path, company, size, mtime_ns, state, output_path, blurred_output_path, info_1st_page, "
+            "info_nr_plate, error FROM documents WHERE pdf_path = ?", (pdf_path,)
+        ).fetchone()
+        return self._entry(row) if row is not None else None
+
+    def sync(self, documents: Iterable) -> list:
+        """
+        Record the scanned documents: new ones and changed ones (other size or modification time)
+        are pending, unchanged ones keep their state.
+
+        Args:
+            documents (iterable): ScannedDocument items from `scan_company_dirs`.
+
+        Returns:
+            list: ManifestEntry items in the order of `documents`.
+        """
+        documents = list(documents)
+        conn = self._connection()
+        now = time.time()
+        num_reset = 0
+        conn.execute("BEGIN")
+        try:
+            for doc in documents:
+                row = conn.execute("SELECT size, mtime_ns FROM documents WHERE pdf_path = ?",
+                                   (doc.pdf_path,)).fetchone()
+                if row is not None and tuple(row) == (doc.size, doc.mtime_ns):
+                    continue
+                num_reset += row is not None
+                conn.execute(
+                    "INSERT OR REPLACE INTO documents (pdf_path, company, size, mtime_ns, state, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (doc.pdf_path, doc.company, doc.size, doc.mtime_ns, STATE_PENDING, now),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if num_reset:
+            logger.info(f"{num_reset} changed documents are processed again")
+        return [self.get(doc.pdf_path) for doc in documents]
+
+    def checkpoint(self, pdf_path: str, state: str, **fields):
+        """
+        Record the new state of a document.
+
+        Args:
+            pdf_path (str): Path to the input PDF.
+            state (str): One of the STATE_* constants.
+            **fields: output_path, blurred_output_path, info_1st_page, info_nr_plate or error to record too.
+
+        Returns:
+            None
+        """
+        for name in ("info_1st_page", "info_nr_plate"):
+            if fields.get(name) is not None:
+                fields[name] = json.dumps(fields[name], ensure_ascii=False)
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        self._connection().execute(
+            f"UPDATE documents SET state = ?, updated_at = ?{', ' + columns if columns else ''} WHERE pdf_path = ?",
+            (state, time.time(), *fields.values(), pdf_path),
+        )
+
+    def counts(self) -> dict:
+        """
+        Returns:
+            dict: state -> number of documents.
+        """
+        return dict(self._connection().execute("SELECT state, COUNT(*) FROM documents GROUP BY state").fetchall())
@@ -0,0 +1,204 @@
+import contextlib
+import cProfile
+import datetime
+import functools
+import io
+import json
+import os
+import pstats
+import time
+from collections import defaultdict
+from typing import Optional
+
+from doc_auto.utils_log import setup_logger
+
+logger = setup_logger(__name__)
+
+# Set by `profile_run` so worker processes profile the documents they process too
+PROFILE_DIR_ENV = "DOC_AUTO_PROFILE_DIR"
+_profile_run_pid = None  # Process already profiled as a whole by `profile_run`
+
+
+class Metrics:
+    """
+    Timers and counters of the current process.
+
+    Timers accumulate the total time and the number of calls per name, counters accumulate
+    integers. A snapshot is a plain dict, so it can be sent back from a worker process and
+    merged into the parent's totals.
+    """
+
+    def __init__(self):
+        self.timings = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+
+    @contextlib.contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+            self.calls[name] += 1
+
+    def timed(self, name: str):
+        """
+        Decorator timing every call of the function under `name`.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def incr(self, name: str, value: int = 1):
+        self.counters[name] += value
+
+    def reset(self):
+        self.timings.clear()
+        self.calls.clear()
+        self.counters.clear()
+
+    def snapshot(self) -> dict:
+        """
+        Returns:
+            dict: {"timings": {name: {"total_s", "count"}}, "counters": {name: value}}
+        """
+        return {
+            "timings": {name: {"total_s": round(self.timings[name], 6), "count": self.calls[name]}
+                        for name in self.timings},
+            "counters": dict(self.counters),
+        }
+
+    @contextlib.contextmanager
+    def scope(self):
+        """
+        Record the enclosed code into a separate Metrics, e.g. one document, and add it to these
+        metrics at the end.
+
+        Yields:
+            Metrics: the metrics recorded inside the block.
+        """
+        scoped = Metrics()
+        saved = self.timings, self.calls, self.counters
+        self.timings, self.calls, self.counters = scoped.timings, scoped.calls, scoped.counters
+        try:
+            yield scoped
+        finally:
+            self.timings, self.calls, self.counters = saved
+            self.merge(scoped.snapshot())
+
+    def merge(self, snapshot: dict):
+        """
+        Add a snapshot, e.g. from a worker process, to these metrics.
+        """
+        for name, timing in snapshot.get("timings", {}).items():
+            self.timings[name] += timing["total_s"]
+            self.calls[name] += timing["count"]
+        for name, value in snapshot.get("counters", {}).items():
+            self.counters[name] += value
+
+
+# Process wide metrics, the instrumented functions record into it
+METRICS = Metrics()
+
+
+def timer(name: str):
+    return METRICS.timer(name)
+
+
+def timed(name: str):
+    return METRICS.timed(name)
+
+
+def incr(name: str, value: int = 1):
+    METRICS.incr(name, value)
+
+
+def emit_json_line(file, event: str, **fields):
+    """
+    Write one structured metrics record as a JSON line and flush it.
+
+    Args:
+        file: text file opened for writing.
+        event (str): Record type, e.g. "document" or "run_summary".
+        **fields: JSON serializable content of the record.
+
+    Returns:
+        None
+    """
+    record = {"time": datetime.datetime.now().isoformat(timespec="milliseconds"), "event": event}
+    record.update(fields)
+    file.write(json.dumps(record, ensure_ascii=False) + "\n")
+    file.flush()
+
+
+@contextlib.contextmanager
+def profile_run(output_dir: Optional[str] = None, top_n: int = 25):
+    """
+    Profile the enclosed code with cProfile when `output_dir` is set, otherwise do nothing.
+
+    The parent process is saved to `output_dir/main.prof`. Worker processes started inside the
+    block inherit PROFILE_DIR_ENV and `profile_document` saves one file per document next to it.
+
+    Args:
+        output_dir (str, optional): Directory of the .prof files, None disables profiling.
+        top_n (int): Number of functions by cumulative time to log at the end.
+
+    Returns:
+        None
+    """
+    if not output_dir:
+        yield
+        return
+
+    global _profile_run_pid
+    os.makedirs(output_dir, exist_ok=True)
+    _profile_run_pid = os.getpid()
+    previous_env = os.environ.get(PROFILE_DIR_ENV)
+    os.environ[PROFILE_DIR_ENV] = output_dir
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _profile_run_pid = None
+        if previous_env is None:
+            os.environ.pop(PROFILE_DIR_ENV, None)
+        else:
+            os.environ[PROFILE_DIR_ENV] = previous_env
+
+        profile_path = os.path.join(output_dir, "main.prof")
+        profiler.dump_stats(profile_path)
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(top_n)
+        logger.info(f"Profile saved to {profile_path}\n{stream.getvalue()}")
+
+
+@contextlib.contextmanager
+def profile_document(name: str):
+    """
+    Profile one document in a worker process when PROFILE_DIR_ENV is set, otherwise do nothing.
+
+    Args:
+        name (str): Document name used in the .prof file name.
+
+    Returns:
+        None
+    """
+    output_dir = os.environ.get(PROFILE_DIR_ENV)
+    if not output_dir or os.getpid() == _profile_run_pid:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(os.path.join(output_dir, f"{os.getpid()}_{os.path.basename(name)}.prof"))
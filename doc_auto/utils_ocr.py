@@ -1,98 +1,54 @@
-import pytesseract
-import re
+from typing import Optional
 
+from doc_auto.utils_fields import ExtractionRecord
+from doc_auto.utils_fields import extract_fields
+from doc_auto.utils_metrics import timed
+from doc_auto.utils_ocr_backend import PSM_AUTO
+from doc_auto.utils_ocr_backend import get_ocr_backend
 
-def match_content_by_list_regex(text: str, list_regex: list, num_content_to_remove_space: int = 0):
-    results = []
-    for idx, pattern in enumerate(list_regex):
-        # Find the first match
-        match = re.search(pattern, text, re.DOTALL)
 
-        # Extract and print the content if found
-        if match:
-            content = match.group(1).strip()
-            if num_content_to_remove_space > 0 and num_content_to_remove_space == idx:
-                content = content.replace(" ", "")  # Remove spaces if specified
-                if len(content) == 26:
-                    print("Bank account is correct!")
-                else:
-                    raise ValueError(f"Bank account is wrong! check: {content}")
+@timed("ocr")
+def ocr_image_to_text(image, backend: Optional[str] = None, psm: int = PSM_AUTO) -> str:
+    """
+    Run Tesseract once on the image.
 
-            if len(content) == 0:
-                raise ValueError("Content is empty!")
+    Args:
+        image (PIL.Image.Image): the preprocessed image.
+        backend (str, optional): OCR backend name, None uses the process default (see `get_ocr_backend`).
+        psm (int): Tesseract page segmentation mode. Defaults to PSM_AUTO.
 
-            results.append(content)
-        else:
-            print("No match found")
-    return results
+    Returns:
+        str: the recognized text.
+    """
+    return get_ocr_backend(backend).image_to_string(image, psm=psm)  # Perform OCR
 
 
-def clean_up_item_in_list(list_items: list, string_to_clean: str, new_string: str):
-    list_clean_up = [item.replace(string_to_clean, new_string) for item in list_items]
-    return list_clean_up
+@timed("ocr_layout")
+def ocr_image_to_words(image, backend: Optional[str] = None, psm: int = PSM_AUTO) -> list:
+    """
+    Run Tesseract once on the image and keep the word boxes.
 
+    Args:
+        image (PIL.Image.Image): the preprocessed image.
+        backend (str, optional): OCR backend name, None uses the process default (see `get_ocr_backend`).
+        psm (int): Tesseract page segmentation mode. Defaults to PSM_AUTO.
 
-def extract_important_info_by_ocr(image):
-    text = pytesseract.image_to_string(image, lang='pol')  # Perform OCR
-    # print(text) # Output the extracted text
+    Returns:
+        list: OcrWord of every recognized word, in reading order.
+    """
+    return get_ocr_backend(backend).image_to_data(image, psm=psm)
 
-    # Regular expression to extract the first match
-    company_pattern = r"(\S+)(?=\s*SPÓŁKA Z )"
-    polisy_nr_pattern = r"(?:numer polisy:|Polisa nr)\s*(\d+)\n"
-    company_adres_pattern = r"\n\nadres:\s*(.*?)\n(?:e-mail|\n)"
 
-    payer_info = match_content_by_list_regex(
-        text=text,
-        list_regex=[company_pattern, polisy_nr_pattern, company_adres_pattern],
-        num_content_to_remove_space=0
-    )
-    payer_info[0] = payer_info[0] + " sp. z o.o."
-    payer_info[1] = "Polisa nr " + payer_info[1]
+@timed("regex")
+def extract_fields_from_text(text: str) -> ExtractionRecord:
+    """
+    Extract every field of FIELD_SPECS from the text of the 1st page.
 
-    if len(payer_info) != 3:
-        raise ValueError("The length of payer_info is not 3. It is {}".format(len(payer_info)))
+    Args:
+        text (str): OCR text of the 1st page.
 
-    payment_pattern = r"(?:\n\nPłatności\n\n|:\s*)(.*?)(\nóżnica:|termin płatności:|płatność:)"
-    # payment_pattern = r"(?:\n\nPłatności\n\n|\s*:)([\s\S]*?)(\nóżnica:|termin płatności:)"
-    recipient_text = match_content_by_list_regex(
-        text=text,
-        list_regex=[payment_pattern],
-        num_content_to_remove_space=0
-    )
+    Returns:
+        ExtractionRecord: the fields with their confidence, missing fields are not an error here.
+    """
+    return extract_fields(text)
 
-    recipient_name_pattern = r"\n*\s*odbiorca:\s*(.*?)\n"
-    recipient_adres_pattern = r"SA\n(.*?)\nnr rachunku:"
-    recipient_bank_pattern = r"\nnr rachunku:\s*(.*?)\ntytuł"
-    # pay_amount_pattern = r"(?:kwota:|składka przed zmianą:|składka po zmianie:)\s*(\d+)\s?(?:zł|zl)"
-    pay_amount_pattern = r"(?:kwota:\s*|składka przed zmianą:|składka po zmianie:)\s*([\d\s]+)\s?(?:zł|zl)" # allow for spaces between digits
-
-    recipient_detail_info = match_content_by_list_regex(
-        # text=text,
-        text=recipient_text[0],
-        list_regex=[recipient_name_pattern, recipient_adres_pattern, recipient_bank_pattern, pay_amount_pattern],
-        num_content_to_remove_space=2
-    )
-    if len(recipient_detail_info) != 4:
-        raise ValueError("The length of recipient_detail_info is not 4. It is {}".format(len(recipient_detail_info)))
-
-    results = recipient_detail_info + payer_info
-
-    if len(results) != 7:
-        raise ValueError("The length of results_final is not 7. It is {}".format(len(results)))
-
-    final_results = clean_up_item_in_list(list_items=results, string_to_clean="\n", new_string="")
-    final_results = clean_up_item_in_list(list_items=final_results, string_to_clean="ALEJA", new_string="al")
-
-    return final_results
-
-
-def extract_nr_rejestracyjny_by_ocr(image):
-    text = pytesseract.image_to_string(image, lang='pol')  # Perform OCR
-    # print(text) # Output the extracted text
-    nr_rejestracyjny_pattern = r"\nnr rejestracyjny:\s*(.*?)(\n|\s)"
-    nr_rejestracyjny_info = match_content_by_list_regex(
-        text=text,
-        list_regex=[nr_rejestracyjny_pattern],
-        num_content_to_remove_space=0
-    )
-    return nr_rejestracyjny_info
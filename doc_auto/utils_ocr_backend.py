@@ -0,0 +1,219 @@
+import atexit
+import functools
+import os
+from typing import NamedTuple, Optional
+
+import pytesseract
+
+from doc_auto.utils_log import setup_logger
+from doc_auto.utils_metrics import incr
+from doc_auto.utils_metrics import timer
+
+try:
+    import tesserocr  # Optional, binds libtesseract directly
+except ImportError:
+    tesserocr = None
+
+logger = setup_logger(__name__)
+
+OCR_LANG = "pol"
+# Read by `get_ocr_backend`, so the worker processes use the backend chosen by the parent
+OCR_BACKEND_ENV = "DOC_AUTO_OCR_BACKEND"
+OCR_BACKEND_AUTO = "auto"  # tesserocr when it is installed, pytesseract otherwise
+
+PSM_AUTO = 3  # Fully automatic page segmentation, the tesseract default
+PSM_SINGLE_BLOCK = 6  # One uniform block of text
+PSM_SINGLE_LINE = 7  # One text line
+
+_backends = {}  # Backends of the current process by name, created once
+
+
+class OcrWord(NamedTuple):
+    """
+    One recognized word with its bounding box in image pixels and its position in the layout.
+    """
+    text: str
+    left: int
+    top: int
+    width: int
+    height: int
+    conf: float
+    block_num: int
+    par_num: int
+    line_num: int
+
+
+class PytesseractBackend:
+    """
+    OCR through pytesseract: every call writes the image to a temporary file and runs the
+    `tesseract` executable, which loads the language model again.
+    """
+    name = "pytesseract"
+
+    def __init__(self, lang: str = OCR_LANG):
+        self.lang = lang
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def engine_version() -> str:
+        try:
+            return str(pytesseract.get_tesseract_version())
+        except pytesseract.TesseractNotFoundError:
+            return "not installed"
+
+    def image_to_string(self, image, psm: int = PSM_AUTO) -> str:
+        return pytesseract.image_to_string(image, lang=self.lang, config=f"--psm {psm}")
+
+    def image_to_data(self, image, psm: int = PSM_AUTO) -> list:
+        """
+        Returns:
+            list: OcrWord of every non-empty word, in reading order.
+        """
+        data = pytesseract.image_to_data(image, lang=self.lang, config=f"--psm {psm}",
+                                         output_type=pytesseract.Output.DICT)
+        return [
+            OcrWord(text=data["text"][i], left=data["left"][i], top=data["top"][i], width=data["width"][i],
+                    height=data["height"][i], conf=float(data["conf"][i]), block_num=data["block_num"][i],
+                    par_num=data["par_num"][i], line_num=data["line_num"][i])
+            for i in range(len(data["text"]))
+            if data["level"][i] == 5 and data["text"][i].strip()
+        ]
+
+    def close(self):
+        pass
+
+
+class TesserocrBackend:
+    """
+    OCR through the libtesseract API: the language model is loaded once when the backend is
+    created and the images are passed from memory.
+
+    The engine is not thread safe, use one backend per process (see `get_ocr_backend`).
+    """
+    name = "tesserocr"
+
+    def __init__(self, lang: str = OCR_LANG, tessdata_path: Optional[str] = None):
+        if tesserocr is None:
+            raise ImportError("tesserocr is not installed, use the pytesseract OCR backend")
+        self.lang = lang
+        with timer("ocr_engine_load"):
+            kwargs = {"lang": lang, "psm": tesserocr.PSM.AUTO}  # Same page segmentation as the tesseract CLI
+            if tessdata_path:
+                kwargs["path"] = tessdata_path
+            self.api = tesserocr.PyTessBaseAPI(**kwargs)
+        incr("ocr_engine_loads")
+        logger.debug(f"Tesseract engine loaded in process {os.getpid()}")
+
+    @staticmethod
+    def engine_version() -> str:
+        return tesserocr.tesseract_version().split()[1] if tesserocr is not None else "not installed"
+
+    def image_to_string(self, image, psm: int = PSM_AUTO) -> str:
+        self.api.SetPageSegMode(psm)
+        self.api.SetImage(image)
+        return self.api.GetUTF8Text()
+
+    def image_to_data(self, image, psm: int = PSM_AUTO) -> list:
+        """
+        Returns:
+            list: OcrWord of every non-empty word, in reading order.
+        """
+        self.api.SetPageSegMode(psm)
+        self.api.SetImage(image)
+        self.api.Recognize()
+
+        words = []
+        block_num = par_num = line_num = 0
+        level = tesserocr.RIL.WORD
+        for iterator in tesserocr.iterate_level(self.api.GetIterator(), level):
+            # Numbered from 1 like the tesseract TSV output
+            if iterator.IsAtBeginningOf(tesserocr.RIL.BLOCK):
+                block_num, par_num, line_num = block_num + 1, 0, 0
+            if iterator.IsAtBeginningOf(tesserocr.RIL.PARA):
+                par_num, line_num = par_num + 1, 0
+            if iterator.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                line_num += 1
+            text = iterator.GetUTF8Text(level)
+            box = iterator.BoundingBox(level)
+            if not text or not text.strip() or box is None:
+                continue
+            x0, y0, x1, y1 = box
+            words.append(OcrWord(text=text, left=x0, top=y0, width=x1 - x0, height=y1 - y0,
+                                 conf=iterator.Confidence(level), block_num=block_num, par_num=par_num,
+                                 line_num=line_num))
+        return words
+
+    def close(self):
+        self.api.End()
+
+
+OCR_BACKENDS = {
+    PytesseractBackend.name: PytesseractBackend,
+    TesserocrBackend.name: TesserocrBackend,
+}
+
+
+def resolve_ocr_backend_name(name: Optional[str] = None) -> str:
+    """
+    Args:
+        name (str, optional): Backend name, None uses OCR_BACKEND_ENV and then OCR_BACKEND_AUTO.
+
+    Returns:
+        str: a key of OCR_BACKENDS.
+    """
+    name = name or os.environ.get(OCR_BACKEND_ENV) or OCR_BACKEND_AUTO
+    if name == OCR_BACKEND_AUTO:
+        return TesserocrBackend.name if tesserocr is not None else PytesseractBackend.name
+    if name not in OCR_BACKENDS:
+        raise ValueError(f"Unknown OCR backend: {name}, choose from {[OCR_BACKEND_AUTO] + list(OCR_BACKENDS)}")
+    return name
+
+
+def ocr_backend_version(name: Optional[str] = None) -> str:
+    """
+    Args:
+        name (str, optional): Backend name, None uses OCR_BACKEND_ENV and then OCR_BACKEND_AUTO.
+
+    Returns:
+        str: the resolved backend name, its tesseract version and language, e.g. "tesserocr 5.3.0 pol",
+        without loading the engine.
+    """
+    name = resolve_ocr_backend_name(name)
+    return f"{name} {OCR_BACKENDS[name].engine_version()} {OCR_LANG}"
+
+
+def get_ocr_backend(name: Optional[str] = None):
+    """
+    Return the OCR backend of the current process, created on the first call and reused after.
+
+    Args:
+        name (str, optional): Backend name, None uses OCR_BACKEND_ENV and then OCR_BACKEND_AUTO.
+
+    Returns:
+        PytesseractBackend or TesserocrBackend
+    """
+    name = resolve_ocr_backend_name(name)
+    if name not in _backends:
+        _backends[name] = OCR_BACKENDS[name]()
+    return _backends[name]
+
+
+def set_ocr_backend(name: str):
+    """
+    Choose the default OCR backend of this process and of the worker processes it starts.
+
+    Args:
+        name (str): a key of OCR_BACKENDS or OCR_BACKEND_AUTO.
+
+    Returns:
+        None
+    """
+    resolve_ocr_backend_name(name)  # Fail early on unknown names
+    os.environ[OCR_BACKEND_ENV] = name
+
+
+@atexit.register
+def close_ocr_backends():
+    for backend in _backends.values():
+        backend.close()
+    _backends.clear()
@@ -1,139 +1,664 @@
-from typing import Optional, Union
+from typing import NamedTuple, Optional, Union
+import contextlib
 import os
 import cv2
 import fitz  # PyMuPDF
 import numpy as np
-from PIL import Image, ImageOps
-from PyPDF2 import PdfReader
+from PIL import Image
 
-from doc_auto.utils_img_op import crop_image
+from doc_auto.utils_cache import OcrResultCache
+from doc_auto.utils_cache import hash_page_content
+from doc_auto.utils_debug import get_debug_writer
+from doc_auto.utils_loader import MappedPdf
 from doc_auto.utils_log import setup_logger
-from doc_auto.utils_ocr import extract_important_info_by_ocr
-from doc_auto.utils_ocr import extract_nr_rejestracyjny_by_ocr
+from doc_auto.utils_metrics import incr
+from doc_auto.utils_metrics import timed
+from doc_auto.utils_metrics import timer
+from doc_auto.utils_fields import ExtractionRecord
+from doc_auto.utils_fields import field_specs_fingerprint
+from doc_auto.utils_ocr import extract_fields_from_text
+from doc_auto.utils_ocr import ocr_image_to_text
+from doc_auto.utils_ocr import ocr_image_to_words
+from doc_auto.utils_ocr_backend import ocr_backend_version
+from doc_auto.utils_preprocess import OCR_DEFAULT_PRESET
+from doc_auto.utils_preprocess import OCR_PRESET_ORDER
+from doc_auto.utils_preprocess import order_presets
+from doc_auto.utils_preprocess import preprocess_for_ocr
+from doc_auto.utils_preprocess import record_preset_success
+from doc_auto.utils_roi import detect_roi_regions
+from doc_auto.utils_roi import load_roi_template
+from doc_auto.utils_roi import ocr_regions
+from doc_auto.utils_roi import roi_template_cache_key
+from doc_auto.utils_roi import save_roi_template
+from doc_auto.utils_roi import words_to_text
 
 logger = setup_logger(__name__)
 
+BLANK_WHITE_LEVEL = 250  # Gray level above which a pixel counts as near-white
+# Resolution of the page renderings of the blank detection, the default page pixmap one. The threshold
+# is calibrated at 72 dpi RGB, keep the batched and the page by page detection in sync
+BLANK_DETECTION_DPI = 72
+OCR_ZOOM = 2.0  # Zoom factor used to render the 1st page for OCR
+OCR_TOP_CROP = 580
+OCR_RIGHT_CROP = 50
+OCR_BOTTOM_CROP = 500
+OCR_START_LEFT_CROP_X = 40  # Initial value for left crop X
+OCR_MAX_CROP_ATTEMPTS = 60  # Number of left crops X searched, from OCR_START_LEFT_CROP_X on
 
-def identify_empty_pages(pdf_path: str):
-    reader = PdfReader(pdf_path)
+
+def identify_empty_pages(pdf_path: Optional[str] = None, mapped_pdf: Optional[MappedPdf] = None):
     empty_pages = []
+    with MappedPdf(pdf_path) if mapped_pdf is None else contextlib.nullcontext(mapped_pdf) as source:
+        reader = source.pdf_reader()
 
-    for i, page in enumerate(reader.pages):
-        # Extracts the text content of each page.
-        text = page.extract_text()
-        # Removes any leading or trailing whitespace to detect genuinely empty pages.
-        if not text or text.strip() == "":
-            # Adds the page number (1-indexed) to the result list.
-            empty_pages.append(i + 1)  # Page numbers start from 1
+        for i, page in enumerate(reader.pages):
+            # Extracts the text content of each page.
+            text = page.extract_text()
+            # Removes any leading or trailing whitespace to detect genuinely empty pages.
+            if not text or text.strip() == "":
+                # Adds the page number (1-indexed) to the result list.
+                empty_pages.append(i + 1)  # Page numbers start from 1
 
     return empty_pages
 
 
-def identify_blank_pages(pdf_path: Optional[str] = None, document: Optional[fitz.Document] = None,
-                         threshold=0.99) -> Union[int, None, list]:
+def _is_page_trivially_blank(page: fitz.Page) -> bool:
     """
-    Identify blank pages in a PDF by analyzing rendered content.
+    A page without drawing operators, images or annotations renders fully white.
+    """
+    return (not page.read_contents().strip()
+            and not page.get_images()
+            and page.first_annot is None
+            and page.first_widget is None)
+
+
+def _is_page_rendered_blank(page: fitz.Page, threshold: float, dpi: int, white_level: int,
+                            rows_per_chunk: int = 64) -> bool:
+    """
+    Render the page in RGB and count non-white pixels with integer math, stopping as soon as
+    the page can no longer reach the white fraction `threshold`.
+
+    A pixel is near-white when the mean of its channels is above `white_level`, i.e. the sum of
+    its channels is above 3 * `white_level`, the same test as on the mean of the RGB pixmap.
+    """
+    pix = page.get_pixmap(dpi=dpi, alpha=False)
+    rgb_img = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width * pix.n]
+    rgb_img = rgb_img.reshape(pix.height, pix.width, pix.n)
+
+    total_pixels = pix.height * pix.width
+    non_white_pixels = 0
+    for row in range(0, pix.height, rows_per_chunk):
+        channel_sums = rgb_img[row:row + rows_per_chunk].sum(axis=2, dtype=np.uint16)
+        non_white_pixels += int(np.count_nonzero(channel_sums <= 3 * white_level))
+        if (total_pixels - non_white_pixels) / total_pixels <= threshold:
+            return False  # Non-white budget exceeded, the rest of the page does not matter
+    return (total_pixels - non_white_pixels) / total_pixels > threshold
+
+
+class PageInkFeatures(NamedTuple):
+    """
+    Ink measures of one rendered page.
+
+    Attributes:
+        page_number (int): 1-based page number.
+        white_fraction (float): Fraction of near-white pixels.
+        ink_density (float): Mean darkness, 0 for a white page, 1 for a black one.
+        ink_top (float, optional): Top of the inked rows, as a fraction of the page height, None if blank.
+        ink_bottom (float, optional): Bottom of the inked rows, as a fraction of the page height, None if blank.
+    """
+    page_number: int
+    white_fraction: float
+    ink_density: float
+    ink_top: Optional[float]
+    ink_bottom: Optional[float]
+
+
+@timed("page_renders")
+def render_page_channel_sums(doc: fitz.Document, dpi: int = BLANK_DETECTION_DPI):
+    """
+    Render every page in RGB at full `dpi`, as the page by page detection does, and stack the sums
+    of the channels of their pixels in one array, padded with white to the largest page. Pages that
+    draw nothing are left white without rendering.
 
     Args:
-        pdf_path (str): Path to the PDF file.
-        threshold (float): Fraction of white pixels to classify as blank. Default is 0.99.
+        doc (fitz.Document): the PDF document.
+        dpi (int): Render resolution. Defaults to BLANK_DETECTION_DPI, the resolution of the default page pixmap.
 
     Returns:
-        list: List of 1-based page numbers that are blank.
+        tuple: (uint16 array of shape (pages, height, width), int array of the (height, width) of each page).
     """
-    blank_pages = []
-    if document is None:
-        doc = fitz.open(pdf_path)
-    else:
-        doc = document
-
+    page_irects = [(doc[page_number].rect * fitz.Matrix(dpi / 72, dpi / 72)).irect for page_number in range(len(doc))]
+    page_sizes = np.array([(irect.height, irect.width) for irect in page_irects], dtype=np.int64).reshape(-1, 2)
+    height, width = page_sizes.max(axis=0) if len(doc) else (0, 0)
+    channel_sums = np.full((len(doc), height, width), 3 * 255, dtype=np.uint16)
     for page_number in range(len(doc)):
         page = doc[page_number]
-        pix = page.get_pixmap()  # Render the page as an image
-        img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        if _is_page_trivially_blank(page):
+            continue
+        pix = page.get_pixmap(dpi=dpi, alpha=False)
+        rgb_img = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width * pix.n]
+        page_sizes[page_number] = (pix.height, pix.width)
+        rgb_img.reshape(pix.height, pix.width, pix.n).sum(axis=2, dtype=np.uint16,
+                                                          out=channel_sums[page_number, :pix.height, :pix.width])
+    return channel_sums, page_sizes
+
+
+def page_ink_features(doc: fitz.Document, dpi: int = BLANK_DETECTION_DPI,
+                      white_level: int = BLANK_WHITE_LEVEL) -> list:
+    """
+    Measure the ink of every page at once, from the stacked renderings.
 
-        # Convert to grayscale
-        if img.shape[2] == 4:  # RGBA
-            img = img[:, :, :3]  # Drop alpha channel
-        gray_img = np.mean(img, axis=2)
+    A pixel is near-white when the mean of its channels is above `white_level`, as in the per page
+    detection of `identify_blank_pages`, so both give the same white fractions.
 
-        # Calculate the proportion of near-white pixels
-        white_pixels = np.sum(gray_img > 250)  # Threshold for near-white
-        total_pixels = gray_img.size
-        white_fraction = white_pixels / total_pixels
+    Args:
+        doc (fitz.Document): the PDF document.
+        dpi (int): Render resolution. Defaults to BLANK_DETECTION_DPI.
+        white_level (int): Gray level above which a pixel counts as near-white.
 
-        if white_fraction > threshold:
-            blank_pages.append(page_number + 1)  # Page numbers are 1-based
+    Returns:
+        list: PageInkFeatures of each page, in page order.
+    """
+    channel_sums, page_sizes = render_page_channel_sums(doc, dpi=dpi)
+    if not len(channel_sums):
+        return []
+    num_pages, height, _ = channel_sums.shape
+    # The white padding of smaller pages has no ink and no darkness
+    ink = channel_sums <= 3 * white_level  # (pages, height, width)
+    num_pixels = page_sizes.prod(axis=1)
+    white_fractions = (num_pixels - ink.sum(axis=(1, 2))) / num_pixels
+    ink_densities = (3 * 255 - channel_sums).sum(axis=(1, 2), dtype=np.int64) / (3 * 255 * num_pixels)
+    inked_rows = ink.any(axis=2)  # (pages, height)
+    has_ink = inked_rows.any(axis=1)
+    tops = inked_rows.argmax(axis=1) / page_sizes[:, 0]
+    bottoms = (height - inked_rows[:, ::-1].argmax(axis=1)) / page_sizes[:, 0]
+
+    return [
+        PageInkFeatures(
+            page_number=page_number + 1,
+            white_fraction=float(white_fractions[page_number]),
+            ink_density=float(ink_densities[page_number]),
+            ink_top=float(tops[page_number]) if has_ink[page_number] else None,
+            ink_bottom=float(bottoms[page_number]) if has_ink[page_number] else None,
+        )
+        for page_number in range(num_pages)
+    ]
+
+
+@timed("blank_pages")
+def identify_blank_pages(pdf_path: Optional[str] = None, document: Optional[fitz.Document] = None,
+                         threshold=0.99, dpi: int = BLANK_DETECTION_DPI, batched: bool = True,
+                         page_features: Optional[list] = None) -> list:
+    """
+    Identify blank pages in a PDF by analyzing rendered content.
+
+    By default every page is rendered in RGB at `dpi` (see `page_ink_features`) and the white
+    fractions of all pages come from one reduction over the stacked renderings. The renderings are
+    the same as page by page, only the per page counting and its early exit are replaced.
+
+    With `batched=False`, pages are checked one at a time: a page with an empty content stream and
+    no images or annotations is blank without rendering, every other page is rendered in RGB at
+    `dpi` and its near-white pixels are counted, stopping once the page cannot be blank.
+
+    Args:
+        pdf_path (str): Path to the PDF file.
+        document (fitz.Document, optional): Already opened PDF document, used instead of pdf_path.
+        threshold (float): Fraction of white pixels to classify as blank. Default is 0.99.
+        dpi (int): Render resolution. Default is 72, the resolution of the default page pixmap.
+        batched (bool): Classify every page from the stacked renderings in one pass, with the same
+                        result as page by page. Default is True.
+        page_features (list, optional): PageInkFeatures of the document already measured, implies `batched`.
+
+    Returns:
+        list: 1-based numbers of the blank pages, empty if there is none.
+    """
+    with contextlib.ExitStack() as stack:
+        if document is None:
+            # Closed when done, with the mapping
+            doc = stack.enter_context(MappedPdf(pdf_path)).open_document()
+        else:
+            doc = document
+
+        if batched or page_features is not None:
+            if page_features is None:
+                page_features = page_ink_features(doc, dpi=dpi)
+            blank_pages = [features.page_number for features in page_features
+                           if features.white_fraction > threshold]
+        else:
+            blank_pages = []
+            for page_number in range(len(doc)):
+                page = doc[page_number]
+                if _is_page_trivially_blank(page):
+                    is_blank = True
+                else:
+                    is_blank = _is_page_rendered_blank(page, threshold=threshold, dpi=dpi,
+                                                       white_level=BLANK_WHITE_LEVEL)
+
+                if is_blank:
+                    blank_pages.append(page_number + 1)  # Page numbers are 1-based
 
     if blank_pages:
         logger.info(f"Blank pages found: {blank_pages}")
-        if len(blank_pages) == 1:
-            return blank_pages[0]
-        else:
-            return blank_pages
     else:
         logger.warning("No blank pages found.")
-        return None
+    return blank_pages
 
 
-def extract_info_from_page_by_ocr(doc: fitz.Document, left_crop_x: Union[int, float]):
-    page_number = 0
-    page = doc[page_number]
-
-    zoom_x = 2.0  # Horizontal zoom factor
-    zoom_y = 2.0  # Vertical zoom factor
-    matrix = fitz.Matrix(zoom_x, zoom_y)  # Scale the resolution
-    pix = page.get_pixmap(matrix=matrix)  # Render the page with higher resolution
-
-    # Convert pixmap to PIL Image
-    image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-    # Crop the image
-    cropped_img = crop_image(
-        img=image,
-        left_crop=left_crop_x,
-        top_crop=580,
-        right_crop=50,
-        bottom_crop=500
-    )
+def old_identify_insert_page_according_blank_page(blank_pages: list, num_doc_pages: int,
+                                                  page_features: Optional[list] = None):
+    """
+    Choose the page to sign from the blank pages: the page after a blank 3rd page, the page before
+    a blank 4th page, the last page when there is no blank page.
+
+    Args:
+        blank_pages (list): 1-based blank page numbers from `identify_blank_pages`.
+        num_doc_pages (int): Number of pages of the document.
+        page_features (list, optional): PageInkFeatures of the pages. When no rule applies (e.g. several
+                                        blank pages), the inked page with the lowest ink bottom, i.e. the
+                                        most free space left for the stamp, is chosen.
+
+    Returns:
+        list: the 1-based page number to sign.
+
+    Raises:
+        ValueError: If no rule applies and no page features are given.
+    """
+    target_page_number = None
+
+    if blank_pages == [3]:
+        target_page_number = 4
+    if blank_pages == [4]:
+        target_page_number = 3
+    if not blank_pages:
+        target_page_number = num_doc_pages
+
+    if target_page_number is None and page_features:
+        inked_pages = [features for features in page_features
+                       if features.page_number not in blank_pages and features.ink_bottom is not None]
+        if inked_pages:
+            target_page_number = min(inked_pages, key=lambda features: features.ink_bottom).page_number
+
+    if target_page_number is None:
+        raise ValueError("target_page_number cannot be None")
+
+    return [target_page_number]
+
+
+class RenderedPage:
+    """
+    A PDF page rendered once for OCR, so the crop-retry loop can crop from it without re-rendering.
+
+    The page is rendered directly in grayscale and only inside the area every OCR crop lies in
+    (see `ocr_render_rect`), the crops are views of the rendering and the preprocessed crops are
+    written into a buffer reused across crops and documents of the process.
+
+    Args:
+        doc (fitz.Document): the input PDF document.
+        page_number (int): Page number to render (0-based index). Defaults to 0.
+        zoom (float): Zoom factor applied to both axes. Defaults to OCR_ZOOM.
+
+    Attributes:
+        zoom (float): Zoom factor of the rendering.
+        pix (fitz.Pixmap): the rendered area of the page.
+        origin (tuple): (x, y) of the rendered area in the pixels of the full page rendering.
+        page_size (tuple): (width, height) of the full page rendering in pixels.
+        gray (np.ndarray): uint8 grayscale view of `pix`, shape (height, width).
+    """
+
+    def __init__(self, doc: fitz.Document, page_number: int = 0, zoom: float = OCR_ZOOM):
+        page = doc[page_number]
+        self.zoom = zoom
+        matrix = fitz.Matrix(zoom, zoom)  # Scale the resolution
+        page_irect = (page.rect * matrix).irect
+        self.page_size = (page_irect.width, page_irect.height)
+        with timer("render"):
+            # Render the page with higher resolution
+            self.pix = page.get_pixmap(matrix=matrix, clip=ocr_render_rect(page, zoom=zoom),
+                                       colorspace=fitz.csGRAY, alpha=False)
+        self.origin = (self.pix.x - page_irect.x0, self.pix.y - page_irect.y0)
+        samples = np.frombuffer(self.pix.samples_mv, dtype=np.uint8)
+        self.gray = samples.reshape(self.pix.height, self.pix.stride)[:, :self.pix.width]
+
+    @timed("preprocess")
+    def crop_for_ocr(self, left_crop_x: Union[int, float], preset: str = OCR_DEFAULT_PRESET):
+        """
+        Crop the grayscale page and preprocess it for OCR.
+
+        Args:
+            left_crop_x (int or float): Pixels to crop from the left.
+            preset (str): Preprocessing preset, key of OCR_PRESETS. Defaults to the autocontrast only.
+
+        Returns:
+            PIL.Image.Image: preprocessed grayscale crop, valid until the next call in this process.
+        """
+        page_width, page_height = self.page_size
+        x0, y0 = round(left_crop_x) - self.origin[0], OCR_TOP_CROP - self.origin[1]
+        x1, y1 = page_width - OCR_RIGHT_CROP - self.origin[0], page_height - OCR_BOTTOM_CROP - self.origin[1]
+        cropped = self.gray[max(0, y0):y1, max(0, x0):x1]
+        return Image.fromarray(preprocess_for_ocr(cropped, dpi=72 * self.zoom, preset=preset))
+
+
+def extract_record_from_page_by_ocr(doc: fitz.Document, left_crop_x: Union[int, float],
+                                    rendered_page: Optional[RenderedPage] = None,
+                                    debug_name: Optional[str] = None, attempt: int = 0,
+                                    preset: str = OCR_DEFAULT_PRESET) -> ExtractionRecord:
+    if rendered_page is None:
+        rendered_page = RenderedPage(doc=doc, page_number=0)
+
     # image = image.resize((image.width * 2, image.height * 2))  # Resize to improve OCR accuracy
-    image = ImageOps.grayscale(cropped_img)  # Convert to grayscale
-    image = ImageOps.autocontrast(image)  # Improve contrast
+    image = rendered_page.crop_for_ocr(left_crop_x=left_crop_x, preset=preset)
     # image = image.point(lambda x: 0 if x < 210 else 255, '1')  # Binarize (thresholding)
 
     # Display the image using Pillow
     # image.show()
 
-    ocr_save_dir = 'res_output_ocr'
-    if not os.path.exists(ocr_save_dir):
-        os.makedirs(ocr_save_dir, exist_ok=True)
-    image.save(os.path.join(ocr_save_dir, 'preprocessed_image.jpg'))
-    pdf_ocr_info = extract_important_info_by_ocr(image=image)
-    pdf_nr_rejestracyjny_info = extract_nr_rejestracyjny_by_ocr(image=image)
-    return pdf_ocr_info, pdf_nr_rejestracyjny_info
+    record = extract_fields_from_text(ocr_image_to_text(image))
+    # Off by default, see `set_debug_artifacts`
+    debug_writer = get_debug_writer()
+    if debug_writer is not None:
+        debug_writer.submit(document_name=debug_name or doc.name or "document", attempt=attempt, image=image,
+                            ok=record.ok, tag=preset)
+    return record
 
 
-def save_single_page(pdf_doc: fitz.Document, page_number, output_path):
+class RoiDetectionError(ValueError):
     """
-    Save a single specified page from a PDF document to a new PDF file.
+    The layout pass of `extract_record_by_roi` ran but did not find the regions.
+
+    Attributes:
+        record (ExtractionRecord): fields extracted from the text of the layout pass, merged with the
+                                   ones the template found, so the crop search does not OCR them again.
+    """
+
+    def __init__(self, message: str, record: ExtractionRecord):
+        super().__init__(message)
+        self.record = record
+
+
+def extract_record_by_roi(rendered_page: RenderedPage, roi_key: str, left_crop_x: Union[int, float],
+                          cache: Optional[OcrResultCache] = None) -> ExtractionRecord:
+    """
+    Extract the 1st page information by OCR of the payer, plate and payment regions only.
+
+    The regions come from the template of `roi_key` (e.g. the insurer), learnt by a layout pass
+    over the OCR crop of a previous document. Without a template, or when fields are missing with
+    the template, the layout pass runs on this document with the default preset: its text completes
+    the extraction and, when every field was found in it, its regions become the new template.
+
+    Args:
+        rendered_page (RenderedPage): the rendered 1st page.
+        roi_key (str): Documents sharing this key share the layout, e.g. the insurer name.
+        left_crop_x (int or float): Left crop of the layout pass.
+        cache (OcrResultCache, optional): also stores the templates, shared by the worker processes.
+
+    Returns:
+        ExtractionRecord: possibly with missing fields, only when the layout pass ran.
+
+    Raises:
+        RoiDetectionError: If the layout pass does not find the regions, with the fields it found.
+    """
+    template_key = roi_template_cache_key(roi_key, params=ocr_cache_params())
+    regions = load_roi_template(template_key, cache=cache)
+    record = None
+    if regions is not None:
+        try:
+            record = extract_fields_from_text(
+                ocr_regions(rendered_page.gray, regions, zoom=rendered_page.zoom, origin=rendered_page.origin)
+            )
+        except ValueError as e:
+            logger.debug(f"ROI template of {roi_key} does not fit: {e}")
+        if record is not None and record.ok:
+            incr("roi_template_hits")
+            return record
+        incr("roi_template_misses")
+        logger.debug(f"ROI template of {roi_key} misses {record.missing if record else 'all'} fields, "
+                     f"detecting the regions again")
+
+    image = rendered_page.crop_for_ocr(left_crop_x=left_crop_x, preset=OCR_DEFAULT_PRESET)
+    words = ocr_image_to_words(image)
+    detected_record = extract_fields_from_text(words_to_text(words))
+    if record is not None:
+        detected_record = record.merge(detected_record)
+    try:
+        regions = detect_roi_regions(words, origin=(left_crop_x, OCR_TOP_CROP), zoom=rendered_page.zoom)
+    except ValueError as e:
+        raise RoiDetectionError(str(e), record=detected_record) from e
+    if detected_record.ok:
+        # A layout missing fields would make a template missing them for every later document
+        save_roi_template(template_key, regions, cache=cache)
+    incr("roi_detections")
+    return detected_record
+
+
+def ocr_render_rect(page: fitz.Page, zoom: float = OCR_ZOOM) -> fitz.Rect:
+    """
+    Area of the page `RenderedPage` renders: the OCR crop with no left crop, so every left crop of
+    the crop search and the ROI regions detected in it lie inside.
+    """
+    return ocr_crop_rect(page, left_crop_x=0, zoom=zoom)
+
+
+def ocr_crop_rect(page: fitz.Page, left_crop_x: Union[int, float], zoom: float = OCR_ZOOM) -> fitz.Rect:
+    """
+    Area of the OCR crop (see `RenderedPage.crop_for_ocr`) in page points.
+    """
+    rect = page.rect
+    return fitz.Rect(
+        rect.x0 + left_crop_x / zoom,
+        rect.y0 + OCR_TOP_CROP / zoom,
+        rect.x1 - OCR_RIGHT_CROP / zoom,
+        rect.y1 - OCR_BOTTOM_CROP / zoom,
+    )
+
+
+@timed("text_layer")
+def extract_text_layer(page: fitz.Page, clip: Optional[fitz.Rect] = None) -> str:
+    """
+    Text of the embedded text layer, laid out like the OCR text: lines separated by a newline and
+    text blocks by an empty line, in reading order.
+
+    Args:
+        page (fitz.Page): the PDF page.
+        clip (fitz.Rect, optional): only the text inside this area.
+
+    Returns:
+        str: the text, empty for scanned pages without a text layer.
+    """
+    blocks = page.get_text("blocks", clip=clip, sort=True)
+    block_texts = [block[4].strip() for block in blocks if block[6] == 0 and block[4].strip()]  # Text blocks only
+    return "\n\n".join(block_texts) + "\n" if block_texts else ""
+
+
+def extract_record_from_text_layer(doc: fitz.Document,
+                                   left_crop_x: Union[int, float] = OCR_START_LEFT_CROP_X) -> Optional[ExtractionRecord]:
+    """
+    Extract the 1st page information from the embedded text layer of digitally generated PDFs,
+    reading the same area and running the same field extraction as the OCR.
+
+    Args:
+        doc (fitz.Document): the input PDF document.
+        left_crop_x (int or float): Left crop of the area, in OCR pixels. Defaults to 40.
+
+    Returns:
+        ExtractionRecord or None: possibly with missing fields, None if there is no text layer.
+    """
+    page = doc[0]
+    text = extract_text_layer(page, clip=ocr_crop_rect(page, left_crop_x=left_crop_x))
+    if not text:
+        return None
+    return extract_fields_from_text(text)
+
+
+def ocr_cache_params(use_roi: bool = False, presets: tuple = (OCR_DEFAULT_PRESET,)) -> dict:
+    """
+    Parameters the result of `extract_info_with_crop_search` depends on, used in its cache key.
+    The left crop is not one of them: the search start changes as it is learnt, the cached entry
+    keeps the left crop that produced the result. The OCR backend and the field specs are, so a
+    cached result is not reused after a switch of backend or a change of the field regexes.
+    """
+    return {
+        "zoom": OCR_ZOOM,
+        "top_crop": OCR_TOP_CROP,
+        "right_crop": OCR_RIGHT_CROP,
+        "bottom_crop": OCR_BOTTOM_CROP,
+        "preprocess": "gray_render+" + "|".join(presets),
+        "roi": use_roi,
+        "ocr_backend": ocr_backend_version(),
+        "fields": field_specs_fingerprint(),
+    }
+
+
+def extract_info_with_crop_search(
+        doc: fitz.Document,
+        start_left_crop_x: Union[int, float] = OCR_START_LEFT_CROP_X,
+        max_attempts: int = OCR_MAX_CROP_ATTEMPTS,
+        cache: Optional[OcrResultCache] = None,
+        roi_key: Optional[str] = None,
+        use_text_layer: bool = True,
+        debug_name: Optional[str] = None,
+        presets: tuple = OCR_PRESET_ORDER,
+):
+    """
+    Extract the 1st page information by OCR, shifting the left crop until extraction succeeds.
+
+    Digitally generated PDFs are read from their text layer first (see
+    `extract_record_from_text_layer`), OCR only runs when it is missing or fields are not found.
+    Every source only has to find the fields the previous ones missed.
+
+    The page is rendered once and every attempt crops from the same rendering. The first crop is
+    preprocessed with each preset in turn, cheapest first, then the other left crops of the search
+    range (`max_attempts` crops from OCR_START_LEFT_CROP_X on) are tried with the first preset,
+    nearest to the start first, on both sides of it. A learnt start thus finds most documents in
+    a few attempts, and the ones needing a smaller or larger crop are still found. The preset that
+    succeeded last for the `roi_key` is tried first (see `order_presets`).
+    With a cache, a page whose content and crop parameters were already OCR'd is not OCR'd again.
+    With a `roi_key`, only the regions of the layout template are OCR'd first (see
+    `extract_record_by_roi`), and the crop search is the fallback: it keeps the fields of the layout
+    pass and skips the crop and preset the layout pass already OCR'd.
+
+    Args:
+        doc (fitz.Document): the input PDF document.
+        start_left_crop_x (int or float): Left crop of the first attempt, e.g. the one learnt for the
+                                          company. Defaults to OCR_START_LEFT_CROP_X.
+        max_attempts (int): Number of left crops of the search range. Defaults to OCR_MAX_CROP_ATTEMPTS.
+        cache (OcrResultCache, optional): cache of previous OCR results.
+        roi_key (str, optional): Layout template key, e.g. the insurer name. None OCRs the full crop.
+        use_text_layer (bool): Try the embedded text layer before OCR. Defaults to True.
+        debug_name (str, optional): Document name of the debug images. Defaults to the document's file name.
+        presets (tuple): Preprocessing presets to try, keys of OCR_PRESETS. Defaults to OCR_PRESET_ORDER.
+
+    Returns:
+        tuple: (info_1st_page, info_nr_plate, num_attempts, left_crop_x), num_attempts is 0 when no
+        OCR ran (text layer or cache hit), left_crop_x is the left crop OCR succeeded with, None for
+        the text layer.
+
+    Raises:
+        ValueError: If no attempt succeeded, or `max_attempts` is below 1.
+    """
+    if max_attempts < 1:
+        raise ValueError(f"max_attempts must be at least 1, got {max_attempts}")
+    if not presets:
+        raise ValueError("At least one preprocessing preset is needed")
+
+    record = None
+    if use_text_layer:
+        record = extract_record_from_text_layer(doc=doc, left_crop_x=start_left_crop_x)
+        if record is not None and record.ok:
+            incr("text_layer_hits")
+            return record.important_info(), record.nr_plate(), 0, None
+        incr("text_layer_misses")
+        logger.debug(f"Text layer not usable ({record.missing if record else 'no text'}), falling back to OCR")
+
+    cache_key = None
+    if cache is not None:
+        cache_key = hash_page_content(
+            doc=doc, page_number=0,
+            params=ocr_cache_params(use_roi=roi_key is not None, presets=tuple(presets))
+        )
+        entry = cache.get(cache_key)
+        if entry is not None:
+            logger.debug(f"OCR cache hit: {cache_key}")
+            incr("ocr_cache_hits")
+            return entry["info_1st_page"], entry["info_nr_plate"], 0, entry.get("left_crop_x")
+
+        incr("ocr_cache_misses")
+
+    rendered_page = RenderedPage(doc=doc, page_number=0)
+
+    def merge(new_record: ExtractionRecord) -> ExtractionRecord:
+        return new_record if record is None else record.merge(new_record)
+
+    def cache_result(left_crop_x, preset=None):
+        if cache is not None:
+            cache.put(cache_key, {
+                "info_1st_page": record.important_info(),
+                "info_nr_plate": record.nr_plate(),
+                "left_crop_x": left_crop_x,
+                "preset": preset,
+            })
+
+    layout_pass = None  # (left crop, preset) already OCR'd in full by the layout pass of the ROI
+    if roi_key is not None:
+        try:
+            record = merge(extract_record_by_roi(
+                rendered_page=rendered_page, roi_key=roi_key, left_crop_x=start_left_crop_x, cache=cache
+            ))
+        except RoiDetectionError as e:
+            logger.debug(f"ROI detection failed: {e}")
+            record = merge(e.record)
+        if record is not None and not record.ok:
+            layout_pass = (start_left_crop_x, OCR_DEFAULT_PRESET)
+        if record is not None and record.ok:
+            cache_result(start_left_crop_x)
+            return record.important_info(), record.nr_plate(), 1, start_left_crop_x
+        incr("roi_fallbacks")
+        logger.debug("ROI OCR incomplete, falling back to the full crop")
+
+    # Every preset on the first crop, then the crop search with the preferred one, outwards from the start
+    presets = order_presets(presets, key=roi_key)
+    crop_range = range(OCR_START_LEFT_CROP_X, OCR_START_LEFT_CROP_X + max_attempts)
+    left_crop_xs = sorted((x for x in crop_range if x != start_left_crop_x),
+                          key=lambda x: (abs(x - start_left_crop_x), x))
+    plan = [(start_left_crop_x, preset) for preset in presets]
+    plan += [(left_crop_x, presets[0]) for left_crop_x in left_crop_xs]
+    plan = [step for step in plan if step != layout_pass]
+
+    # Fields found by an attempt are kept, later attempts only have to find the missing ones
+    for attempt, (left_crop_x, preset) in enumerate(plan, start=1 if layout_pass else 0):
+        # Attempt to extract OCR information
+        record = merge(extract_record_from_page_by_ocr(doc=doc, left_crop_x=left_crop_x, rendered_page=rendered_page,
+                                                       debug_name=debug_name, attempt=attempt, preset=preset))
+        if record.ok:
+            record_preset_success(preset, key=roi_key)
+            incr(f"ocr_preset_{preset}")
+            cache_result(left_crop_x, preset=preset)
+            return record.important_info(), record.nr_plate(), attempt + 1, left_crop_x
+        incr("ocr_retries")
+        logger.debug(f"Fields not found with {preset} at left_crop_x {left_crop_x}: {record.missing}")
+
+    tried_xs = [left_crop_x for left_crop_x, _ in plan + ([layout_pass] if layout_pass else [])]
+    raise ValueError(f"OCR failed after {len(tried_xs)} attempts "
+                     f"(presets {list(presets)}, left_crop_x {min(tried_xs)}..{max(tried_xs)}), "
+                     f"fields not found: {record.missing if record is not None else 'all'}")
+
+
+def single_page_document(pdf_doc: fitz.Document, page_number) -> fitz.Document:
+    """
+    Copy a single page of a PDF document to a new in-memory document.
 
     Args:
         pdf_doc (fitz.Document): the input PDF document.
-        page_number (int): Page number to save (0-based index).
-        output_path (str): Path to save the new PDF containing the single page.
+        page_number (int): Page number to copy (0-based index).
 
     Returns:
-        None
+        fitz.Document: the new document, to be closed by the caller.
     """
     # Create a new empty PDF
     new_pdf = fitz.open()
 
     # Insert the specified page into the new PDF
     new_pdf.insert_pdf(pdf_doc, from_page=page_number, to_page=page_number)
-
-    # Save the new PDF
-    new_pdf.save(output_path)
-    new_pdf.close()
-    pdf_doc.close()
+    return new_pdf
 
 
 def validate_coordinates(rect_x0, rect_y0, rect_x1, rect_y1, page_width, page_height):
@@ -143,41 +668,27 @@ def validate_coordinates(rect_x0, rect_y0, rect_x1, rect_y1, page_width, page_he
         raise ValueError("Rectangle Y-coordinates exceed page height")
 
 
-def add_white_rectangle_to_page(
-        pdf_doc: fitz.Document,
-        info_1st_page: list,
-        info_nr_plate: str,
-        idx_pdf_to_process: int,
+@timed("redact")
+def draw_white_rectangle(
+        page: fitz.Page,
         rect_x0, rect_y0, rect_x1, rect_y1,
         color: tuple = (1, 1, 1),
-        page_number: int = 0
 ):
     """
-    Adds a white rectangle to a specified location on a PDF document.
+    Draw a filled rectangle without border on the page.
 
     Args:
-        pdf_doc (fitz.Document): the input PDF document.
-        info_1st_page (list): List of important information extracted from the first page.
-        info_nr_plate (str): info_nr_plate from the first page.
-        idx_pdf_to_process (int): Current index number of pdf file to process.
+        page (fitz.Page): the page to modify.
         rect_x0 (float): X-coordinate of the top-left corner of the rectangle.
         rect_y0 (float): Y-coordinate of the top-left corner of the rectangle.
         rect_x1 (float): X-coordinate of the bottom-right corner of the rectangle.
         rect_y1 (float): Y-coordinate of the bottom-right corner of the rectangle.
         color (tuple): RGB color of the rectangle (values between 0 and 1).
-        page_number (int, optional): Page number to modify (0-based index). Defaults to 0.
 
     Returns:
         None
     """
-    # Open the PDF document
-    pdf_document = fitz.open(pdf_doc)
-
-    # Get the specified page
-    page = pdf_document[page_number]
     page_width, page_height = page.rect.width, page.rect.height
-
-    # Create a rectangle object
     validate_coordinates(rect_x0, rect_y0, rect_x1, rect_y1, page_width, page_height)
     # Create a rectangle object
     rect = fitz.Rect(rect_x0, rect_y0, rect_x1, rect_y1)
@@ -188,17 +699,71 @@ def add_white_rectangle_to_page(
     shape.finish(fill=color, color=None)  # Fill with color, no border
     shape.commit()  # Commit to the page
 
-    save_out_dir = "res_outputs_blurred"
-    # Save the modified PDF
+
+def blurred_output_path(info_1st_page: Optional[list], info_nr_plate: Optional[list], idx_pdf_to_process: int,
+                        save_out_dir: str = "res_outputs_blurred") -> str:
+    """
+    Path of the redacted 1st page PDF. The output directory is created if needed.
+
+    Args:
+        info_1st_page (list, optional): List of important information extracted from the first page.
+        info_nr_plate (list, optional): info_nr_plate from the first page.
+        idx_pdf_to_process (int): Current index number of pdf file to process.
+        save_out_dir (str): Output directory. Defaults to "res_outputs_blurred".
+
+    Returns:
+        str
+    """
     if not os.path.exists(save_out_dir):
         os.makedirs(save_out_dir, exist_ok=True)
 
     if info_nr_plate is None:
-        save_file_key_info = (info_1st_page[4], info_nr_plate[0], info_1st_page[5])
-        output_path = os.path.join(save_out_dir, "_".join(save_file_key_info) + '.pdf')
-    else:
-        save_file_key_info = (info_nr_plate[0])
-        output_path = os.path.join(save_out_dir, f"{save_file_key_info}_polisy_{idx_pdf_to_process}_toC.pdf")
-        # output_path = os.path.join(save_out_dir, f"polisy.pdf")
-    save_single_page(pdf_doc=pdf_document, page_number=page_number, output_path=output_path)
+        save_file_key_info = (info_1st_page[4], info_1st_page[5])
+        return os.path.join(save_out_dir, "_".join(save_file_key_info) + '.pdf')
+
+    save_file_key_info = (info_nr_plate[0])
+    return os.path.join(save_out_dir, f"{save_file_key_info}_polisy_{idx_pdf_to_process}_toC.pdf")
+    # return os.path.join(save_out_dir, f"polisy.pdf")
+
+
+def add_white_rectangle_to_page(
+        pdf_doc: fitz.Document,
+        info_1st_page: list,
+        info_nr_plate: str,
+        idx_pdf_to_process: int,
+        rect_x0, rect_y0, rect_x1, rect_y1,
+        color: tuple = (1, 1, 1),
+        page_number: int = 0
+):
+    """
+    Adds a white rectangle to a specified location on a copy of a page of a PDF document,
+    then saves that page to its own PDF. `pdf_doc` itself is left unchanged.
+
+    Args:
+        pdf_doc (fitz.Document): the input PDF document.
+        info_1st_page (list): List of important information extracted from the first page.
+        info_nr_plate (str): info_nr_plate from the first page.
+        idx_pdf_to_process (int): Current index number of pdf file to process.
+        rect_x0 (float): X-coordinate of the top-left corner of the rectangle.
+        rect_y0 (float): Y-coordinate of the top-left corner of the rectangle.
+        rect_x1 (float): X-coordinate of the bottom-right corner of the rectangle.
+        rect_y1 (float): Y-coordinate of the bottom-right corner of the rectangle.
+        color (tuple): RGB color of the rectangle (values between 0 and 1).
+        page_number (int, optional): Page number to modify (0-based index). Defaults to 0.
+
+    Returns:
+        None
+    """
+    page_document = single_page_document(pdf_doc=pdf_doc, page_number=page_number)
+    draw_white_rectangle(
+        page=page_document[0],
+        rect_x0=rect_x0, rect_y0=rect_y0, rect_x1=rect_x1, rect_y1=rect_y1,
+        color=color,
+    )
+
+    output_path = blurred_output_path(
+        info_1st_page=info_1st_page, info_nr_plate=info_nr_plate, idx_pdf_to_process=idx_pdf_to_process
+    )
+    page_document.save(output_path)
+    page_document.close()
     print(f"White rectangle added to page {page_number + 1} and saved to {output_path}.")
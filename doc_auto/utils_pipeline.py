@@ -0,0 +1,359 @@
+import os
+import time
+from typing import Iterable, NamedTuple, Optional, Union
+
+import fitz  # PyMuPDF
+
+from doc_auto.utils_batch import iter_batch
+from doc_auto.utils_cache import OcrResultCache
+from doc_auto.utils_loader import MappedPdf
+from doc_auto.utils_manifest import JobManifest
+from doc_auto.utils_manifest import STATE_OCR_DONE
+from doc_auto.utils_manifest import STATE_REDACTED
+from doc_auto.utils_metrics import METRICS
+from doc_auto.utils_metrics import profile_document
+from doc_auto.utils_metrics import timer
+from doc_auto.utils_page import blurred_output_path
+from doc_auto.utils_page import draw_white_rectangle
+from doc_auto.utils_page import OCR_START_LEFT_CROP_X
+from doc_auto.utils_page import extract_info_with_crop_search
+from doc_auto.utils_page import identify_blank_pages
+from doc_auto.utils_page import page_ink_features
+from doc_auto.utils_page import old_identify_insert_page_according_blank_page
+from doc_auto.utils_stamp import insert_stamp_images
+from doc_auto.utils_stamp import stamp_keyname_from_path
+
+# Rectangle covering the payment information on the 1st page (x0, y0, x1, y1)
+REDACT_RECT = (20, 453.5, 400, 580)
+REDACT_PAGE_NUMBER = 0  # 0-based index of the redacted page
+
+
+class DocumentContext:
+    """
+    State of one document while it goes through the pipeline stages.
+
+    Args:
+        pdf_path (str): Path to the input PDF.
+        image_path (str): Path to the PNG stamp image file.
+        positions (list of lists of tuples): (x, y) top-left corners of the stamp, one list per page.
+        idx_pdf_to_process (int): Current index number of pdf file to process.
+        output_path (str, optional): Path to the signed PDF, derived from the plate number if None.
+        page_numbers (list, optional): 1-based pages to stamp, derived from the blank page if None.
+        width (float, optional): Desired width of the stamp.
+        height (float, optional): Desired height of the stamp.
+        use_ocr (bool): Extract the 1st page information by OCR.
+        create_blurred_pdf (bool): Save the redacted 1st page as its own PDF, requires use_ocr.
+        ocr_cache (OcrResultCache, optional): cache of previous OCR results.
+        ocr_roi_key (str, optional): OCR only the regions of this layout template, e.g. the insurer name.
+        pdf_bytes (bytes, optional): Content of the input PDF, already read, instead of opening pdf_path.
+        write_outputs (bool): Write the output PDFs. False keeps their bytes in `outputs` instead, to be
+                              written by the caller. Defaults to True.
+        manifest (JobManifest, optional): records the intermediate states (OCR done, redacted) of the document.
+        info_1st_page (list, optional): 1st page information of a previous run, skips the OCR.
+        info_nr_plate (list, optional): registration plate of a previous run, with `info_1st_page`.
+        redact_rect (tuple): (x0, y0, x1, y1) covering the payment information. Defaults to REDACT_RECT.
+        ocr_start_left_crop_x (int or float): Left crop the OCR starts at, e.g. the one learnt for the company.
+    """
+
+    def __init__(
+            self,
+            pdf_path: str,
+            image_path: str,
+            positions: list,
+            idx_pdf_to_process: int,
+            output_path: Optional[str] = None,
+            page_numbers: Optional[list] = None,
+            width=None,
+            height=None,
+            use_ocr: bool = False,
+            create_blurred_pdf: bool = True,
+            ocr_cache: Optional[OcrResultCache] = None,
+            ocr_roi_key: Optional[str] = None,
+            pdf_bytes: Optional[bytes] = None,
+            write_outputs: bool = True,
+            manifest: Optional[JobManifest] = None,
+            info_1st_page: Optional[list] = None,
+            info_nr_plate: Optional[list] = None,
+            redact_rect: tuple = REDACT_RECT,
+            ocr_start_left_crop_x: Union[int, float] = OCR_START_LEFT_CROP_X,
+    ):
+        self.pdf_path = pdf_path
+        self.image_path = image_path
+        self.positions = positions
+        self.idx_pdf_to_process = idx_pdf_to_process
+        self.output_path = output_path
+        self.page_numbers = page_numbers
+        self.width = width
+        self.height = height
+        self.use_ocr = use_ocr
+        self.create_blurred_pdf = create_blurred_pdf
+        self.ocr_cache = ocr_cache
+        self.ocr_roi_key = ocr_roi_key
+        self.pdf_bytes = pdf_bytes
+        self.write_outputs = write_outputs
+        self.manifest = manifest
+        self.redact_rect = redact_rect
+        self.ocr_start_left_crop_x = ocr_start_left_crop_x
+
+        self.mapped_pdf: Optional[MappedPdf] = None  # Input mapping `pdf_document` reads from
+        self.pdf_document: Optional[fitz.Document] = None
+        self.info_1st_page: Optional[list] = info_1st_page
+        self.info_nr_plate: Optional[list] = info_nr_plate
+        self.ocr_attempts: Optional[int] = None
+        self.ocr_left_crop_x: Optional[float] = None
+        self.sign_page_numbers: Optional[list] = None
+        self.blurred_output_path: Optional[str] = None
+        self.blurred_document: Optional[fitz.Document] = None  # Redacted 1st page, separate from `pdf_document`
+        self.timings = {}
+        self.outputs = {}  # output path -> PDF bytes, when not write_outputs
+
+
+class DocumentResult(NamedTuple):
+    """
+    Outcome of one document that went through the pipeline.
+
+    Attributes:
+        pdf_path (str): Path to the input PDF.
+        output_path (str): Path to the signed PDF.
+        blurred_output_path (str, optional): Path to the redacted 1st page PDF, None if not created.
+        info_1st_page (list, optional): 7 fields extracted from the 1st page, None without OCR.
+        info_nr_plate (list, optional): registration plate extracted from the 1st page.
+        ocr_attempts (int, optional): Number of OCR attempts, 0 on a cache hit, None without OCR.
+        ocr_left_crop_x (float, optional): Left crop the OCR succeeded with, None without OCR or from the text layer.
+        timings (dict): stage name -> seconds.
+        metrics (dict): Metrics snapshot of this document (render, preprocess, OCR, regex, ... timers
+                        and retry/cache counters).
+        outputs (dict, optional): output path -> PDF bytes not written yet, empty when the pipeline wrote them.
+    """
+    pdf_path: str
+    output_path: str
+    blurred_output_path: Optional[str]
+    info_1st_page: Optional[list]
+    info_nr_plate: Optional[list]
+    ocr_attempts: Optional[int]
+    timings: dict
+    metrics: dict
+    outputs: Optional[dict] = None
+    ocr_left_crop_x: Optional[float] = None
+
+
+def save_output(ctx: DocumentContext, pdf_document: fitz.Document, output_path: str, **save_options):
+    """
+    Save a document to `output_path`, or keep its bytes in `ctx.outputs` when the context does not
+    write its outputs.
+    """
+    if ctx.write_outputs:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        pdf_document.save(output_path, **save_options)
+    else:
+        ctx.outputs[output_path] = pdf_document.tobytes(**save_options)
+
+
+def stage_load(ctx: DocumentContext):
+    """
+    Open the input once for every following stage: from the prefetched bytes, or from a memory
+    mapping of the file, closed by `run_stages` after the document.
+    """
+    if ctx.pdf_bytes is not None:
+        ctx.pdf_document = fitz.open(stream=ctx.pdf_bytes, filetype="pdf")
+    else:
+        ctx.mapped_pdf = MappedPdf(ctx.pdf_path)
+        ctx.pdf_document = ctx.mapped_pdf.open_document()
+
+
+def stage_ocr(ctx: DocumentContext):
+    if not ctx.use_ocr:
+        return
+    if ctx.info_1st_page is not None:
+        ctx.ocr_attempts = 0
+        print(f"OCR result of a previous run reused: {ctx.pdf_path}")
+        return
+    ctx.info_1st_page, ctx.info_nr_plate, ctx.ocr_attempts, ctx.ocr_left_crop_x = extract_info_with_crop_search(
+        doc=ctx.pdf_document, start_left_crop_x=ctx.ocr_start_left_crop_x, cache=ctx.ocr_cache,
+        roi_key=ctx.ocr_roi_key, debug_name=ctx.pdf_path
+    )
+    print(f"OCR succeeded after {ctx.ocr_attempts} attempt(s): {ctx.pdf_path}")
+
+
+def resolve_sign_page_numbers(ctx: DocumentContext) -> list:
+    """
+    1-based pages to stamp: the configured ones, otherwise derived from the blank page.
+    """
+    if ctx.sign_page_numbers is None:
+        if ctx.page_numbers is None:
+            page_features = page_ink_features(ctx.pdf_document)
+            blank_pages = identify_blank_pages(document=ctx.pdf_document, page_features=page_features)
+            ctx.sign_page_numbers = old_identify_insert_page_according_blank_page(
+                blank_pages=blank_pages,
+                num_doc_pages=len(ctx.pdf_document),
+                page_features=page_features,
+            )
+        else:
+            ctx.sign_page_numbers = ctx.page_numbers
+    return ctx.sign_page_numbers
+
+
+def open_input_copy(ctx: DocumentContext) -> fitz.Document:
+    """
+    Open the input a second time, independent of `ctx.pdf_document`: from the prefetched bytes or
+    the memory mapping, so the file is not read again.
+    """
+    if ctx.pdf_bytes is not None:
+        return fitz.open(stream=ctx.pdf_bytes, filetype="pdf")
+    if ctx.mapped_pdf is not None:
+        return ctx.mapped_pdf.open_document()
+    return fitz.open(ctx.pdf_path)
+
+
+def stage_redact(ctx: DocumentContext):
+    """
+    Cover the payment information on the 1st page of a separate copy of the input, reduced to
+    that page. The signed document is never covered, the copy is written by `stage_save_blurred`.
+    """
+    if not (ctx.use_ocr and ctx.create_blurred_pdf):
+        return
+    if not ctx.info_nr_plate:
+        ctx.info_nr_plate = [stamp_keyname_from_path(ctx.image_path)]
+
+    ctx.blurred_document = open_input_copy(ctx)
+    ctx.blurred_document.select([REDACT_PAGE_NUMBER])
+    rect_x0, rect_y0, rect_x1, rect_y1 = ctx.redact_rect
+    draw_white_rectangle(
+        page=ctx.blurred_document[0],
+        rect_x0=rect_x0,  # Top-left X
+        rect_y0=rect_y0,  # Top-left Y
+        rect_x1=rect_x1,  # Bottom-right X
+        rect_y1=rect_y1,  # Bottom-right Y
+        color=(1, 1, 1),
+    )
+    ctx.blurred_output_path = blurred_output_path(
+        info_1st_page=ctx.info_1st_page,
+        info_nr_plate=ctx.info_nr_plate,
+        idx_pdf_to_process=ctx.idx_pdf_to_process,
+    )
+
+
+def stage_stamp(ctx: DocumentContext):
+    insert_stamp_images(
+        pdf_document=ctx.pdf_document,
+        image_path=ctx.image_path,
+        page_numbers=resolve_sign_page_numbers(ctx),
+        positions=ctx.positions,
+        width=ctx.width,
+        height=ctx.height,
+    )
+
+
+def stage_save(ctx: DocumentContext):
+    if ctx.output_path is None:
+        info_nr_plate = ctx.info_nr_plate or [stamp_keyname_from_path(ctx.image_path)]
+        output_path = os.path.splitext(ctx.pdf_path)[0] + "_signed" + os.path.splitext(ctx.pdf_path)[1]
+        ctx.output_path = os.path.join('res_outputs', info_nr_plate[0] + "_" + os.path.basename(output_path))
+
+    with timer("save"):
+        save_output(ctx, ctx.pdf_document, ctx.output_path)
+
+
+def stage_save_blurred(ctx: DocumentContext):
+    """
+    Write the redacted 1st page of `stage_redact`, after the signed document is saved.
+    """
+    if ctx.blurred_document is None:
+        return
+    with timer("save"):
+        # Drop the objects only the removed pages used
+        save_output(ctx, ctx.blurred_document, ctx.blurred_output_path, garbage=1)
+    ctx.blurred_document.close()
+    ctx.blurred_document = None
+    print(f"White rectangle added to page {REDACT_PAGE_NUMBER + 1} and saved to {ctx.blurred_output_path}.")
+
+
+DEFAULT_STAGES = (stage_load, stage_ocr, stage_redact, stage_stamp, stage_save, stage_save_blurred)
+
+# State recorded in the manifest once a stage is done, the final states are recorded by the caller
+CHECKPOINT_STATES = {
+    stage_ocr: STATE_OCR_DONE,
+    stage_redact: STATE_REDACTED,
+}
+
+
+def checkpoint_stage(ctx: DocumentContext, stage):
+    state = CHECKPOINT_STATES.get(stage)
+    if ctx.manifest is None or state is None:
+        return
+    if ctx.info_1st_page is None or (stage is stage_redact and ctx.blurred_output_path is None):
+        return  # The stage did nothing
+    ctx.manifest.checkpoint(ctx.pdf_path, state, info_1st_page=ctx.info_1st_page, info_nr_plate=ctx.info_nr_plate)
+
+
+def run_stages(ctx: DocumentContext, stages: Iterable = DEFAULT_STAGES) -> DocumentResult:
+    """
+    Run the stages on one document, timing each of them. The document is always closed at the end.
+
+    Args:
+        ctx (DocumentContext): the document to process.
+        stages (iterable of callables): stages taking the context, run in order.
+
+    Returns:
+        DocumentResult
+    """
+    with METRICS.scope() as document_metrics, profile_document(ctx.pdf_path):
+        try:
+            for stage in stages:
+                start = time.perf_counter()
+                stage(ctx)
+                ctx.timings[stage.__name__.replace("stage_", "")] = time.perf_counter() - start
+                checkpoint_stage(ctx, stage)
+        finally:
+            for document in (ctx.blurred_document, ctx.pdf_document):
+                if document is not None and not document.is_closed:
+                    document.close()
+            if ctx.mapped_pdf is not None:
+                ctx.mapped_pdf.close()
+
+    return DocumentResult(
+        pdf_path=ctx.pdf_path,
+        output_path=ctx.output_path,
+        blurred_output_path=ctx.blurred_output_path,
+        info_1st_page=ctx.info_1st_page,
+        info_nr_plate=ctx.info_nr_plate,
+        ocr_attempts=ctx.ocr_attempts,
+        timings=ctx.timings,
+        metrics=document_metrics.snapshot(),
+        outputs=ctx.outputs,
+        ocr_left_crop_x=ctx.ocr_left_crop_x,
+    )
+
+
+def process_document(stages: Iterable = DEFAULT_STAGES, **job) -> DocumentResult:
+    """
+    Run the pipeline on one document. Picklable entry point for the batch executors.
+
+    Args:
+        stages (iterable of callables): stages taking the context, run in order.
+        **job: keyword arguments of DocumentContext.
+
+    Returns:
+        DocumentResult
+    """
+    return run_stages(DocumentContext(**job), stages=stages)
+
+
+def iter_pipeline(jobs: Iterable, stages: Iterable = DEFAULT_STAGES, max_workers: Optional[int] = None,
+                  max_open: Optional[int] = None):
+    """
+    Process documents and yield each result as soon as it is available, in input order.
+
+    Args:
+        jobs (iterable of dict): keyword arguments of DocumentContext, one per document.
+        stages (iterable of callables): stages taking the context, run in order.
+        max_workers (int, optional): Number of worker processes. None uses all CPUs.
+        max_open (int, optional): Maximum number of documents dispatched and not yet yielded.
+                                  Defaults to twice the number of workers.
+
+    Yields:
+        BatchResult: with a DocumentResult as result when the document succeeded.
+    """
+    stages = tuple(stages)
+    job_iter = (dict(job, stages=stages) for job in jobs)
+    yield from iter_batch(func=process_document, jobs=job_iter, max_workers=max_workers, max_in_flight=max_open)
@@ -0,0 +1,146 @@
+import collections
+import json
+import os
+from typing import Iterable, NamedTuple, Optional
+
+from doc_auto.utils_log import setup_logger
+from doc_auto.utils_page import OCR_START_LEFT_CROP_X
+from doc_auto.utils_pipeline import REDACT_RECT
+from doc_auto.utils_stamp import stamp_keyname_from_path
+
+logger = setup_logger(__name__)
+
+LEARNED_PLACEMENTS_PATH = "res_outputs/placement_learned.json"
+
+
+class PlacementProfile(NamedTuple):
+    """
+    Where and how the documents of one company are stamped and redacted.
+
+    Attributes:
+        company (str): Company key name, e.g. "lsy" for the folder "c4_lsy".
+        stamp_path (str, optional): Stamp image of the company, None if there is none in the assets.
+        positions (list of lists of tuples): (x, y) top-left corners of the stamp, one list per page.
+        width (float): Width of the stamp.
+        height (float): Height of the stamp.
+        page_numbers (list, optional): 1-based pages to stamp, None derives them from the blank page.
+        redact_rect (tuple): (x0, y0, x1, y1) of the rectangle covering the payment information.
+        left_crop_x (float): Left crop the OCR of the 1st page starts at, learnt from the previous runs.
+    """
+    company: str
+    stamp_path: Optional[str]
+    positions: list
+    width: float
+    height: float
+    page_numbers: Optional[list]
+    redact_rect: tuple
+    left_crop_x: float = OCR_START_LEFT_CROP_X
+
+
+DEFAULT_PLACEMENT = dict(
+    positions=[
+        [(400, 190), (230, 250)],
+        [(400, 5), (230, 70)],
+    ],
+    width=120,
+    height=120,
+    page_numbers=[3, 5],
+    redact_rect=REDACT_RECT,
+)
+
+# Differences to DEFAULT_PLACEMENT by company key name
+COMPANY_PLACEMENTS = {
+    "commercia": dict(
+        positions=[
+            [(400, 200), (230, 260)],
+            [(400, 15), (230, 80)],
+        ],
+        width=100,
+        height=100,
+        redact_rect=(40, 464.5, 400, 580),
+    ),
+}
+
+
+def find_stamps(assets_dir: str = "assets_stamps") -> dict:
+    """
+    Returns:
+        dict: company key name -> stamp path, from the images named like "4_lsy_NoBG.png".
+    """
+    stamps = {}
+    for file_name in sorted(os.listdir(assets_dir)):
+        try:
+            stamps.setdefault(stamp_keyname_from_path(file_name), os.path.join(assets_dir, file_name))
+        except ValueError:
+            continue  # Not a stamp
+    return stamps
+
+
+def load_learned_placements(path: str = LEARNED_PLACEMENTS_PATH) -> dict:
+    """
+    Returns:
+        dict: company key name -> learnt values (e.g. "left_crop_x"), empty before the first run.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring learnt placements {path}: {e}")
+        return {}
+
+
+def load_placement_profiles(companies: Iterable, assets_dir: str = "assets_stamps",
+                            learned_path: Optional[str] = LEARNED_PLACEMENTS_PATH) -> dict:
+    """
+    Build the placement profile of every company once, before the documents are dispatched.
+
+    Args:
+        companies (iterable): Company key names.
+        assets_dir (str): Directory of the stamp images. Defaults to "assets_stamps".
+        learned_path (str, optional): Values learnt by the previous runs, see `learn_left_crop_x`.
+
+    Returns:
+        dict: company key name -> PlacementProfile
+    """
+    stamps = find_stamps(assets_dir)
+    learned = load_learned_placements(learned_path) if learned_path else {}
+    profiles = {}
+    for company in companies:
+        if company in profiles:
+            continue
+        profiles[company] = PlacementProfile(
+            company=company,
+            stamp_path=stamps.get(company),
+            left_crop_x=learned.get(company, {}).get("left_crop_x", OCR_START_LEFT_CROP_X),
+            **{**DEFAULT_PLACEMENT, **COMPANY_PLACEMENTS.get(company, {})},
+        )
+    return profiles
+
+
+def learn_left_crop_x(left_crop_xs: dict, path: str = LEARNED_PLACEMENTS_PATH):
+    """
+    Keep the most frequent successful left crop of each company for the next runs.
+
+    Args:
+        left_crop_xs (dict): company key name -> list of the left crops OCR succeeded with in this run.
+        path (str): JSON file of the learnt values.
+
+    Returns:
+        None
+    """
+    learned = load_learned_placements(path)
+    for company, values in left_crop_xs.items():
+        if not values:
+            continue
+        # Most frequent, the smallest on ties, so fewer documents start past the crop they need
+        counts = collections.Counter(values)
+        left_crop_x = min(counts, key=lambda value: (-counts[value], value))
+        learned.setdefault(company, {})["left_crop_x"] = left_crop_x
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(learned, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
@@ -0,0 +1,143 @@
+from typing import NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+from doc_auto.utils_img_op import autocontrast_array
+from doc_auto.utils_img_op import reusable_buffer
+
+TARGET_DPI = 300  # Resolution tesseract is trained for
+DESKEW_MAX_ANGLE = 3.0  # Largest skew corrected, in degrees
+DESKEW_STEP = 0.25
+DESKEW_SAMPLE = 4  # Estimate the skew on every 4th pixel of each axis
+ADAPTIVE_BLOCK_SIZE = 31  # Neighbourhood of the adaptive threshold at TARGET_DPI, in pixels
+ADAPTIVE_C = 15
+
+_preset_winners = {}  # Last preset that succeeded, by layout key, in the current process
+
+
+class PreprocessPreset(NamedTuple):
+    """
+    A named chain of preprocessing steps.
+
+    Each step takes a uint8 grayscale array and its resolution and returns both, so the steps
+    that need the resolution (e.g. the adaptive threshold) see the current one.
+    """
+    name: str
+    steps: tuple
+
+
+def autocontrast(gray: np.ndarray, dpi: float):
+    # First step of every preset, writes into the reused crop buffer instead of allocating
+    return autocontrast_array(gray, out=reusable_buffer("ocr_crop", gray.shape)), dpi
+
+
+def normalize_dpi(gray: np.ndarray, dpi: float, target_dpi: float = TARGET_DPI):
+    if abs(dpi - target_dpi) < 1:
+        return gray, dpi
+    scale = target_dpi / dpi
+    interpolation = cv2.INTER_CUBIC if scale > 1 else cv2.INTER_AREA
+    return cv2.resize(gray, None, fx=scale, fy=scale, interpolation=interpolation), target_dpi
+
+
+def denoise(gray: np.ndarray, dpi: float):
+    # Removes the salt and pepper noise of scans without blurring the glyph edges
+    return cv2.medianBlur(gray, 3), dpi
+
+
+def otsu_threshold(gray: np.ndarray, dpi: float):
+    return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1], dpi
+
+
+def adaptive_threshold(gray: np.ndarray, dpi: float):
+    # Follows uneven lighting and stamps, the block scales with the resolution and stays odd
+    block_size = max(3, int(ADAPTIVE_BLOCK_SIZE * dpi / TARGET_DPI) | 1)
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, block_size,
+                                 ADAPTIVE_C), dpi
+
+
+def estimate_skew(gray: np.ndarray, max_angle: float = DESKEW_MAX_ANGLE, step: float = DESKEW_STEP) -> float:
+    """
+    Estimate the skew of the text lines by projection profiles: the angle whose horizontal
+    projection of the ink pixels is the most peaked.
+
+    Returns:
+        float: angle in degrees, counterclockwise.
+    """
+    sample = gray[::DESKEW_SAMPLE, ::DESKEW_SAMPLE]
+    ys, xs = np.nonzero(sample < 128)
+    if len(ys) == 0:
+        return 0.0
+    angles = np.arange(-max_angle, max_angle + step / 2, step)
+    radians = np.deg2rad(angles)
+    # Row of every ink pixel once rotated by each angle, shape (angles, pixels)
+    rows = np.rint(ys[None, :] * np.cos(radians)[:, None] + xs[None, :] * np.sin(radians)[:, None]).astype(np.int64)
+    rows -= rows.min()
+    num_rows = int(rows.max()) + 1
+    offsets = np.arange(len(angles))[:, None] * num_rows
+    profiles = np.bincount((rows + offsets).ravel(), minlength=len(angles) * num_rows).reshape(len(angles), -1)
+    scores = (profiles.astype(np.float64) ** 2).sum(axis=1)
+    return float(angles[int(np.argmax(scores))])
+
+
+def deskew(gray: np.ndarray, dpi: float):
+    angle = estimate_skew(gray)
+    if abs(angle) < DESKEW_STEP:
+        return gray, dpi
+    height, width = gray.shape
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), -angle, 1.0)
+    return cv2.warpAffine(gray, matrix, (width, height), flags=cv2.INTER_LINEAR, borderValue=255), dpi
+
+
+# Cheapest first
+OCR_PRESETS = {
+    preset.name: preset for preset in (
+        PreprocessPreset("autocontrast", (autocontrast,)),
+        PreprocessPreset("otsu", (autocontrast, otsu_threshold)),
+        PreprocessPreset("denoise_otsu", (autocontrast, denoise, otsu_threshold)),
+        PreprocessPreset("adaptive", (autocontrast, denoise, adaptive_threshold)),
+        PreprocessPreset("deskew_300dpi_adaptive", (autocontrast, deskew, normalize_dpi, denoise, adaptive_threshold)),
+    )
+}
+OCR_DEFAULT_PRESET = "autocontrast"
+OCR_PRESET_ORDER = tuple(OCR_PRESETS)
+
+
+def preprocess_for_ocr(gray: np.ndarray, dpi: float, preset: str = OCR_DEFAULT_PRESET) -> np.ndarray:
+    """
+    Args:
+        gray (np.ndarray): uint8 grayscale array, may be a view of the rendered page.
+        dpi (float): Resolution of `gray`.
+        preset (str): Key of OCR_PRESETS. Defaults to OCR_DEFAULT_PRESET.
+
+    Returns:
+        np.ndarray: the preprocessed array, possibly a reused buffer: only valid until the next call.
+    """
+    for step in OCR_PRESETS[preset].steps:
+        gray, dpi = step(gray, dpi)
+    return gray
+
+
+def order_presets(presets: tuple = OCR_PRESET_ORDER, key: Optional[str] = None) -> tuple:
+    """
+    Returns:
+        tuple: `presets` with the last one that succeeded for `key` (e.g. the insurer) first, so
+        documents of a layout needing a costlier preset don't fail the cheaper ones every time.
+    """
+    winner = _preset_winners.get(key)
+    if winner not in presets:
+        return tuple(presets)
+    return (winner,) + tuple(preset for preset in presets if preset != winner)
+
+
+def record_preset_success(preset: str, key: Optional[str] = None):
+    _preset_winners[key] = preset
+
+
+def register_preset(name: str, steps: tuple):
+    """
+    Add a preset, e.g. for a layout the built-in ones don't read. Steps are callables
+    `(gray, dpi) -> (gray, dpi)`.
+    """
+    OCR_PRESETS[name] = PreprocessPreset(name, tuple(steps))
+
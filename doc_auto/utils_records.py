@@ -0,0 +1,364 @@
+import csv
+import json
+import os
+import re
+import sqlite3
+import time
+from typing import Iterable, NamedTuple, Optional
+
+from doc_auto.utils_fields import IMPORTANT_FIELDS
+
+try:
+    import openpyxl  # Optional, only for the XLSX sink
+except ImportError:
+    openpyxl = None
+
+RECORD_FORMATS = ("csv", "jsonl", "sqlite", "xlsx")
+
+# Names of the `info_1st_page` fields in the records, the insured company is not the company folder
+_INFO_COLUMNS = {"company": "company_name"}
+
+
+class ResultRecord(NamedTuple):
+    """
+    One processed document, as written by the record sinks.
+
+    Attributes:
+        pdf_path (str): Path to the input PDF.
+        company (str, optional): Company folder key name, e.g. "lsy".
+        ok (bool): Whether the document was processed.
+        policy_number (str, optional): e.g. "Polisa nr 123456789".
+        nr_plate (str, optional): Registration plate.
+        amount (str, optional): Payment amount.
+        bank_account (str, optional): 26 digits bank account number.
+        recipient_name (str, optional): Payment recipient.
+        recipient_address (str, optional): Payment recipient address.
+        company_name (str, optional): Insured company.
+        company_address (str, optional): Insured company address.
+        output_path (str, optional): Path to the signed PDF.
+        ocr_attempts (int, optional): Number of OCR attempts, 0 without OCR (text layer, cache or previous run).
+        timings (dict, optional): stage name -> seconds.
+        error (str, optional): Last line of the error of a failed document.
+        processed_at (str): Local time the record was made, ISO 8601.
+    """
+    pdf_path: str
+    company: Optional[str]
+    ok: bool
+    policy_number: Optional[str]
+    nr_plate: Optional[str]
+    amount: Optional[str]
+    bank_account: Optional[str]
+    recipient_name: Optional[str]
+    recipient_address: Optional[str]
+    company_name: Optional[str]
+    company_address: Optional[str]
+    output_path: Optional[str]
+    ocr_attempts: Optional[int]
+    timings: Optional[dict]
+    error: Optional[str]
+    processed_at: str
+
+
+RECORD_COLUMNS = ResultRecord._fields
+
+
+def make_result_record(pdf_path: str, company: Optional[str] = None, info_1st_page: Optional[list] = None,
+                       info_nr_plate: Optional[list] = None, output_path: Optional[str] = None,
+                       ocr_attempts: Optional[int] = None, timings: Optional[dict] = None,
+                       error: Optional[str] = None) -> ResultRecord:
+    """
+    Args:
+        pdf_path (str): Path to the input PDF.
+        company (str, optional): Company folder key name.
+        info_1st_page (list, optional): the 7 fields of the 1st page, in IMPORTANT_FIELDS order.
+        info_nr_plate (list, optional): the registration plate, empty or None if not found.
+        output_path (str, optional): Path to the signed PDF.
+        ocr_attempts (int, optional): Number of OCR attempts.
+        timings (dict, optional): stage name -> seconds.
+        error (str, optional): Error of a failed document, None if it succeeded.
+
+    Returns:
+        ResultRecord
+    """
+    info = dict(zip((_INFO_COLUMNS.get(name, name) for name in IMPORTANT_FIELDS), info_1st_page or []))
+    return ResultRecord(
+        pdf_path=pdf_path,
+        company=company,
+        ok=error is None,
+        policy_number=info.get("policy_number"),
+        nr_plate=info_nr_plate[0] if info_nr_plate else None,
+        amount=info.get("amount"),
+        bank_account=info.get("bank_account"),
+        recipient_name=info.get("recipient_name"),
+        recipient_address=info.get("recipient_address"),
+        company_name=info.get("company_name"),
+        company_address=info.get("company_address"),
+        output_path=output_path,
+        ocr_attempts=ocr_attempts,
+        timings={stage: round(seconds, 6) for stage, seconds in timings.items()} if timings else None,
+        error=error,
+        processed_at=time.strftime("%Y-%m-%dT%H:%M:%S"),
+    )
+
+
+def policy_key(policy_number: Optional[str]) -> Optional[str]:
+    """
+    Lookup key of a policy number: its digits, so "Polisa nr 123" and "123" match.
+    """
+    if not policy_number:
+        return None
+    return re.sub(r"\D", "", policy_number) or None
+
+
+def plate_key(nr_plate: Optional[str]) -> Optional[str]:
+    """
+    Lookup key of a registration plate: upper case without spaces or dashes.
+    """
+    if not nr_plate:
+        return None
+    return re.sub(r"[\s-]", "", nr_plate).upper() or None
+
+
+def _flat_row(record: ResultRecord) -> list:
+    # Text formats keep the timings as a JSON object in one column
+    return [json.dumps(value, sort_keys=True) if isinstance(value, dict) else value for value in record]
+
+
+class CsvRecordSink:
+    """
+    Append records to a CSV file, one flushed row per document, the header written once.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.path = path
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        if write_header:
+            self._writer.writerow(RECORD_COLUMNS)
+
+    def write(self, record: ResultRecord):
+        self._writer.writerow(_flat_row(record))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class JsonlRecordSink:
+    """
+    Append records to a JSON lines file, one flushed line per document.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record: ResultRecord):
+        self._file.write(json.dumps(record._asdict(), ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+_SQLITE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS records ("
+    + ", ".join(f"{column} {'TEXT PRIMARY KEY' if column == 'pdf_path' else ''}".strip() for column in RECORD_COLUMNS)
+    + ", policy_key TEXT, plate_key TEXT)",
+    "CREATE INDEX IF NOT EXISTS records_policy_key ON records (policy_key)",
+    "CREATE INDEX IF NOT EXISTS records_plate_key ON records (plate_key)",
+)
+
+
+class SqliteRecordSink:
+    """
+    Keep the latest record of every document in an SQLite table indexed by policy number and
+    plate, see `find_records`.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        for statement in _SQLITE_SCHEMA:
+            self._conn.execute(statement)
+
+    def write(self, record: ResultRecord):
+        self.write_many([record])
+
+    def write_many(self, records: Iterable):
+        columns = RECORD_COLUMNS + ("policy_key", "plate_key")
+        rows = [_flat_row(record) + [policy_key(record.policy_number), plate_key(record.nr_plate)]
+                for record in records]
+        with self._conn:  # One transaction
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO records ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                rows,
+            )
+
+    def close(self):
+        self._conn.close()
+
+
+class XlsxRecordSink:
+    """
+    Write the records of this run to an XLSX workbook, saved on `close` (the format cannot be
+    appended to). Requires openpyxl.
+    """
+
+    def __init__(self, path: str):
+        if openpyxl is None:
+            raise ImportError("The XLSX records need openpyxl: pip install openpyxl")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._workbook = openpyxl.Workbook(write_only=True)  # Rows are streamed, not kept as cell objects
+        self._sheet = self._workbook.create_sheet("records")
+        self._sheet.append(RECORD_COLUMNS)
+
+    def write(self, record: ResultRecord):
+        self._sheet.append(_flat_row(record))
+
+    def close(self):
+        self._workbook.save(self.path)
+
+
+RECORD_SINKS = {
+    "csv": CsvRecordSink,
+    "jsonl": JsonlRecordSink,
+    "sqlite": SqliteRecordSink,
+    "xlsx": XlsxRecordSink,
+}
+
+
+class RecordSinks:
+    """
+    Write every record to several formats, e.g. `RecordSinks("res_outputs/records", ("csv", "sqlite"))`
+    writes res_outputs/records.csv and res_outputs/records.sqlite.
+
+    Args:
+        base_path (str): Path of the outputs without extension.
+        formats (iterable): Keys of RECORD_SINKS.
+    """
+
+    def __init__(self, base_path: str, formats: Iterable = ("csv", "sqlite")):
+        self.sinks = []
+        try:
+            for record_format in formats:
+                if record_format not in RECORD_SINKS:
+                    raise ValueError(f"Unknown record format: {record_format}, expected one of {RECORD_FORMATS}")
+                self.sinks.append(RECORD_SINKS[record_format](f"{base_path}.{record_format}"))
+        except BaseException:
+            self.close()
+            raise
+
+    @property
+    def paths(self) -> list:
+        return [sink.path for sink in self.sinks]
+
+    def write(self, record: ResultRecord):
+        for sink in self.sinks:
+            sink.write(record)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+        self.sinks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _parse_row(row: dict) -> ResultRecord:
+    # Values of a CSV row are strings, JSON lines keep their types, SQLite stores booleans as 0/1
+    values = {column: row.get(column) if row.get(column) != "" else None for column in RECORD_COLUMNS}
+    if isinstance(values["ok"], str):
+        values["ok"] = values["ok"] == "True"
+    else:
+        values["ok"] = bool(values["ok"])
+    if isinstance(values["ocr_attempts"], str):
+        values["ocr_attempts"] = int(values["ocr_attempts"])
+    if isinstance(values["timings"], str):
+        values["timings"] = json.loads(values["timings"])
+    return ResultRecord(**values)
+
+
+def read_records(path: str):
+    """
+    Read the records of a CSV or JSON lines file written by the sinks.
+
+    Yields:
+        ResultRecord
+    """
+    with open(path, "r", newline="", encoding="utf-8") as file:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(file):
+                yield _parse_row(row)
+        else:
+            for line in file:
+                if line.strip():
+                    yield _parse_row(json.loads(line))
+
+
+def build_record_index(source_paths: Iterable, db_path: str) -> int:
+    """
+    Load CSV or JSON lines records, e.g. of months of runs, into the indexed SQLite table. Later
+    records of a document replace earlier ones.
+
+    Args:
+        source_paths (iterable): CSV or JSON lines files, oldest first.
+        db_path (str): SQLite database to create or update.
+
+    Returns:
+        int: Number of records loaded.
+    """
+    sink = SqliteRecordSink(db_path)
+    num_records = 0
+    try:
+        for source_path in source_paths:
+            records = list(read_records(source_path))
+            sink.write_many(records)
+            num_records += len(records)
+    finally:
+        sink.close()
+    return num_records
+
+
+def find_records(db_path: str, policy_number: Optional[str] = None, nr_plate: Optional[str] = None) -> list:
+    """
+    Look up records by policy number and/or plate through the indexes of the SQLite table.
+
+    Args:
+        db_path (str): SQLite database of `SqliteRecordSink` or `build_record_index`.
+        policy_number (str, optional): e.g. "Polisa nr 123456789" or "123456789".
+        nr_plate (str, optional): e.g. "WA 12345".
+
+    Returns:
+        list: matching ResultRecord items, most recent first.
+    """
+    conditions, params = [], []
+    if policy_number is not None:
+        conditions.append("policy_key = ?")
+        params.append(policy_key(policy_number))
+    if nr_plate is not None:
+        conditions.append("plate_key = ?")
+        params.append(plate_key(nr_plate))
+    if not conditions:
+        raise ValueError("Give a policy number or a plate to look up")
+
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            f"SELECT {', '.join(RECORD_COLUMNS)} FROM records WHERE {' AND '.join(conditions)} "
+            f"ORDER BY processed_at DESC", params
+        ).fetchall()
+    finally:
+        conn.close()
+    return [_parse_row(dict(zip(RECORD_COLUMNS, row))) for row in rows]
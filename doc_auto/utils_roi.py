@@ -0,0 +1,199 @@
+import hashlib
+import json
+from typing import NamedTuple, Optional
+
+import numpy as np
+from PIL import Image
+
+from doc_auto.utils_cache import OcrResultCache
+from doc_auto.utils_img_op import autocontrast_array
+from doc_auto.utils_img_op import reusable_buffer
+from doc_auto.utils_log import setup_logger
+from doc_auto.utils_metrics import timed
+from doc_auto.utils_ocr import ocr_image_to_text
+from doc_auto.utils_ocr_backend import PSM_SINGLE_BLOCK
+from doc_auto.utils_ocr_backend import PSM_SINGLE_LINE
+
+logger = setup_logger(__name__)
+
+ROI_TEMPLATE_VERSION = 1
+ROI_PADDING = 4  # Margin added around the detected paragraphs, in page points
+
+# Words marking the paragraphs the field regexes of utils_ocr read
+PAYER_ANCHORS = ("SPÓŁKA", "polisy:", "Polisa", "adres:")
+PLATE_ANCHOR = "rejestracyjny"
+PAYMENT_ANCHOR = "Płatności"
+PAYMENT_END_ANCHORS = ("płatności:", "płatność:", "óżnica:")
+
+_roi_templates = {}  # Templates of the current process by cache key
+
+
+class OcrRegion(NamedTuple):
+    """
+    A page area OCR'd on its own, in page points so it does not depend on the zoom or the crop.
+    """
+    name: str
+    x0: float
+    y0: float
+    x1: float
+    y1: float
+    psm: int
+
+
+def group_paragraphs(words: list) -> list:
+    """
+    Group OcrWord items by paragraph, keeping the reading order.
+
+    Returns:
+        list: one list of OcrWord per paragraph.
+    """
+    paragraphs = {}
+    for word in words:
+        paragraphs.setdefault((word.block_num, word.par_num), []).append(word)
+    return list(paragraphs.values())
+
+
+def words_to_text(words: list) -> str:
+    """
+    Rebuild the text of `image_to_string` from word boxes: words joined by spaces, lines by a
+    newline and paragraphs by an empty line.
+    """
+    paragraph_texts = []
+    for paragraph in group_paragraphs(words):
+        lines = {}
+        for word in paragraph:
+            lines.setdefault(word.line_num, []).append(word.text)
+        paragraph_texts.append("\n".join(" ".join(line) for line in lines.values()))
+    return "\n\n".join(paragraph_texts) + "\n"
+
+
+def _paragraph_region(name: str, paragraph: list, origin: tuple, zoom: float) -> OcrRegion:
+    left = min(word.left for word in paragraph)
+    top = min(word.top for word in paragraph)
+    right = max(word.left + word.width for word in paragraph)
+    bottom = max(word.top + word.height for word in paragraph)
+    num_lines = len({word.line_num for word in paragraph})
+    return OcrRegion(
+        name=name,
+        x0=(origin[0] + left) / zoom - ROI_PADDING,
+        y0=(origin[1] + top) / zoom - ROI_PADDING,
+        x1=(origin[0] + right) / zoom + ROI_PADDING,
+        y1=(origin[1] + bottom) / zoom + ROI_PADDING,
+        psm=PSM_SINGLE_LINE if num_lines == 1 else PSM_SINGLE_BLOCK,
+    )
+
+
+def detect_roi_regions(words: list, origin: tuple, zoom: float) -> list:
+    """
+    Find the paragraphs holding the payer details, the registration plate line and the
+    "Płatności" block in the word boxes of a layout pass.
+
+    Args:
+        words (list): OcrWord items of the OCR crop.
+        origin (tuple): (x, y) of the crop's top-left corner in the rendered page, in pixels.
+        zoom (float): Zoom factor the page was rendered with.
+
+    Returns:
+        list: OcrRegion items in reading order.
+
+    Raises:
+        ValueError: If one of the blocks is not found.
+    """
+    paragraphs = group_paragraphs(words)
+    paragraph_words = [[word.text for word in paragraph] for paragraph in paragraphs]
+
+    selected = {}
+    for idx, texts in enumerate(paragraph_words):
+        if any(anchor in text for anchor in PAYER_ANCHORS for text in texts):
+            selected[idx] = "payer"
+        if any(PLATE_ANCHOR in text for text in texts):
+            selected[idx] = "plate"
+
+    payment_start = next((idx for idx, texts in enumerate(paragraph_words) if PAYMENT_ANCHOR in texts), None)
+    if payment_start is None:
+        raise ValueError(f"ROI detection: '{PAYMENT_ANCHOR}' block not found")
+    payment_end = next((idx for idx in range(payment_start, len(paragraph_words))
+                        if any(anchor in text for anchor in PAYMENT_END_ANCHORS for text in paragraph_words[idx])),
+                       None)
+    if payment_end is None:
+        raise ValueError(f"ROI detection: end of the '{PAYMENT_ANCHOR}' block not found")
+    for idx in range(payment_start, payment_end + 1):
+        selected[idx] = "payment"
+
+    if "payer" not in selected.values():
+        raise ValueError("ROI detection: payer block not found")
+    if "plate" not in selected.values():
+        raise ValueError(f"ROI detection: '{PLATE_ANCHOR}' line not found")
+
+    return [_paragraph_region(selected[idx], paragraphs[idx], origin=origin, zoom=zoom) for idx in sorted(selected)]
+
+
+@timed("ocr_roi")
+def ocr_regions(gray: np.ndarray, regions: list, zoom: float, origin: tuple = (0, 0)) -> str:
+    """
+    OCR every region of the rendered page on its own and join the texts like `image_to_string`
+    separates paragraphs, so the field regexes of utils_ocr apply unchanged.
+
+    The region texts are kept as recognized, only their trailing line breaks and page separator
+    are dropped. Every region follows a paragraph break, as it does in the text of the full crop,
+    so the patterns anchored on a preceding line break (e.g. "\nnr rejestracyjny:") also match
+    when their region comes first.
+
+    Args:
+        gray (np.ndarray): uint8 grayscale rendering of the page, or of an area of it.
+        regions (list): OcrRegion items in reading order.
+        zoom (float): Zoom factor the page was rendered with.
+        origin (tuple): (x, y) of `gray` in the pixels of the full page rendering. Defaults to (0, 0).
+
+    Returns:
+        str: the recognized text.
+    """
+    height, width = gray.shape
+    texts = []
+    for region in regions:
+        x0, y0 = max(0, int(region.x0 * zoom) - origin[0]), max(0, int(region.y0 * zoom) - origin[1])
+        x1 = min(width, int(np.ceil(region.x1 * zoom)) - origin[0])
+        y1 = min(height, int(np.ceil(region.y1 * zoom)) - origin[1])
+        if x1 <= x0 or y1 <= y0:
+            raise ValueError(f"ROI {region.name} is outside of the rendered area")
+        cropped = gray[y0:y1, x0:x1]
+        # Improve contrast
+        image = Image.fromarray(autocontrast_array(cropped, out=reusable_buffer("ocr_roi", cropped.shape)))
+        texts.append(ocr_image_to_text(image, psm=region.psm).rstrip("\n\f"))
+    return "".join("\n\n" + text for text in texts) + "\n"
+
+
+def roi_template_cache_key(roi_key: str, params: Optional[dict] = None) -> str:
+    """
+    Args:
+        roi_key (str): Layout the template belongs to, e.g. the insurer name.
+        params (dict, optional): Rendering parameters the detection depends on.
+
+    Returns:
+        str: file name safe cache key.
+    """
+    payload = json.dumps({"version": ROI_TEMPLATE_VERSION, "roi_key": roi_key, "params": params or {}},
+                         sort_keys=True, ensure_ascii=False)
+    return "roi_" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_roi_template(cache_key: str, cache: Optional[OcrResultCache] = None) -> Optional[list]:
+    """
+    Returns:
+        list or None: OcrRegion items of the template, None if there is no template yet.
+    """
+    if cache_key not in _roi_templates and cache is not None:
+        entry = cache.get(cache_key)
+        if entry is not None:
+            _roi_templates[cache_key] = [OcrRegion(*region) for region in entry["regions"]]
+    return _roi_templates.get(cache_key)
+
+
+def save_roi_template(cache_key: str, regions: list, cache: Optional[OcrResultCache] = None):
+    """
+    Keep the template for the next documents of this process and, with a cache, of later runs and
+    other worker processes.
+    """
+    _roi_templates[cache_key] = regions
+    if cache is not None:
+        cache.put(cache_key, {"regions": [list(region) for region in regions]})
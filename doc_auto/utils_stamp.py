@@ -0,0 +1,101 @@
+import functools
+import io
+import re
+from typing import NamedTuple
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from doc_auto.utils_metrics import timed
+
+
+class StampAsset(NamedTuple):
+    """
+    A stamp image kept in memory.
+
+    Attributes:
+        data (bytes): content of the PNG file.
+        width (int): image width in pixels.
+        height (int): image height in pixels.
+    """
+    data: bytes
+    width: int
+    height: int
+
+
+@functools.lru_cache(maxsize=None)
+def get_stamp_asset(image_path: str) -> StampAsset:
+    """
+    Read a stamp image once per process and keep it in memory.
+
+    Args:
+        image_path (str): Path to the PNG image file.
+
+    Returns:
+        StampAsset: the stamp file content and its size.
+    """
+    with open(image_path, "rb") as file:
+        data = file.read()
+    with Image.open(io.BytesIO(data)) as image:  # Only parses the header
+        width, height = image.size
+    return StampAsset(data=data, width=width, height=height)
+
+
+def stamp_keyname_from_path(image_path: str) -> str:
+    """
+    Args:
+        image_path (str): Path to a stamp image named like "4_lsy_NoBG.png".
+
+    Returns:
+        str: the key name between the number and "_NoBG.png", e.g. "lsy".
+    """
+    pattern = r'\d+_(.*?)_NoBG.png'
+    match = re.search(pattern, image_path)
+    if match:
+        return match.group(1)
+    raise ValueError(f"No match found in {image_path}")
+
+
+@timed("stamp")
+def insert_stamp_images(
+        pdf_document: fitz.Document,
+        image_path: str,
+        page_numbers: list,
+        positions: list,
+        width=None,
+        height=None,
+) -> int:
+    """
+    Insert a stamp at every position of every page, embedding the image only once in the document.
+
+    The first insertion embeds the in-memory stamp, every following insertion references the same
+    image xref, so the stamp is decoded once per document and the output PDF holds one copy of it.
+
+    Args:
+        pdf_document (fitz.Document): the PDF document to stamp.
+        image_path (str): Path to the PNG image file.
+        page_numbers (list): 1-based page numbers where the image will be added.
+        positions (list of lists of tuples): (x, y) top-left corners of the image, one list per page.
+        width (float, optional): Desired width of the image. If None, the original image width is used.
+        height (float, optional): Desired height of the image. If None, the original image height is used.
+
+    Returns:
+        int: xref of the embedded stamp image, 0 if nothing was inserted.
+    """
+    stamp_asset = get_stamp_asset(image_path)
+    if not (width and height):
+        width, height = stamp_asset.width, stamp_asset.height  # Use the image's original dimensions
+
+    stamp_xref = 0
+    for page_todo, page_img_position in zip(page_numbers, positions):
+        target_page = pdf_document[page_todo - 1]  # Convert to 0-based index
+
+        # Insert the image at each position
+        for x, y in page_img_position:
+            rect = fitz.Rect(x, y, x + width, y + height)
+            if stamp_xref:
+                target_page.insert_image(rect, xref=stamp_xref)
+            else:
+                stamp_xref = target_page.insert_image(rect, stream=stamp_asset.data)
+
+    return stamp_xref
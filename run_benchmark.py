@@ -0,0 +1,28 @@
+import json
+import os
+
+from doc_auto.utils_bench import compare_benchmark_results
+from doc_auto.utils_bench import run_benchmarks
+from doc_auto.utils_bench import save_benchmark_results
+
+if __name__ == '__main__':
+    WORK_DIR = "res_benchmarks/work"
+    RESULTS_DIR = "res_benchmarks"
+    NUM_DOCS = 20
+    SCANNED = True  # Rasterized pages like the scanner outputs, False keeps a text layer
+    # BASELINE_RESULTS = "res_benchmarks/bench_20240101T120000_abc1234.json"
+    BASELINE_RESULTS = None
+
+    results = run_benchmarks(work_dir=WORK_DIR, num_docs=NUM_DOCS, scanned=SCANNED)
+    results_path = save_benchmark_results(results, out_dir=RESULTS_DIR)
+    print(f"Benchmark results saved to {results_path}")
+
+    for stage in results["stages"]:
+        print(f"{stage['stage']:<32} median {stage['median_ms']:8.1f} ms  p95 {stage['p95_ms']:8.1f} ms  "
+              f"{stage['docs_per_s']:7.2f} docs/s  peak py {stage['peak_python_mb']:6.1f} MB  "
+              f"max rss {stage['max_rss_mb']:7.1f} MB")
+
+    if BASELINE_RESULTS and os.path.exists(BASELINE_RESULTS):
+        with open(BASELINE_RESULTS, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        print("\n".join(compare_benchmark_results(baseline, results)))
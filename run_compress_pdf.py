@@ -1,9 +1,24 @@
-import os
-from doc_auto.utils_op import compress_pdf
+from doc_auto.utils_compress import COMPRESS_LEVEL_IMAGES
+from doc_auto.utils_compress import compress_pdfs_in_dir
 
-# Example usage
-root_dir = '/home/yujiema/my_github/doc-auto-insurance/res_outputs'
-for file in os.listdir(root_dir):
-    file_path = os.path.join(root_dir, file)
-    save_file_path = os.path.join(root_dir, os.path.splitext(file)[0] + "_cps" + os.path.splitext(file)[1])
-    compress_pdf(file_path, save_file_path)
+if __name__ == '__main__':
+    ROOT_DIR = '/home/yujiema/my_github/doc-auto-insurance/res_outputs'
+
+    results = compress_pdfs_in_dir(
+        root_dir=ROOT_DIR,
+        level=COMPRESS_LEVEL_IMAGES,  # Object streams, recompressed streams and scanned images at target_dpi
+        target_dpi=150,
+        jpeg_quality=75,
+        max_workers=None,
+        force=False,
+    )
+
+    total_saved = 0
+    for result in results:
+        if result is None:
+            continue
+        status = "up to date" if result.skipped else f"{result.bytes_saved} bytes saved"
+        print(f"{result.output_path}: {result.input_bytes} -> {result.output_bytes} bytes ({status})")
+        if not result.skipped:
+            total_saved += result.bytes_saved
+    print(f"Total saved: {total_saved} bytes")
@@ -1,37 +1,66 @@
 import os
-import fitz  # PyMuPDF
 
-from doc_auto.utils_page import extract_info_from_page_by_ocr
+from doc_auto.utils_async import run_pipeline_async
+from doc_auto.utils_cache import OcrResultCache
+from doc_auto.utils_debug import set_debug_artifacts
+from doc_auto.utils_metrics import Metrics
+from doc_auto.utils_metrics import emit_json_line
+from doc_auto.utils_metrics import profile_run
+from doc_auto.utils_ocr_backend import set_ocr_backend
+from doc_auto.utils_pipeline import stage_load
+from doc_auto.utils_pipeline import stage_ocr
+from doc_auto.utils_records import RecordSinks
+from doc_auto.utils_records import make_result_record
 
 if __name__ == '__main__':
     ROOT_PATH = "res_outputs"
     list_pdf = [os.path.join(ROOT_PATH, file) for file in os.listdir(ROOT_PATH) if file.endswith('.pdf')]
 
-    list_doc_ocr_results = []
-    for pdf_path in list_pdf:
-        pdf_document = fitz.open(pdf_path)
-
-        start_left_crop_x = 40  # Initial value for left crop X
-        while True:
-            try:
-                # Attempt to extract OCR information
-                info_1st_page, info_nr_plate = extract_info_from_page_by_ocr(
-                    doc=pdf_document, left_crop_x=start_left_crop_x
-                )
-                break  # Exit loop if successful
-            except Exception as e:
-                print(f"Error occurred: {e}, increasing start_left_crop_x to {start_left_crop_x + 1}")
-                start_left_crop_x += 1  # Increment and retry
-
-        list_doc_ocr_results.append(info_1st_page)
-
-    # Open the file in write mode (it will overwrite the file if it exists)
-    records_file = "res_output_ocr/results_ocr.txt"
-    with open(records_file, "w") as file:
-        for idx, item in enumerate(list_doc_ocr_results):
-            # Join the 7 strings with a space (or any separator you prefer)
-            file.write(f"## {idx + 1} ##\n")
-            file.write("\n".join(item) + "\n")
-            file.write(10 * "-" + "\n\n")
-
-    print(f"Data has been written to {records_file}")
+    PROFILE_DIR = None  # e.g. "res_output_ocr/profile" to save cProfile stats of this run
+    METRICS_PATH = "res_output_ocr/metrics.jsonl"
+    OCR_BACKEND = "auto"  # "tesserocr" keeps the language model loaded, "pytesseract" runs tesseract per call
+    MAX_WORKERS = None  # None uses all CPUs
+    DEBUG_DIR = None  # e.g. "res_output_ocr/debug" to save the preprocessed crops of failed OCR attempts
+    RECORDS_PATH = "res_output_ocr/results_ocr"  # results_ocr.csv, plus results_ocr.sqlite to look up by policy/plate
+    RECORD_FORMATS = ("csv", "sqlite")  # also "jsonl", or "xlsx" with openpyxl
+
+    set_ocr_backend(OCR_BACKEND)
+    set_debug_artifacts(DEBUG_DIR, sample="failures")
+
+    ocr_cache = OcrResultCache(cache_dir="res_cache_ocr")
+    jobs = [
+        dict(pdf_path=pdf_path, image_path=None, positions=None, idx_pdf_to_process=idx, use_ocr=True,
+             ocr_cache=ocr_cache)
+        for idx, pdf_path in enumerate(list_pdf)
+    ]
+    run_metrics = Metrics()
+
+    os.makedirs(os.path.dirname(METRICS_PATH), exist_ok=True)
+    # Records are appended as documents finish
+    with open(METRICS_PATH, "a") as metrics_file, RecordSinks(RECORDS_PATH, formats=RECORD_FORMATS) as record_sinks, \
+            profile_run(output_dir=PROFILE_DIR):
+        records_paths = record_sinks.paths
+
+        def handle_result(res):
+            if res.ok:
+                run_metrics.merge(res.result.metrics)
+            record_sinks.write(make_result_record(
+                pdf_path=res.job['pdf_path'],
+                info_1st_page=res.result.info_1st_page if res.ok else None,
+                info_nr_plate=res.result.info_nr_plate if res.ok else None,
+                ocr_attempts=res.result.ocr_attempts if res.ok else None,
+                timings=res.result.timings if res.ok else None,
+                error=res.error.strip().splitlines()[-1] if not res.ok else None,
+            ))
+            emit_json_line(metrics_file, "document", pdf_path=res.job['pdf_path'], ok=res.ok,
+                           ocr_attempts=res.result.ocr_attempts if res.ok else None,
+                           metrics=res.result.metrics if res.ok else None,
+                           error=res.error.strip().splitlines()[-1] if not res.ok else None)
+
+        # Only load and OCR: inputs are prefetched while the workers OCR
+        run_pipeline_async(jobs=jobs, on_result=handle_result, stages=(stage_load, stage_ocr),
+                           max_workers=MAX_WORKERS)
+        emit_json_line(metrics_file, "run_summary", num_docs=len(list_pdf), metrics=run_metrics.snapshot())
+
+    ocr_cache.evict()
+    print(f"Data has been written to {', '.join(records_paths)}")
@@ -1,76 +1,236 @@
 import os
-import re
+import time
+from typing import Optional
+
+from doc_auto.utils_async import run_pipeline_async
+from doc_auto.utils_cache import OcrResultCache
+from doc_auto.utils_debug import DEBUG_SAMPLE_FAILURES
+from doc_auto.utils_debug import set_debug_artifacts
 from doc_auto.utils_log import setup_logger
-from doc_auto.utils_op import insert_signatures
+from doc_auto.utils_manifest import JobManifest
+from doc_auto.utils_manifest import STATE_FAILED
+from doc_auto.utils_manifest import STATE_SIGNED
+from doc_auto.utils_manifest import scan_company_dirs
+from doc_auto.utils_metrics import Metrics
+from doc_auto.utils_metrics import emit_json_line
+from doc_auto.utils_metrics import profile_run
+from doc_auto.utils_ocr_backend import OCR_BACKEND_AUTO
+from doc_auto.utils_ocr_backend import TesserocrBackend
+from doc_auto.utils_ocr_backend import resolve_ocr_backend_name
+from doc_auto.utils_ocr_backend import set_ocr_backend
+from doc_auto.utils_pipeline import iter_pipeline
+from doc_auto.utils_placement import LEARNED_PLACEMENTS_PATH
+from doc_auto.utils_placement import learn_left_crop_x
+from doc_auto.utils_placement import load_placement_profiles
+from doc_auto.utils_records import RecordSinks
+from doc_auto.utils_records import make_result_record
 
 logger = setup_logger(__name__)
 
 
 def main(
-        dir_paths: list,
+        dir_paths: Optional[list] = None,
+        root_dir: str = os.path.dirname(os.path.abspath(__file__)),
         use_ocr: bool = False,
         create_blurred_pdf: bool = True,
+        max_workers: Optional[int] = None,
+        max_open: Optional[int] = None,
+        ocr_cache_dir: Optional[str] = "res_cache_ocr",
+        metrics_path: Optional[str] = "res_outputs/metrics.jsonl",
+        profile_dir: Optional[str] = None,
+        ocr_backend: str = OCR_BACKEND_AUTO,
+        use_roi_ocr: Optional[bool] = None,
+        async_io: bool = False,
+        debug_dir: Optional[str] = None,
+        debug_sample: str = DEBUG_SAMPLE_FAILURES,
+        debug_every_n: int = 1,
+        manifest_path: Optional[str] = "res_outputs/manifest.sqlite",
+        resume: bool = True,
+        learned_placements_path: Optional[str] = LEARNED_PLACEMENTS_PATH,
+        records_path: Optional[str] = "res_outputs/records",
+        record_formats: tuple = ("csv", "sqlite"),
 ):
-    # sign_page_numbers = None  # Insert which page number
-    sign_page_numbers = [3, 5]  # Insert which page number
-    positions = [
-        [(400, 190), (230, 250)],
-        # [(400, 190), (230, 250)]
-
-        [(400, 5), (230, 70)],
-    ]  # List of positions
-    # width, height = 100, 100  # Resize the signature (optional)
-    width, height = 120, 120  # Resize the signature (optional)
-
-    assets_dir = os.listdir("assets_stamps")
-    all_pdf_extracted_info = []
-
-    for sub_d in DIR_PATHS:
-
-        pattern = r'c\d+_(\w+)'
-        c_keyname = re.match(pattern, sub_d).group(1)
-        sign_filename = [s_file for s_file in assets_dir if c_keyname in s_file][0]
-        sign_filepath = os.path.join("assets_stamps", sign_filename)
-
-        sub_d_path = os.path.join(ROOT_DIR, sub_d)
-        pdf_paths = sorted([os.path.join(sub_d_path, f_name) for f_name in os.listdir(sub_d_path)])
-
-        for idx_pdf_to_process, pdf_path in enumerate(pdf_paths):
-            logger.info(f'Processing :{pdf_path}')
-
-            extract_info = insert_signatures(
-                pdf_path=pdf_path,
-                image_path=sign_filepath,
-                positions=positions,
-                width=width,
-                height=height,
-                page_numbers=sign_page_numbers,
-                output_path=None,
-                use_ocr=use_ocr,
-                create_blurred_pdf=create_blurred_pdf,
-                idx_pdf_to_process=idx_pdf_to_process,
-            )
-            all_pdf_extracted_info.append(extract_info)
+    if use_roi_ocr is None:
+        # One OCR call per region: cheaper than the full crop with the in-process engine only, pytesseract
+        # would start tesseract once per region
+        use_roi_ocr = resolve_ocr_backend_name(ocr_backend) == TesserocrBackend.name
+    ocr_cache = OcrResultCache(cache_dir=ocr_cache_dir) if ocr_cache_dir else None
+    manifest = JobManifest(db_path=manifest_path) if manifest_path else None
+
+    # The company folders are listed once, the manifest keeps the state of each document between runs
+    documents = scan_company_dirs(root_dir=root_dir, dir_paths=dir_paths)
+    entries = manifest.sync(documents) if manifest is not None else [None] * len(documents)
+    # Stamp, positions, redaction and OCR start of each company, resolved once
+    profiles = load_placement_profiles(companies=[document.company for document in documents],
+                                       learned_path=learned_placements_path)
+
+    jobs = []
+    skipped = []  # entries of documents completed by a previous run
+    idx_per_company = {}
+    for document, entry in zip(documents, entries):
+        c_keyname = document.company
+        # idx_pdf_to_process is numbered per company before dispatch, so it does not depend on worker scheduling
+        idx_pdf_to_process = idx_per_company.get(c_keyname, 0)
+        idx_per_company[c_keyname] = idx_pdf_to_process + 1
+
+        if resume and entry is not None and entry.is_complete:
+            skipped.append(entry)
+            continue
+
+        profile = profiles[c_keyname]
+        if profile.stamp_path is None:
+            raise ValueError(f"No stamp of {c_keyname} in assets_stamps")
+
+        job = dict(
+            pdf_path=document.pdf_path,
+            image_path=profile.stamp_path,
+            positions=profile.positions,
+            width=profile.width,
+            height=profile.height,
+            page_numbers=profile.page_numbers,
+            redact_rect=profile.redact_rect,
+            ocr_start_left_crop_x=profile.left_crop_x,
+            output_path=None,
+            use_ocr=use_ocr,
+            create_blurred_pdf=create_blurred_pdf,
+            idx_pdf_to_process=idx_pdf_to_process,
+            ocr_cache=ocr_cache,
+            ocr_roi_key=c_keyname if use_roi_ocr else None,  # Documents of one company share the layout
+            manifest=manifest,
+        )
+        if resume and use_ocr and entry is not None and entry.has_ocr_result:
+            # OCR done by an interrupted run
+            job.update(info_1st_page=entry.info_1st_page, info_nr_plate=entry.info_nr_plate)
+        jobs.append(job)
+
+    if skipped:
+        logger.info(f"Skipping {len(skipped)} pdf files completed by a previous run")
 
     if use_ocr:
-        # Open the file in write mode (it will overwrite the file if it exists)
-        with open("res_outputs/records.txt", "w") as file:
-            for idx, item in enumerate(all_pdf_extracted_info):
-                # Join the 7 strings with a space (or any separator you prefer)
-                file.write(f"## {idx + 1} ##\n")
-                file.write("\n".join(item) + "\n")
-                file.write(10 * "-" + "\n\n")
-
-        print("Data has been written to records.txt.")
+        set_ocr_backend(ocr_backend)  # Inherited by the worker processes, each loads its engine once
+        logger.info(f"OCR backend: {resolve_ocr_backend_name(ocr_backend)}")
+        # Preprocessed OCR crops saved by the workers in the background, e.g. only of failed attempts
+        set_debug_artifacts(debug_dir, sample=debug_sample, every_n=debug_every_n)
+    logger.info(f"Processing {len(jobs)} pdf files")
+    failed_pdf_paths = []
+    ocr_left_crop_xs = []  # (pdf path, left crop the OCR succeeded with)
+    run_metrics = Metrics()
+    run_start = time.perf_counter()
+
+    # One row per document as it finishes, appended to the records of the previous runs (e.g. records.csv) and
+    # indexed by policy number and plate (records.sqlite, see utils_records.find_records). Documents skipped
+    # above were recorded by the run that processed them.
+    company_of = {document.pdf_path: document.company for document in documents}
+    record_sinks = RecordSinks(records_path, formats=record_formats) if records_path else None
+
+    # Structured per document and per run metrics, appended as JSON lines
+    metrics_file = None
+    if metrics_path:
+        os.makedirs(os.path.dirname(metrics_path) or ".", exist_ok=True)
+        metrics_file = open(metrics_path, "a")
+
+    try:
+        with profile_run(output_dir=profile_dir):
+            if async_io:
+                # Inputs prefetched and outputs written behind the workers, for slow (network) storage
+                run_pipeline_async(
+                    jobs=jobs,
+                    on_result=lambda res: _handle_result(res, company_of[res.job['pdf_path']], record_sinks,
+                                                         metrics_file, manifest, run_metrics, failed_pdf_paths,
+                                                         ocr_left_crop_xs),
+                    max_workers=max_workers,
+                    prefetch=max_open,
+                )
+            else:
+                for res in iter_pipeline(jobs=jobs, max_workers=max_workers, max_open=max_open):
+                    _handle_result(res, company_of[res.job['pdf_path']], record_sinks, metrics_file, manifest,
+                                   run_metrics, failed_pdf_paths, ocr_left_crop_xs)
+    finally:
+        if metrics_file is not None:
+            emit_json_line(
+                metrics_file, "run_summary",
+                num_docs=len(jobs),
+                num_skipped=len(skipped),
+                num_failed=len(failed_pdf_paths),
+                wall_s=round(time.perf_counter() - run_start, 3),
+                max_workers=max_workers,
+                metrics=run_metrics.snapshot(),
+            )
+            metrics_file.close()
+        if record_sinks is not None:
+            print(f"Data has been written to {', '.join(record_sinks.paths)}.")
+            record_sinks.close()
+        if ocr_cache is not None:
+            ocr_cache.evict()
+        if manifest is not None:
+            logger.info(f"Manifest {manifest_path}: {manifest.counts()}")
+            manifest.close()
+        if learned_placements_path and ocr_left_crop_xs:
+            left_crop_xs = {}
+            for pdf_path, left_crop_x in ocr_left_crop_xs:
+                left_crop_xs.setdefault(company_of[pdf_path], []).append(left_crop_x)
+            learn_left_crop_x(left_crop_xs, path=learned_placements_path)
+
+    if failed_pdf_paths:
+        logger.error(f"{len(failed_pdf_paths)} pdf files failed: {failed_pdf_paths}")
+
+
+def _handle_result(res, company: str, record_sinks: Optional[RecordSinks], metrics_file,
+                   manifest: Optional[JobManifest], run_metrics: Metrics, failed_pdf_paths: list,
+                   ocr_left_crop_xs: list):
+    if res.ok:
+        timings = ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in res.result.timings.items())
+        logger.info(f"Processed {res.result.pdf_path} -> {res.result.output_path} ({timings})")
+        run_metrics.merge(res.result.metrics)
+        if res.result.ocr_left_crop_x is not None:
+            ocr_left_crop_xs.append((res.job['pdf_path'], res.result.ocr_left_crop_x))
+    else:
+        failed_pdf_paths.append(res.job['pdf_path'])
+
+    # Recorded once the outputs are written, a crash before this point processes the document again
+    if manifest is not None:
+        if res.ok:
+            manifest.checkpoint(res.job['pdf_path'], STATE_SIGNED, output_path=res.result.output_path,
+                                blurred_output_path=res.result.blurred_output_path,
+                                info_1st_page=res.result.info_1st_page, info_nr_plate=res.result.info_nr_plate,
+                                error=None)
+        else:
+            manifest.checkpoint(res.job['pdf_path'], STATE_FAILED, error=res.error.strip().splitlines()[-1])
+
+    if record_sinks is not None:
+        record_sinks.write(make_result_record(
+            pdf_path=res.job['pdf_path'],
+            company=company,
+            info_1st_page=res.result.info_1st_page if res.ok else None,
+            info_nr_plate=res.result.info_nr_plate if res.ok else None,
+            output_path=res.result.output_path if res.ok else None,
+            ocr_attempts=res.result.ocr_attempts if res.ok else None,
+            timings=res.result.timings if res.ok else None,
+            error=res.error.strip().splitlines()[-1] if not res.ok else None,
+        ))
+
+    if metrics_file is not None:
+        emit_json_line(
+            metrics_file, "document",
+            index=res.index,
+            pdf_path=res.job['pdf_path'],
+            ok=res.ok,
+            output_path=res.result.output_path if res.ok else None,
+            ocr_attempts=res.result.ocr_attempts if res.ok else None,
+            stages={stage: round(seconds, 6) for stage, seconds in res.result.timings.items()} if res.ok else None,
+            metrics=res.result.metrics if res.ok else None,
+            error=res.error.strip().splitlines()[-1] if not res.ok else None,
+        )
 
 
 if __name__ == "__main__":
     ROOT_DIR = os.path.dirname(__file__)
 
-    # DIR_PATHS = [d for d in os.listdir(ROOT_DIR) if d.startswith('c')]
-    DIR_PATHS = [d for d in os.listdir(ROOT_DIR) if d.startswith('c4')]
+    # None processes every c<number>_<name> company folder, e.g. ["c4_warta"] only that one
+    DIR_PATHS = None
 
     logger.info(f"Main root path: {ROOT_DIR}")
     logger.info(f"{DIR_PATHS}")
 
-    main(dir_paths=DIR_PATHS, use_ocr=True, create_blurred_pdf=True)
+    # Documents signed by a previous run with unchanged inputs are skipped, resume=False processes all again
+    main(dir_paths=DIR_PATHS, root_dir=ROOT_DIR, use_ocr=True, create_blurred_pdf=True, max_workers=None, resume=True)
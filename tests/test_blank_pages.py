@@ -0,0 +1,74 @@
+import fitz  # PyMuPDF
+import numpy as np
+import pytest
+
+from doc_auto.utils_page import identify_blank_pages
+from doc_auto.utils_page import page_ink_features
+
+
+def baseline_white_fractions(doc: fitz.Document) -> list:
+    # The original detector: mean of the channels of the default 72 dpi RGB pixmap, above 250 is near-white
+    white_fractions = []
+    for page_number in range(len(doc)):
+        pix = doc[page_number].get_pixmap()
+        img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        gray_img = np.mean(img[:, :, :3], axis=2)
+        white_fractions.append(np.sum(gray_img > 250) / gray_img.size)
+    return white_fractions
+
+
+def baseline_identify_blank_pages(doc: fitz.Document, threshold=0.99) -> list:
+    return [page_number + 1 for page_number, white_fraction in enumerate(baseline_white_fractions(doc))
+            if white_fraction > threshold]
+
+
+def _add_text_lines(page: fitz.Page, num_lines: int, color=(0, 0, 0)):
+    for line in range(num_lines):
+        page.insert_text((72, 100 + 14 * line), f"Line {line} of the policy conditions, paragraph {line % 7}",
+                         fontsize=11, color=color)
+
+
+@pytest.fixture
+def mixed_document():
+    doc = fitz.open()
+    _add_text_lines(doc.new_page(), num_lines=40)  # Text page
+    doc.new_page()  # Empty page
+    _add_text_lines(doc.new_page(), num_lines=3)  # Nearly blank, close to the threshold
+    _add_text_lines(doc.new_page(), num_lines=1)
+    _add_text_lines(doc.new_page(width=842, height=595), num_lines=5)  # Landscape, stacked with A4 pages
+    _add_text_lines(doc.new_page(), num_lines=120, color=(1, 1, 1))  # Lots of white-on-white text
+    for color in ((1, 1, 0.92), (0.92, 1, 1), (0.985, 0.985, 1)):
+        # Light backgrounds whose luma and channel mean fall on either side of the white level
+        page = doc.new_page()
+        page.draw_rect(page.rect, color=None, fill=color)
+    rng = np.random.default_rng(0)
+    for noise_level in (2, 12):
+        # Scanned pages: an image with scanner noise, on the white side or not
+        page = doc.new_page()
+        scan = (255 - rng.integers(0, noise_level, size=(842, 595, 3))).astype(np.uint8)
+        pix = fitz.Pixmap(fitz.csRGB, 595, 842, scan.tobytes(), False)
+        page.insert_image(page.rect, pixmap=pix)
+    yield doc
+    doc.close()
+
+
+def test_per_page_detection_matches_baseline(mixed_document):
+    expected = baseline_identify_blank_pages(mixed_document)
+    assert identify_blank_pages(document=mixed_document, batched=False) == expected
+    # Both sides of the threshold are covered
+    assert 0 < len(expected) < len(mixed_document)
+
+
+def test_batched_detection_matches_baseline(mixed_document):
+    expected = baseline_identify_blank_pages(mixed_document)
+    assert identify_blank_pages(document=mixed_document) == expected
+    for threshold in (0.985, 0.995):
+        assert (identify_blank_pages(document=mixed_document, threshold=threshold)
+                == baseline_identify_blank_pages(mixed_document, threshold=threshold))
+
+
+def test_page_ink_features_match_baseline_white_fractions(mixed_document):
+    features = page_ink_features(mixed_document)
+    assert [f.white_fraction for f in features] == pytest.approx(baseline_white_fractions(mixed_document), abs=1e-12)
+    assert features[1].ink_top is None  # Empty page
+    assert 0 < features[2].ink_top < features[2].ink_bottom < 0.25  # 3 lines at the top
@@ -0,0 +1,73 @@
+import os
+import re
+
+import fitz  # PyMuPDF
+import pytest
+
+from doc_auto import utils_fields
+from doc_auto.utils_cache import OcrResultCache
+from doc_auto.utils_cache import hash_page_content
+from doc_auto.utils_fields import field_specs_fingerprint
+from doc_auto.utils_ocr_backend import OCR_BACKEND_ENV
+from doc_auto.utils_page import ocr_cache_params
+
+
+def make_document(text: str) -> fitz.Document:
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), text)
+    return doc
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return OcrResultCache(cache_dir=str(tmp_path), max_size_bytes=10 ** 6)
+
+
+def test_cache_hits_pages_with_the_same_content_only(cache):
+    doc, same_doc, other_doc = make_document("Polisa nr 1"), make_document("Polisa nr 1"), make_document("Polisa nr 2")
+    key = hash_page_content(doc, params={"zoom": 2.0})
+    assert cache.get(key) is None
+    cache.put(key, {"info_1st_page": ["a"], "left_crop_x": 41})
+
+    assert cache.get(hash_page_content(same_doc, params={"zoom": 2.0})) == {"info_1st_page": ["a"], "left_crop_x": 41}
+    assert cache.get(hash_page_content(other_doc, params={"zoom": 2.0})) is None
+    assert cache.get(hash_page_content(same_doc, params={"zoom": 3.0})) is None  # Other OCR parameters
+
+
+def test_eviction_removes_the_least_recently_used_entries(cache, tmp_path):
+    entry = {"info_1st_page": ["x" * 100]}
+    for num, key in enumerate(("old", "used", "new")):
+        cache.put(key, entry)
+        os.utime(tmp_path / f"{key}.json", (1000 + num, 1000 + num))
+    assert cache.get("used") is not None  # Refreshes its modification time
+    cache.max_size_bytes = 2 * os.path.getsize(tmp_path / "new.json")
+
+    assert cache.evict() == 1
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["new.json", "used.json"]
+
+
+def test_eviction_runs_every_evict_every_writes(tmp_path):
+    cache = OcrResultCache(cache_dir=str(tmp_path), max_size_bytes=0, evict_every=3)
+    cache.put("a", {})
+    cache.put("b", {})
+    assert len(list(tmp_path.iterdir())) == 2
+    cache.put("c", {})
+    assert not list(tmp_path.iterdir())
+
+
+def test_cache_params_change_with_the_ocr_backend(monkeypatch):
+    monkeypatch.setenv(OCR_BACKEND_ENV, "pytesseract")
+    pytesseract_params = ocr_cache_params()
+    monkeypatch.setenv(OCR_BACKEND_ENV, "tesserocr")
+    assert ocr_cache_params() != pytesseract_params
+
+
+def test_field_specs_fingerprint_changes_with_a_regex_or_a_validator():
+    fingerprint = field_specs_fingerprint()
+    assert field_specs_fingerprint() == fingerprint
+    specs = list(utils_fields.FIELD_SPECS)
+    specs[3] = specs[3]._replace(pattern=re.compile(r"kwota:\s*([\d\s]+)\s?zł"))
+    assert field_specs_fingerprint(tuple(specs)) != fingerprint
+    specs = list(utils_fields.FIELD_SPECS)
+    specs[2] = specs[2]._replace(validate=lambda value: len(value) == 28)
+    assert field_specs_fingerprint(tuple(specs)) != fingerprint
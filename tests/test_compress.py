@@ -0,0 +1,49 @@
+import zlib
+
+import numpy as np
+import pikepdf
+import pytest
+
+from doc_auto.utils_compress import downsample_images
+
+
+def _scanned_pdf(decode=None) -> pikepdf.Pdf:
+    # One A4 page covered by a 300 dpi 8-bit gray scan
+    width, height = 2480, 3508
+    # Paper with scanner noise, which flate compresses poorly
+    samples = np.random.default_rng(0).integers(215, 245, size=(height, width), dtype=np.uint8)
+    samples[::40, :] = 20  # Text lines
+    pdf = pikepdf.new()
+    image = pikepdf.Stream(pdf, zlib.compress(samples.tobytes()))
+    image.Type, image.Subtype = pikepdf.Name.XObject, pikepdf.Name.Image
+    image.Width, image.Height = width, height
+    image.ColorSpace, image.BitsPerComponent = pikepdf.Name.DeviceGray, 8
+    image.Filter = pikepdf.Name.FlateDecode
+    if decode is not None:
+        image.Decode = pikepdf.Array(decode)
+    page = pdf.add_blank_page(page_size=(595, 842))
+    page.Resources = pikepdf.Dictionary(XObject=pikepdf.Dictionary(Im0=image))
+    page.Contents = pdf.make_stream(b"q 595 0 0 842 0 0 cm /Im0 Do Q")
+    return pdf
+
+
+@pytest.mark.parametrize("decode", [None, [0, 1]])
+def test_downsample_default_decode(decode):
+    pdf = _scanned_pdf(decode=decode)
+    assert downsample_images(pdf, target_dpi=150) == 1
+    image = pdf.pages[0].Resources.XObject.Im0
+    assert image.Filter == pikepdf.Name.DCTDecode
+    assert "/Decode" not in image
+    samples = np.asarray(pikepdf.PdfImage(image).as_pil_image())
+    assert samples.mean() > 128  # Still a light page
+
+
+def test_downsample_skips_inverted_decode():
+    pdf = _scanned_pdf(decode=[1, 0])
+    image = pdf.pages[0].Resources.XObject.Im0
+    raw_bytes = image.read_raw_bytes()
+
+    assert downsample_images(pdf, target_dpi=150) == 0
+    assert image.Filter == pikepdf.Name.FlateDecode
+    assert image.read_raw_bytes() == raw_bytes
+    assert list(image.Decode) == [1, 0]
@@ -0,0 +1,139 @@
+import fitz  # PyMuPDF
+import pytest
+
+from doc_auto import utils_page
+from doc_auto import utils_roi
+from doc_auto.utils_cache import OcrResultCache
+from doc_auto.utils_fields import extract_fields
+from doc_auto.utils_ocr_backend import OcrWord
+from doc_auto.utils_page import OCR_START_LEFT_CROP_X
+from doc_auto.utils_page import extract_info_with_crop_search
+
+FIELDS_TEXT = (
+    "ACME SPÓŁKA Z OGRANICZONĄ ODPOWIEDZIALNOŚCIĄ\nnumer polisy: 123456789\n"
+    "\n\nadres: KRAKOWSKA 45\n\n\n\nPłatności\n\nodbiorca: TOWARZYSTWO UBEZPIECZEŃ SA\n"
+    "ul. Postępu 5\nnr rachunku: 12345678901234567890123456\ntytuł: Polisa\nkwota: 100 zł\n"
+    "termin płatności: 2024-01-31\n"
+)
+
+
+@pytest.fixture
+def ocr_at(monkeypatch):
+    """
+    Fake OCR that only reads the fields at the given left crops, records the crops tried.
+    """
+    tried = []
+
+    def use(*left_crop_xs):
+        def fake_ocr(doc, left_crop_x, rendered_page=None, debug_name=None, attempt=0, preset=None):
+            tried.append(left_crop_x)
+            return extract_fields(FIELDS_TEXT if left_crop_x in left_crop_xs else "")
+        monkeypatch.setattr(utils_page, "extract_record_from_page_by_ocr", fake_ocr)
+        return tried
+    return use
+
+
+@pytest.fixture(autouse=True)
+def no_roi_templates(monkeypatch):
+    monkeypatch.setattr(utils_roi, "_roi_templates", {})
+
+
+@pytest.fixture
+def scanned_doc():
+    doc = fitz.open()
+    page = doc.new_page()
+    page.draw_rect(fitz.Rect(50, 300, 300, 320), fill=(0, 0, 0))  # No text layer
+    yield doc
+    doc.close()
+
+
+def test_crop_search_finds_smaller_crop_than_learnt_start(ocr_at, scanned_doc):
+    tried = ocr_at(OCR_START_LEFT_CROP_X + 1)
+    _, _, _, left_crop_x = extract_info_with_crop_search(scanned_doc, start_left_crop_x=OCR_START_LEFT_CROP_X + 5,
+                                                         presets=("autocontrast",))
+    assert left_crop_x == OCR_START_LEFT_CROP_X + 1
+    assert tried == [45, 44, 46, 43, 47, 42, 48, 41]
+
+
+def test_crop_search_covers_the_whole_range_from_a_learnt_start(ocr_at, scanned_doc):
+    tried = ocr_at(OCR_START_LEFT_CROP_X + 59)
+    _, _, _, left_crop_x = extract_info_with_crop_search(scanned_doc, start_left_crop_x=OCR_START_LEFT_CROP_X + 5,
+                                                         presets=("autocontrast",))
+    assert left_crop_x == OCR_START_LEFT_CROP_X + 59
+    assert sorted(tried) == list(range(OCR_START_LEFT_CROP_X, OCR_START_LEFT_CROP_X + 60))
+
+
+def test_cache_key_does_not_depend_on_the_search_start(ocr_at, scanned_doc, tmp_path):
+    cache = OcrResultCache(cache_dir=str(tmp_path))
+    tried = ocr_at(50)
+    first = extract_info_with_crop_search(scanned_doc, start_left_crop_x=48, cache=cache, presets=("autocontrast",))
+    num_tried = len(tried)
+    second = extract_info_with_crop_search(scanned_doc, start_left_crop_x=42, cache=cache, presets=("autocontrast",))
+    assert len(tried) == num_tried  # Cache hit, no OCR
+    assert second[:2] == first[:2]
+    assert second[3] == first[3] == 50
+
+
+def text_to_words(text: str) -> list:
+    return [OcrWord(text=word, left=10 * word_num, top=20 * line_num, width=8, height=12, conf=90.0,
+                    block_num=block_num, par_num=1, line_num=line_num)
+            for block_num, paragraph in enumerate(text.split("\n\n"))
+            for line_num, line in enumerate(paragraph.splitlines())
+            for word_num, word in enumerate(line.split())]
+
+
+@pytest.fixture
+def layout_ocr(monkeypatch):
+    """
+    Fake layout pass of the ROI OCR returning the words of the given text, records the crops it ran on.
+    """
+    layout_crops = []
+
+    def use(text):
+        def fake_crop_for_ocr(self, left_crop_x, preset="autocontrast"):
+            layout_crops.append((left_crop_x, preset))
+        monkeypatch.setattr(utils_page.RenderedPage, "crop_for_ocr", fake_crop_for_ocr)
+        monkeypatch.setattr(utils_page, "ocr_image_to_words", lambda image: text_to_words(text))
+        return layout_crops
+    return use
+
+
+def test_roi_layout_fields_are_kept_when_detection_fails(ocr_at, layout_ocr, scanned_doc, tmp_path):
+    tried = ocr_at()
+    layout_crops = layout_ocr(FIELDS_TEXT)  # No plate line, the regions are not found
+    cache = OcrResultCache(cache_dir=str(tmp_path))
+    info_1st_page, _, num_attempts, left_crop_x = extract_info_with_crop_search(
+        scanned_doc, start_left_crop_x=45, cache=cache, roi_key="acme", presets=("autocontrast",)
+    )
+    assert info_1st_page == extract_fields(FIELDS_TEXT).important_info()
+    assert (num_attempts, left_crop_x) == (1, 45)
+    assert layout_crops == [(45, "autocontrast")]
+    assert tried == []  # The full crop is not OCR'd again
+    assert not list(tmp_path.glob("roi_*.json"))  # No template
+
+
+def test_crop_search_skips_the_crop_of_the_roi_layout_pass(ocr_at, layout_ocr, scanned_doc):
+    tried = ocr_at(46)
+    layout_ocr("Płatności\n\nkwota: 100 zł\n")
+    _, _, num_attempts, left_crop_x = extract_info_with_crop_search(scanned_doc, start_left_crop_x=45,
+                                                                    roi_key="acme", presets=("autocontrast",))
+    assert left_crop_x == 46
+    assert tried == [44, 46]
+    assert num_attempts == 3  # The layout pass counts as the 1st attempt
+
+
+def test_roi_template_is_saved_only_when_every_field_is_found(layout_ocr, ocr_at, scanned_doc, tmp_path):
+    ocr_at(45)
+    plate_text = FIELDS_TEXT + "\n\nnr rejestracyjny: WA 12345\n"
+    layout_ocr(plate_text.replace("kwota: 100 zł\n", ""))  # Regions found, amount missing
+    cache = OcrResultCache(cache_dir=str(tmp_path))
+    extract_info_with_crop_search(scanned_doc, start_left_crop_x=45, cache=cache, roi_key="acme",
+                                  presets=("autocontrast", "adaptive"))
+    assert not list(tmp_path.glob("roi_*.json"))
+
+    for entry_path in tmp_path.glob("*.json"):
+        entry_path.unlink()  # Not the cached result of the 1st run
+    layout_ocr(plate_text)
+    extract_info_with_crop_search(scanned_doc, start_left_crop_x=45, roi_key="acme", cache=cache,
+                                  presets=("autocontrast", "adaptive"), use_text_layer=False)
+    assert len(list(tmp_path.glob("roi_*.json"))) == 1
@@ -0,0 +1,30 @@
+from doc_auto.utils_fields import extract_fields
+
+PAYMENT_TEXT = (
+    "ACME SPÓŁKA Z OGRANICZONĄ ODPOWIEDZIALNOŚCIĄ\n"
+    "numer polisy: 123456789\n"
+    "\n\nadres: ALEJA KRAKOWSKA 45,\n00-802 WARSZAWA\n\n"
+    "\n\nPłatności\n\n"
+    "odbiorca: TOWARZYSTWO UBEZPIECZEŃ SA\n"
+    "ul. Postępu 5, 02-567 Warszawa\n"
+    "nr rachunku: {account}\n"
+    "tytuł: Polisa 123456789\n"
+    "kwota: 1 234 zł\n"
+    "termin płatności: 2024-01-31\n"
+)
+
+
+def test_fields_are_cleaned_up_after_validation():
+    record = extract_fields(PAYMENT_TEXT.format(account="12 3456 7890 1234 5678 9012 3456"))
+    assert record.ok
+    assert record.value("bank_account") == "12345678901234567890123456"
+    assert record.value("company_address") == "al KRAKOWSKA 45,00-802 WARSZAWA"
+    assert record.value("policy_number") == "Polisa nr 123456789"
+    assert record.value("company") == "ACME sp. z o.o."
+
+
+def test_bank_account_length_is_checked_before_line_breaks_are_removed():
+    # 26 digits once the line break is removed, 27 characters as read: invalid like the original extraction
+    record = extract_fields(PAYMENT_TEXT.format(account="12 3456 7890 1234\n5678 9012 3456"))
+    assert "bank_account" in record.missing
+    assert record.fields["bank_account"].value == "12345678901234\n567890123456"
@@ -0,0 +1,102 @@
+import os
+import pickle
+
+import pytest
+
+from doc_auto.utils_manifest import STATE_FAILED
+from doc_auto.utils_manifest import STATE_OCR_DONE
+from doc_auto.utils_manifest import STATE_PENDING
+from doc_auto.utils_manifest import STATE_SIGNED
+from doc_auto.utils_manifest import JobManifest
+from doc_auto.utils_manifest import scan_company_dirs
+
+INFO_1ST_PAGE = ["TU SA", "ul. Postępu 5", "12345678901234567890123456", "100", "ACME sp. z o.o.",
+                 "Polisa nr 123456789", "KRAKOWSKA 45"]
+
+
+@pytest.fixture
+def input_dir(tmp_path):
+    for company_dir, names in (("c1_acme", ("a.pdf", "b.pdf")), ("c2_beta", ("c.pdf",))):
+        os.makedirs(tmp_path / company_dir)
+        for name in names:
+            (tmp_path / company_dir / name).write_bytes(b"%PDF-1.4 " + name.encode())
+    (tmp_path / "c1_acme" / "notes.txt").write_text("not a pdf")
+    return tmp_path
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    manifest = JobManifest(db_path=str(tmp_path / "out" / "manifest.sqlite"))
+    yield manifest
+    manifest.close()
+
+
+def sign(manifest, entry, tmp_path):
+    output_path = tmp_path / f"signed_{os.path.basename(entry.pdf_path)}"
+    output_path.write_bytes(b"%PDF-1.4 signed")
+    manifest.checkpoint(entry.pdf_path, STATE_SIGNED, output_path=str(output_path))
+    return output_path
+
+
+def test_scan_lists_the_pdfs_of_the_company_dirs(input_dir):
+    documents = scan_company_dirs(str(input_dir))
+    assert [(os.path.basename(d.pdf_path), d.company) for d in documents] == [
+        ("a.pdf", "acme"), ("b.pdf", "acme"), ("c.pdf", "beta")
+    ]
+
+
+def test_resume_skips_the_documents_signed_by_a_previous_run(input_dir, manifest, tmp_path):
+    entries = manifest.sync(scan_company_dirs(str(input_dir)))
+    assert [entry.state for entry in entries] == [STATE_PENDING] * 3
+    sign(manifest, entries[0], tmp_path)
+    manifest.close()  # End of the interrupted run
+
+    entries = JobManifest(db_path=manifest.db_path).sync(scan_company_dirs(str(input_dir)))
+    assert [entry.is_complete for entry in entries] == [True, False, False]
+    assert manifest.counts() == {STATE_SIGNED: 1, STATE_PENDING: 2}
+
+
+def test_signed_document_is_processed_again_when_its_input_or_output_changed(input_dir, manifest, tmp_path):
+    entries = manifest.sync(scan_company_dirs(str(input_dir)))
+    sign(manifest, entries[0], tmp_path)
+    sign(manifest, entries[1], tmp_path)
+
+    (input_dir / "c1_acme" / "a.pdf").write_bytes(b"%PDF-1.4 a new version")
+    os.remove(tmp_path / "signed_b.pdf")
+    entries = manifest.sync(scan_company_dirs(str(input_dir)))
+    assert entries[0].state == STATE_PENDING and entries[0].output_path is None  # Input changed
+    assert entries[1].state == STATE_SIGNED and not entries[1].is_complete  # Output removed
+
+
+def test_failed_documents_are_retried_with_their_ocr_result(input_dir, manifest):
+    entries = manifest.sync(scan_company_dirs(str(input_dir)))
+    manifest.checkpoint(entries[0].pdf_path, STATE_OCR_DONE, info_1st_page=INFO_1ST_PAGE, info_nr_plate=["WA 1"])
+    manifest.checkpoint(entries[0].pdf_path, STATE_FAILED, error="OSError: disk full")
+    manifest.checkpoint(entries[1].pdf_path, STATE_FAILED, error="ValueError: OCR failed")
+
+    entries = manifest.sync(scan_company_dirs(str(input_dir)))
+    assert [entry.state for entry in entries[:2]] == [STATE_FAILED, STATE_FAILED]
+    assert not any(entry.is_complete for entry in entries)
+    assert entries[0].has_ocr_result and entries[0].info_1st_page == INFO_1ST_PAGE
+    assert entries[0].info_nr_plate == ["WA 1"] and entries[0].error == "OSError: disk full"
+    assert not entries[1].has_ocr_result
+
+
+def test_pickled_manifest_opens_its_own_wal_connection(input_dir, manifest):
+    entries = manifest.sync(scan_company_dirs(str(input_dir)))
+    worker_manifest = pickle.loads(pickle.dumps(manifest))  # As sent to a worker process
+    assert worker_manifest._conn is None
+
+    worker_manifest.checkpoint(entries[0].pdf_path, STATE_OCR_DONE, info_1st_page=INFO_1ST_PAGE)
+    assert worker_manifest._connection() is not manifest._connection()
+    assert worker_manifest._connection().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert manifest.get(entries[0].pdf_path).state == STATE_OCR_DONE  # Seen by the main process
+    worker_manifest.close()
+
+
+def test_connection_is_reopened_in_a_forked_worker(manifest, monkeypatch):
+    parent_conn = manifest._connection()
+    monkeypatch.setattr(os, "getpid", lambda: -1)  # A worker forked after the connection was opened
+    assert manifest._connection() is not parent_conn
+    manifest.close()
+    parent_conn.close()
@@ -0,0 +1,67 @@
+import os
+
+import fitz  # PyMuPDF
+import pytest
+from PIL import Image
+
+from doc_auto.utils_bench import make_synthetic_policy_pdf
+from doc_auto.utils_pipeline import REDACT_RECT
+from doc_auto.utils_pipeline import process_document
+
+
+@pytest.fixture
+def job(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # The blurred outputs are written to res_outputs_blurred
+    pdf_path = str(tmp_path / "policy.pdf")
+    make_synthetic_policy_pdf(pdf_path, seed=1, scanned=False)
+    image_path = str(tmp_path / "1_test_NoBG.png")
+    Image.new("RGBA", (64, 64), (200, 0, 0, 128)).save(image_path)
+    return dict(
+        pdf_path=pdf_path,
+        image_path=image_path,
+        positions=[[(400, 190)]],
+        width=120,
+        height=120,
+        page_numbers=[4],
+        idx_pdf_to_process=0,
+        output_path=str(tmp_path / "policy_signed.pdf"),
+        use_ocr=True,
+        create_blurred_pdf=True,
+    )
+
+
+def _num_drawings(pdf_path: str, page_number: int = 0) -> int:
+    with fitz.open(pdf_path) as doc:
+        return len(doc[page_number].get_drawings())
+
+
+def test_signed_output_is_not_covered(job):
+    num_input_drawings = _num_drawings(job["pdf_path"])
+    result = process_document(**job)
+
+    assert _num_drawings(result.output_path) == num_input_drawings
+    with fitz.open(result.output_path) as doc:
+        assert len(doc) == 5
+        assert doc[3].get_images()  # Stamped
+
+    assert result.blurred_output_path is not None
+    with fitz.open(result.blurred_output_path) as doc:
+        assert len(doc) == 1
+        drawings = doc[0].get_drawings()
+        assert len(drawings) == num_input_drawings + 1
+        assert drawings[-1]["rect"] == fitz.Rect(REDACT_RECT)
+        assert not doc[0].get_images()  # The cover is drawn on the unstamped input
+
+
+def test_signed_output_is_not_covered_with_prefetched_bytes(job):
+    with open(job["pdf_path"], "rb") as file:
+        job["pdf_bytes"] = file.read()
+    num_input_drawings = _num_drawings(job["pdf_path"])
+    result = process_document(write_outputs=False, **job)
+
+    assert set(result.outputs) == {result.output_path, result.blurred_output_path}
+    with fitz.open(stream=result.outputs[result.output_path], filetype="pdf") as doc:
+        assert len(doc[0].get_drawings()) == num_input_drawings
+    with fitz.open(stream=result.outputs[result.blurred_output_path], filetype="pdf") as doc:
+        assert len(doc[0].get_drawings()) == num_input_drawings + 1
+    assert not os.path.exists(result.output_path)
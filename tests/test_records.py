@@ -0,0 +1,45 @@
+import openpyxl
+import pytest
+
+from doc_auto.utils_records import RecordSinks
+from doc_auto.utils_records import _parse_row
+from doc_auto.utils_records import find_records
+from doc_auto.utils_records import make_result_record
+from doc_auto.utils_records import read_records
+
+INFO_1ST_PAGE = ["TU SA", "ul. Postępu 5", "12345678901234567890123456", "100", "ACME sp. z o.o.",
+                 "Polisa nr 123456789", "KRAKOWSKA 45"]
+
+RECORDS = [
+    make_result_record("in/c1_acme/a.pdf", company="acme", info_1st_page=INFO_1ST_PAGE, info_nr_plate=["WA 12345"],
+                       output_path="res_outputs/a.pdf", ocr_attempts=2, timings={"ocr": 1.25, "stamp": 0.01}),
+    make_result_record("in/c1_acme/b.pdf", company="acme", error="ValueError: OCR failed"),
+]
+
+
+def read_xlsx_records(path: str) -> list:
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    rows = workbook["records"].iter_rows(values_only=True)
+    header = next(rows)
+    records = [_parse_row(dict(zip(header, row))) for row in rows]
+    workbook.close()
+    return records
+
+
+@pytest.mark.parametrize("record_format", ["csv", "jsonl", "sqlite", "xlsx"])
+def test_records_read_back_identical_from_every_sink(record_format, tmp_path):
+    base_path = str(tmp_path / "records")
+    with RecordSinks(base_path, formats=(record_format,)) as sinks:
+        for record in RECORDS:
+            sinks.write(record)
+
+    path = f"{base_path}.{record_format}"
+    if record_format == "sqlite":
+        records = find_records(path, policy_number="123456789") + find_records(path, nr_plate="wa-12345")
+        assert records == [RECORDS[0], RECORDS[0]]
+        assert type(records[0].ok) is bool
+    elif record_format == "xlsx":
+        assert read_xlsx_records(path) == RECORDS
+    else:
+        assert list(read_records(path)) == RECORDS
+
@@ -0,0 +1,40 @@
+import fitz  # PyMuPDF
+import pytest
+from PIL import Image
+
+from doc_auto.utils_stamp import get_stamp_asset
+from doc_auto.utils_stamp import insert_stamp_images
+
+
+@pytest.fixture
+def stamp_path(tmp_path):
+    path = tmp_path / "4_acme_NoBG.png"
+    Image.new("RGBA", (40, 20), (200, 0, 0, 128)).save(path)
+    return str(path)
+
+
+def test_stamp_is_embedded_once_and_its_xref_reused_across_pages(stamp_path, tmp_path):
+    doc = fitz.open()
+    for _ in range(3):
+        doc.new_page()
+    stamp_xref = insert_stamp_images(doc, image_path=stamp_path, page_numbers=[1, 3],
+                                     positions=[[(50, 50), (50, 700)], [(300, 700)]])
+
+    assert stamp_xref > 0
+    assert [{image[0] for image in doc[page_number].get_images()} for page_number in range(3)] == [
+        {stamp_xref}, set(), {stamp_xref}
+    ]
+    assert len(doc[0].get_image_rects(stamp_xref)) == 2
+
+    output_path = tmp_path / "signed.pdf"
+    doc.save(output_path, garbage=1)
+    doc.close()
+    with fitz.open(output_path) as saved:
+        image_xrefs = {image[0] for page in saved for image in page.get_images()}
+        assert len(image_xrefs) == 1  # One copy of the stamp in the output
+
+
+def test_stamp_asset_is_read_once(stamp_path):
+    asset = get_stamp_asset(stamp_path)
+    assert (asset.width, asset.height) == (40, 20)
+    assert get_stamp_asset(stamp_path) is asset